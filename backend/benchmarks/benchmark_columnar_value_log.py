@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the disk usage and query time of the ColumnarValueLog compared to the state_values_log table of the
+DALStateManager, for one year of values logged every minute.
+
+Run with ``PYTHONPATH=src python benchmarks/benchmark_columnar_value_log.py``.
+"""
+import json
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from homecon.core.event import EventManager
+from homecon.core.states.dal_state_manager import DALStateManager
+from homecon.core.states.value_log import ColumnarValueLog
+
+
+NUMBER_OF_VALUES = 365 * 24 * 60
+
+
+def main():
+    timestamps = np.arange(NUMBER_OF_VALUES) * 60.
+    values = np.round(20 + 5 * np.sin(timestamps / 86400 * 2 * np.pi), 2)
+
+    folder = tempfile.mkdtemp()
+    try:
+        state_manager = DALStateManager(folder, 'sqlite://benchmark.db', EventManager())
+        state = state_manager.add('mystate', log_key='key')
+        # noinspection PyProtectedMember
+        state_manager._db._adapter.cursor.executemany(
+            'INSERT INTO state_values_log (state_key, timestamp, value) VALUES (?, ?, ?);',
+            (('key', float(t), json.dumps(float(v))) for t, v in zip(timestamps, values))
+        )
+        state_manager._db.commit()
+        dal_size = os.path.getsize(os.path.join(folder, 'benchmark.db'))
+
+        value_log = ColumnarValueLog(os.path.join(folder, 'columnar'))
+        for t, v in zip(timestamps, values):
+            value_log.append('key', float(t), float(v))
+        columnar_size = value_log.size('key')
+
+        print(f'{"":>12} {"disk [MB]":>10} {"query [ms]":>11} {"memory [MB]":>12}')
+        for name, size, query in [
+            ('dal', dal_size, lambda: state_manager.get_state_values_log(state, 0.)),
+            ('columnar', columnar_size, lambda: value_log.get('key', 0.)),
+            ('columnar np', columnar_size, lambda: value_log.get_arrays('key', 0.)),
+        ]:
+            tracemalloc.start()
+            start = time.time()
+            result = query()
+            duration = time.time() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del result
+            print(f'{name:>12} {size / 1e6:>10.2f} {duration * 1e3:>11.1f} {peak / 1e6:>12.2f}')
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main()
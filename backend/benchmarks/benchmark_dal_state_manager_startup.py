@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the startup time and memory usage of a DALStateManager with 50k states.
+
+Run with ``PYTHONPATH=src python benchmarks/benchmark_dal_state_manager_startup.py``. The last line shows the extra
+time and memory when all configs are decoded, which is avoided at startup by decoding configs lazily.
+"""
+import json
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from homecon.core.event import EventManager
+from homecon.core.states.dal_state_manager import DALStateManager
+
+
+NUMBER_OF_STATES = 50000
+
+
+def create_database(folder: str):
+    state_manager = DALStateManager(folder, 'sqlite://benchmark.db', EventManager())
+    config = json.dumps({'knx_ga_read': '1/1/31', 'knx_ga_write': '1/1/31', 'knx_dpt': '9',
+                         'computed': {'value': 'Value("/a")', 'trigger': '/a'}})
+    # noinspection PyProtectedMember
+    state_manager._db._adapter.cursor.executemany(
+        'INSERT INTO states (key, name, parent, type, quantity, unit, label, description, log_key, config, value) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);',
+        ((f'key{i}', f'state{i}', None if i < 100 else f'key{i % 100}', 'float', 'Temperature', '°C',
+          f'State {i}', '', '', config, '20.5') for i in range(NUMBER_OF_STATES))
+    )
+    state_manager._db.commit()
+
+
+def main():
+    folder = tempfile.mkdtemp()
+    try:
+        create_database(folder)
+
+        tracemalloc.start()
+        start = time.time()
+        state_manager = DALStateManager(folder, 'sqlite://benchmark.db', EventManager())
+        load_time = time.time() - start
+        load_memory, _ = tracemalloc.get_traced_memory()
+
+        start = time.time()
+        for state in state_manager.all():
+            _ = state.config
+        decode_time = time.time() - start
+        decode_memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print(f'{"":>20} {"time [s]":>10} {"memory [MB]":>12}')
+        print(f'{"load":>20} {load_time:>10.2f} {load_memory / 1e6:>12.1f}')
+        print(f'{"+ decode configs":>20} {load_time + decode_time:>10.2f} {decode_memory / 1e6:>12.1f}')
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main()
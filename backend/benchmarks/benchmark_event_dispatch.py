@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the number of events per second dispatched by HomeCon to 12 plugins when passing every event to every
+plugin compared to passing events only to the plugins subscribed to their type.
+
+Run with ``PYTHONPATH=src python benchmarks/benchmark_event_dispatch.py``.
+"""
+import time
+
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from homecon.homecon import HomeCon, IExecutor, SyncExecutor
+from homecon.core.event import Event, IEventManager
+from homecon.core.plugins.plugin import BasePlugin, MemoryPluginManager
+
+
+NUMBER_OF_EVENTS = 50000
+
+# the event types the plugins listen to, similar to the plugins shipped with HomeCon
+PLUGIN_LISTENERS = {
+    'states': ['state', 'state_value', 'state_list', 'state_add', 'state_update', 'state_delete'],
+    'pages': ['pages_timestamp', 'pages_pages', 'pages_page'],
+    'websocket': ['reply', 'state_value_changed', 'state_updated', 'state_added', 'state_deleted'],
+    'knx': ['state_value_changed', 'state_added', 'state_updated'],
+    'computed': ['state_value_changed', 'state_added', 'state_updated'],
+    'alarms': ['alarms_list', 'alarms_add', 'alarms_update', 'alarms_delete'],
+    'shading': ['state_value_changed'],
+    'heat_demand': ['state_value_changed'],
+    'building': ['building_config'],
+    'flukso': [],
+    'timeseries': ['state_timeseries'],
+    'openweathermap': [],
+}
+
+EVENT_TYPES = ['state_value_changed'] * 8 + ['state_updated', 'reply']
+
+
+class NullEventManager(IEventManager):
+    def fire(self, type_: str, data: dict, source: str = None, target: str = None, reply_to: str = None,
+             priority: int = None):
+        pass
+
+
+class PoolExecutor(IExecutor):
+    def __init__(self):
+        self._pool = ThreadPoolExecutor(max_workers=4)
+        self._futures = []
+
+    def submit(self, fn, *args, **kwargs):
+        self._futures.append(self._pool.submit(fn, *args, **kwargs))
+
+    def join(self):
+        wait(self._futures)
+        self._futures = []
+
+
+class BroadcastHomeCon(HomeCon):
+    """
+    Passes every event to every plugin.
+    """
+    def handle_event(self, event: Event):
+        target_plugin = event.target.split('/')[0] if event.target is not None else None
+        for plugin in self._plugin_manager.values():
+            if target_plugin is None or target_plugin == plugin.name:
+                self._executor.submit(plugin.handle_event, event)
+
+
+def create_plugins(event_manager: IEventManager):
+    plugins = {}
+    for name, event_types in PLUGIN_LISTENERS.items():
+        methods = {f'listen_{event_type}': lambda self, event: None for event_type in event_types}
+        plugin_class = type(f'{name.title()}Plugin', (BasePlugin,), methods)
+        plugins[name] = plugin_class(name, event_manager, None, None)
+    return plugins
+
+
+def main():
+    event_manager = NullEventManager()
+    plugin_manager = MemoryPluginManager(create_plugins(event_manager))
+    events = [Event(event_manager, EVENT_TYPES[i % len(EVENT_TYPES)], {'state': None, 'changes': []},
+                    target='websocket/client' if EVENT_TYPES[i % len(EVENT_TYPES)] == 'reply' else None)
+              for i in range(NUMBER_OF_EVENTS)]
+
+    print(f'{"executor":>10} {"dispatch":>10} {"events [1/s]":>13} {"submissions":>12}')
+    for executor_name, executor_class in [('sync', SyncExecutor), ('pool', PoolExecutor)]:
+        for dispatch, homecon_class in [('broadcast', BroadcastHomeCon), ('indexed', HomeCon)]:
+            executor = executor_class()
+            submissions = [0]
+            submit = executor.submit
+
+            def counting_submit(fn, *args, **kwargs):
+                submissions[0] += 1
+                submit(fn, *args, **kwargs)
+            executor.submit = counting_submit
+
+            homecon = homecon_class(event_manager, plugin_manager, executor)
+            start = time.time()
+            for event in events:
+                homecon.handle_event(event)
+            if isinstance(executor, PoolExecutor):
+                executor.join()
+            duration = time.time() - start
+            print(f'{executor_name:>10} {dispatch:>10} {NUMBER_OF_EVENTS / duration:>13.0f} {submissions[0]:>12}')
+
+
+if __name__ == '__main__':
+    main()
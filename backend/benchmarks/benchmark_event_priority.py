@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the latency of state value changes while HomeCon handles a burst of user interface requests, with all
+events in a single queue compared to separate priority queues.
+
+Run with ``PYTHONPATH=src python benchmarks/benchmark_event_priority.py``.
+"""
+import time
+
+from threading import Thread
+
+from homecon.homecon import HomeCon, SyncExecutor
+from homecon.core.event import EventManager, EventPriority
+from homecon.core.plugins.plugin import BasePlugin, MemoryPluginManager
+
+
+NUMBER_OF_REQUESTS = 5000
+NUMBER_OF_VALUE_CHANGES = 100
+REQUEST_DURATION = 0.0002
+
+
+class UiPlugin(BasePlugin):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count = 0
+
+    def listen_state_list(self, event):
+        # serializing and sending a state list
+        time.sleep(REQUEST_DURATION)
+        self.count += 1
+
+
+class ControlPlugin(BasePlugin):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = []
+
+    def listen_state_value_changed(self, event):
+        self.latencies.append(time.monotonic() - event.timestamp)
+
+
+def fire(event_manager: EventManager, single_queue: bool):
+    priority = EventPriority.STATE if single_queue else None
+    for i in range(NUMBER_OF_REQUESTS):
+        event_manager.fire('state_list', {}, reply_to='websocket/client', priority=priority)
+        if i % (NUMBER_OF_REQUESTS // NUMBER_OF_VALUE_CHANGES) == 0:
+            event_manager.fire('state_value_changed', {'state': None}, priority=priority)
+            time.sleep(0.001)
+
+
+def main():
+    print(f'{"queues":>10} {"mean latency [ms]":>18} {"max latency [ms]":>17} {"total [s]":>10}')
+    for name, single_queue in [('single', True), ('priority', False)]:
+        event_manager = EventManager(starvation_time=1.0)
+        ui = UiPlugin('ui', event_manager, None, None)
+        control = ControlPlugin('control', event_manager, None, None)
+        homecon = HomeCon(event_manager, MemoryPluginManager({'ui': ui, 'control': control}), SyncExecutor())
+        producer = Thread(target=fire, args=(event_manager, single_queue))
+
+        start = time.time()
+        producer.start()
+        while ui.count < NUMBER_OF_REQUESTS or len(control.latencies) < NUMBER_OF_VALUE_CHANGES:
+            homecon.get_and_handle_events()
+        duration = time.time() - start
+        producer.join()
+
+        mean_latency = sum(control.latencies) / len(control.latencies)
+        print(f'{name:>10} {mean_latency * 1000:>18.1f} {max(control.latencies) * 1000:>17.1f} {duration:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the number of events per second handled by HomeCon when events are fired in bursts by another thread,
+taking a single event per wake-up from a polled queue compared to taking batches of events.
+
+Run with ``PYTHONPATH=src python benchmarks/benchmark_event_queue.py``.
+"""
+import time
+
+from queue import Queue, Empty
+from threading import Thread
+
+from homecon.homecon import HomeCon, SyncExecutor
+from homecon.core.event import Event, EventManager, IEventManager, NoEventError
+from homecon.core.plugins.plugin import BasePlugin, MemoryPluginManager
+
+
+NUMBER_OF_BURSTS = 200
+BURST_SIZE = 500
+
+
+class PolledEventManager(IEventManager):
+    """
+    The queue polled with a timeout, as used before.
+    """
+    def __init__(self, get_timeout=0.2):
+        self._queue = Queue()
+        self._get_timeout = get_timeout
+
+    def fire(self, type_: str, data: dict, source: str = None, target: str = None, reply_to: str = None) -> Event:
+        event = Event(self, type_, data, source=source, target=target, reply_to=reply_to)
+        self._queue.put(event)
+        return event
+
+    def get(self) -> Event:
+        try:
+            return self._queue.get(timeout=self._get_timeout)
+        except Empty:
+            raise NoEventError
+
+
+class CountingPlugin(BasePlugin):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count = 0
+
+    def listen_state_value_changed(self, event):
+        self.count += 1
+
+
+def fire_bursts(event_manager: IEventManager):
+    for _ in range(NUMBER_OF_BURSTS):
+        for i in range(BURST_SIZE):
+            event_manager.fire('state_value_changed', {'state': None, 'old': i, 'new': i + 1})
+        time.sleep(0.001)
+
+
+def main():
+    print(f'{"event manager":>14} {"events [1/s]":>13}')
+    for name, event_manager, batched in [('polled', PolledEventManager(), False),
+                                         ('batched', EventManager(), True)]:
+        plugins = {f'plugin{i}': CountingPlugin(f'plugin{i}', event_manager, None, None) for i in range(4)}
+        homecon = HomeCon(event_manager, MemoryPluginManager(plugins), SyncExecutor())
+        producer = Thread(target=fire_bursts, args=(event_manager,))
+
+        start = time.time()
+        producer.start()
+        while plugins['plugin0'].count < NUMBER_OF_BURSTS * BURST_SIZE:
+            if batched:
+                homecon.get_and_handle_events()
+            else:
+                homecon.get_and_handle_event()
+        duration = time.time() - start
+        producer.join()
+        print(f'{name:>14} {NUMBER_OF_BURSTS * BURST_SIZE / duration:>13.0f}')
+
+
+if __name__ == '__main__':
+    main()
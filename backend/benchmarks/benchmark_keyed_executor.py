@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the time HomeCon takes to handle value changes with plugins doing blocking work, and the number of value
+changes a plugin handled out of order, for the SyncExecutor, a ThreadPoolExecutor and the KeyedExecutor.
+
+Run with ``PYTHONPATH=src python benchmarks/benchmark_keyed_executor.py``.
+"""
+import random
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from homecon.homecon import HomeCon, KeyedExecutor, SyncExecutor
+from homecon.core.event import Event, IEventManager
+from homecon.core.plugins.plugin import BasePlugin, MemoryPluginManager
+
+
+NUMBER_OF_PLUGINS = 2
+NUMBER_OF_STATES = 2
+NUMBER_OF_EVENTS = 2000
+HANDLING_DURATION = 0.0005
+
+
+class NullEventManager(IEventManager):
+    def fire(self, type_: str, data: dict, source: str = None, target: str = None, reply_to: str = None,
+             priority: int = None):
+        pass
+
+
+class State:
+    def __init__(self, key):
+        self.key = key
+
+
+class OrderCheckingPlugin(BasePlugin):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = Lock()
+        self.last_values = {}
+        self.count = 0
+        self.out_of_order = 0
+
+    def listen_state_value_changed(self, event):
+        # writing to a bus or a database, which takes a varying time
+        time.sleep(random.uniform(0, 2 * HANDLING_DURATION))
+        with self._lock:
+            key = event.data['state'].key
+            if event.data['new'] < self.last_values.get(key, -1):
+                self.out_of_order += 1
+            self.last_values[key] = event.data['new']
+            self.count += 1
+
+
+def main():
+    event_manager = NullEventManager()
+    states = [State(str(i)) for i in range(NUMBER_OF_STATES)]
+    events = [Event(event_manager, 'state_value_changed', {'state': states[i % NUMBER_OF_STATES], 'new': i})
+              for i in range(NUMBER_OF_EVENTS)]
+
+    print(f'{"executor":>10} {"duration [s]":>13} {"out of order":>13}')
+    for name, executor_class in [('sync', SyncExecutor), ('pool', lambda: ThreadPoolExecutor(max_workers=8)),
+                                 ('keyed', lambda: KeyedExecutor(max_workers=8))]:
+        plugins = {f'plugin{i}': OrderCheckingPlugin(f'plugin{i}', event_manager, None, None)
+                   for i in range(NUMBER_OF_PLUGINS)}
+        executor = executor_class()
+        homecon = HomeCon(event_manager, MemoryPluginManager(plugins), executor)
+
+        start = time.time()
+        for event in events:
+            homecon.handle_event(event)
+        executor.shutdown(wait=True)
+        duration = time.time() - start
+
+        out_of_order = sum(plugin.out_of_order for plugin in plugins.values())
+        assert all(plugin.count == NUMBER_OF_EVENTS for plugin in plugins.values())
+        print(f'{name:>10} {duration:>13.2f} {out_of_order:>13}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the value update throughput and the startup time of a SnapshotStateManager compared to a
+DALStateManager, for 10k states and 100k value updates.
+
+Run with ``PYTHONPATH=src python benchmarks/benchmark_snapshot_state_manager.py``.
+"""
+import shutil
+import tempfile
+import time
+
+from homecon.core.event import IEventManager
+from homecon.core.states.dal_state_manager import DALStateManager
+from homecon.core.states.snapshot_state_manager import SnapshotStateManager
+
+
+NUMBER_OF_STATES = 10000
+NUMBER_OF_UPDATES = 100000
+
+
+class NullEventManager(IEventManager):
+    def fire(self, type_: str, data: dict, source: str = None, target: str = None, reply_to: str = None,
+             priority: int = None):
+        pass
+
+
+def run(name, create_state_manager):
+    state_manager = create_state_manager()
+    states = [state_manager.add(f'state{i}', type='float', value=0.) for i in range(NUMBER_OF_STATES)]
+
+    start = time.time()
+    for i in range(NUMBER_OF_UPDATES):
+        states[i % NUMBER_OF_STATES].set_value(float(i))
+    update_rate = NUMBER_OF_UPDATES / (time.time() - start)
+    state_manager.stop()
+
+    start = time.time()
+    create_state_manager()
+    startup_time = time.time() - start
+    print(f'{name:>10} {update_rate:>16.0f} {startup_time:>12.2f}')
+
+
+def main():
+    print(f'{"":>10} {"updates [1/s]":>16} {"startup [s]":>12}')
+    folder = tempfile.mkdtemp()
+    try:
+        run('snapshot', lambda: SnapshotStateManager(folder, NullEventManager()))
+    finally:
+        shutil.rmtree(folder)
+
+    folder = tempfile.mkdtemp()
+    try:
+        run('dal', lambda: DALStateManager(folder, 'sqlite://benchmark.db', NullEventManager()))
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Benchmark of building the serialized state list after a single value change and after a rename, compared to
+serializing all states again.
+
+Run with ``PYTHONPATH=src python benchmarks/benchmark_state_list.py``.
+"""
+import json
+import time
+
+from homecon.core.event import IEventManager
+from homecon.core.states.memory_state_manager import MemoryStateManager
+
+
+NUMBER_OF_GROUPS = 100
+STATES_PER_GROUP = 50
+REPEATS = 20
+
+
+class NullEventManager(IEventManager):
+    def fire(self, type_: str, data: dict, source: str = None, target: str = None, reply_to: str = None,
+             priority: int = None):
+        pass
+
+
+def main():
+    state_manager = MemoryStateManager(NullEventManager())
+    groups = []
+    for i in range(NUMBER_OF_GROUPS):
+        group = state_manager.add(f'group{i}')
+        groups.append(group)
+        for j in range(STATES_PER_GROUP):
+            state_manager.add(f'state{j}', parent=group, type='float', value=0.)
+    states = state_manager.all()
+    size = len(json.dumps(state_manager.state_list())) / 1e6
+
+    # noinspection PyProtectedMember
+    def rebuild():
+        return [state._serialize() for state in state_manager.all()]
+
+    def value_change(i):
+        states[-1].set_value(float(i))
+
+    def rename(i):
+        groups[0].update(name=f'renamed{i}')
+
+    print(f'{len(states)} states, {size:.2f} MB')
+    print(f'{"change":>14} {"rebuild [ms]":>13} {"cached [ms]":>12}')
+    for name, change in [('value', value_change), ('rename', rename)]:
+        rebuild_time = 0.
+        cached_time = 0.
+        for i in range(REPEATS):
+            change(i)
+            start = time.time()
+            rebuild()
+            rebuild_time += time.time() - start
+
+            change(i + REPEATS)
+            start = time.time()
+            state_manager.state_list()
+            cached_time += time.time() - start
+        print(f'{name:>14} {rebuild_time / REPEATS * 1000:>13.2f} {cached_time / REPEATS * 1000:>12.2f}')
+
+
+if __name__ == '__main__':
+    main()
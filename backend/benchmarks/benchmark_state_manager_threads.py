@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Multithreaded stress benchmark of the MemoryStateManager.
+
+Writer threads set values, add, rename, move and delete states while reader threads get, find and list states. The
+throughput of both is reported, after which the index, the find cache and the values log are checked for corruption.
+
+Run with ``PYTHONPATH=src python benchmarks/benchmark_state_manager_threads.py``.
+"""
+import random
+import re
+import time
+
+from collections import Counter
+from threading import Thread, Event
+
+from homecon.core.event import IEventManager
+from homecon.core.states.memory_state_manager import MemoryStateManager
+
+
+NUMBER_OF_GROUPS = 20
+STATES_PER_GROUP = 50
+DURATION = 5.
+FIND_EXPRESSIONS = ['/group1/.*', '/group2/state1.*', '.*/state2', '/moved/.*']
+
+
+class NullEventManager(IEventManager):
+    def fire(self, type_: str, data: dict, source: str = None, target: str = None, reply_to: str = None,
+             priority: int = None):
+        pass
+
+
+def create_state_manager() -> MemoryStateManager:
+    state_manager = MemoryStateManager(NullEventManager())
+    state_manager.add('moved')
+    for i in range(NUMBER_OF_GROUPS):
+        group = state_manager.add(f'group{i}')
+        for j in range(STATES_PER_GROUP):
+            state_manager.add(f'state{j}', parent=group, log_key=f'group{i}/state{j}', value=0)
+    return state_manager
+
+
+def value_writer(state_manager: MemoryStateManager, states, stop: Event, counts: Counter, written: Counter):
+    while not stop.is_set():
+        state = random.choice(states)
+        with state_manager.state_lock(state):
+            state.set_value(state.value + 1)
+            written[state.key] += 1
+        counts['value writes'] += 1
+
+
+def structure_writer(state_manager: MemoryStateManager, stop: Event, counts: Counter, thread: int):
+    moved = state_manager.get('/moved')
+    i = 0
+    while not stop.is_set():
+        group = state_manager.get(f'/group{random.randrange(NUMBER_OF_GROUPS)}')
+        state = state_manager.add(f'temporary{thread}_{i}', parent=group)
+        state.update(name=f'renamed{thread}_{i}')
+        state.update(parent=moved)
+        state_manager.delete(state)
+        i += 1
+        counts['structure writes'] += 4
+
+
+def reader(state_manager: MemoryStateManager, stop: Event, counts: Counter):
+    while not stop.is_set():
+        i = random.randrange(NUMBER_OF_GROUPS)
+        j = random.randrange(STATES_PER_GROUP)
+        assert state_manager.get(f'/group{i}/state{j}') is not None
+        state_manager.find(random.choice(FIND_EXPRESSIONS))
+        state_manager.children(state_manager.get(f'/group{i}'))
+        state_manager.all()
+        counts['reads'] += 4
+
+
+def check(state_manager: MemoryStateManager, written: Counter):
+    states = state_manager.all()
+    assert len(states) == 1 + NUMBER_OF_GROUPS * (1 + STATES_PER_GROUP), 'unexpected number of states'
+    for state in states:
+        assert state_manager.get(state.path) is state, f'path index of {state} is corrupt'
+        assert state in state_manager.children(state.parent), f'children index of {state} is corrupt'
+    for expr in FIND_EXPRESSIONS:
+        expected = [state for state in states if re.match(expr, state.path)]
+        assert state_manager.find(expr) == expected, f'find cache of {expr} is corrupt'
+    for state in states:
+        if state.log_key != state.NO_LOGGING_KEY:
+            assert state.value == written[state.key], f'value of {state} is corrupt'
+            assert len(state.get_values_log(0.)) == written[state.key], f'values log of {state} is corrupt'
+
+
+def main():
+    print(f'{"writers":>8} {"readers":>8} {"value writes [1/s]":>19} {"structure writes [1/s]":>23} '
+          f'{"reads [1/s]":>12}')
+    for number_of_writers, number_of_readers in [(1, 1), (4, 4), (8, 8)]:
+        state_manager = create_state_manager()
+        states = [state for state in state_manager.all() if state.log_key != state.NO_LOGGING_KEY]
+        stop = Event()
+        counts = Counter()
+        written = Counter()
+        threads = [Thread(target=value_writer, args=(state_manager, states, stop, counts, written))
+                   for _ in range(number_of_writers)]
+        threads += [Thread(target=structure_writer, args=(state_manager, stop, counts, i))
+                    for i in range(number_of_writers)]
+        threads += [Thread(target=reader, args=(state_manager, stop, counts)) for _ in range(number_of_readers)]
+
+        for thread in threads:
+            thread.start()
+        time.sleep(DURATION)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        check(state_manager, written)
+        print(f'{number_of_writers:>8} {number_of_readers:>8} {counts["value writes"] / DURATION:>19.0f} '
+              f'{counts["structure writes"] / DURATION:>23.0f} {counts["reads"] / DURATION:>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
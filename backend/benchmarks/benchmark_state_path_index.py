@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Benchmark of state lookups by path as a function of the number of states.
+
+Run with ``PYTHONPATH=src python benchmarks/benchmark_state_path_index.py``, the lookup time should remain flat as the
+number of states grows.
+"""
+import timeit
+
+from homecon.core.event import EventManager
+from homecon.core.states.memory_state_manager import MemoryStateManager
+
+
+def create_state_manager(number_of_states: int, branching: int = 10) -> MemoryStateManager:
+    state_manager = MemoryStateManager(EventManager())
+    parents = [None]
+    i = 0
+    while i < number_of_states:
+        new_parents = []
+        for parent in parents:
+            for j in range(branching):
+                new_parents.append(state_manager.add(f'state{j}', parent=parent))
+                i += 1
+                if i >= number_of_states:
+                    break
+            if i >= number_of_states:
+                break
+        parents = new_parents
+    return state_manager
+
+
+def main():
+    print(f'{"states":>8} {"get(path) [us]":>16} {"exists [us]":>12}')
+    for number_of_states in [1000, 5000, 15000, 50000]:
+        state_manager = create_state_manager(number_of_states)
+        last = state_manager.all()[-1]
+        path = last.path
+        number = 10000
+        get_time = timeit.timeit(lambda: state_manager.get(path=path), number=number) / number
+        exists_time = timeit.timeit(lambda: state_manager.exists(last.name, parent=last.parent), number=number) / number
+        print(f'{number_of_states:>8} {get_time * 1e6:>16.2f} {exists_time * 1e6:>12.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Benchmark of DALStateManager.get_state_values_log as a function of the size of the state_values_log table.
+
+Run with ``PYTHONPATH=src python benchmarks/benchmark_state_values_log_query.py``. With the (state_key, timestamp)
+index the query time remains nearly constant as the log grows, without it the query time grows linearly.
+"""
+import os
+import shutil
+import tempfile
+import timeit
+
+from homecon.core.event import EventManager
+from homecon.core.states.dal_state_manager import DALStateManager
+
+
+NUMBER_OF_KEYS = 100
+
+
+def fill_log(state_manager: DALStateManager, number_of_rows: int):
+    # noinspection PyProtectedMember
+    cursor = state_manager._db._adapter.cursor
+    rows_per_key = number_of_rows // NUMBER_OF_KEYS
+    cursor.executemany(
+        'INSERT INTO state_values_log (state_key, timestamp, value) VALUES (?, ?, ?);',
+        ((f'key{i % NUMBER_OF_KEYS}', float(i // NUMBER_OF_KEYS * 60), '20.0') for i in range(rows_per_key * NUMBER_OF_KEYS))
+    )
+    state_manager._db.commit()
+    return rows_per_key
+
+
+def time_query(state_manager: DALStateManager, state, rows_per_key: int, number: int = 20) -> float:
+    # query one hour in the middle of the log of a single key
+    since = rows_per_key // 2 * 60 + 30.
+    return timeit.timeit(lambda: state_manager.get_state_values_log(state, since, until=since + 3600), number=number) / number
+
+
+def main():
+    print(f'{"rows":>10} {"indexed [ms]":>14} {"not indexed [ms]":>18}')
+    for number_of_rows in [10000, 100000, 1000000]:
+        folder = tempfile.mkdtemp()
+        try:
+            state_manager = DALStateManager(folder, 'sqlite://benchmark.db', EventManager())
+            state = state_manager.add('mystate', log_key='key0')
+            rows_per_key = fill_log(state_manager, number_of_rows)
+
+            indexed = time_query(state_manager, state, rows_per_key)
+            state_manager._db.executesql('DROP INDEX state_values_log_state_key_timestamp;')
+            not_indexed = time_query(state_manager, state, rows_per_key, number=3)
+            print(f'{number_of_rows:>10} {indexed * 1e3:>14.3f} {not_indexed * 1e3:>18.3f}')
+        finally:
+            shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main()
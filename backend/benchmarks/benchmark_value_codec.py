@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the values log size and query time of a DALStateManager for float states stored with the numeric value
+codec compared to json.
+
+Run with ``PYTHONPATH=src python benchmarks/benchmark_value_codec.py``.
+"""
+import os
+import shutil
+import tempfile
+import time
+
+from homecon.core.event import EventManager
+from homecon.core.states.dal_state_manager import DALStateManager
+
+
+NUMBER_OF_VALUES = 200000
+
+
+def main():
+    print(f'{"type":>8} {"write [s]":>10} {"query [s]":>10} {"disk [MB]":>10}')
+    for type_ in ['float', 'json']:
+        folder = tempfile.mkdtemp()
+        try:
+            state_manager = DALStateManager(folder, 'sqlite://benchmark.db', EventManager(), write_behind=True,
+                                            flush_size=10000)
+            state = state_manager.add('mystate', type=type_, log_key='key')
+            start = time.time()
+            for i in range(NUMBER_OF_VALUES):
+                state.set_value(round(20 + i % 1000 / 100, 2))
+            state_manager.flush()
+            write_time = time.time() - start
+
+            start = time.time()
+            state_manager.get_state_values_log(state, 0.)
+            query_time = time.time() - start
+
+            state_manager._db.executesql('VACUUM;')
+            size = os.path.getsize(os.path.join(folder, 'benchmark.db'))
+            print(f'{type_:>8} {write_time:>10.2f} {query_time:>10.2f} {size / 1e6:>10.2f}')
+        finally:
+            shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main()
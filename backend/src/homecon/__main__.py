@@ -93,9 +93,18 @@ def configure_(create_folders=True,
         configure.install_knxd()
 
 
-def get_homecon():
+def get_homecon(asyncio_core=False, process_plugins=(), coalesce=False):
     """
     create the HomeCon object
+
+    Parameters
+    ----------
+    asyncio_core : bool
+        run the core loop and the websocket server in a single asyncio loop
+    process_plugins : list of str
+        the names of the plugins to run in worker processes
+    coalesce : bool
+        merge pending state value changed events of the same state, plugins and clients only get the latest value
     """
 
     db_dir = os.path.abspath(os.path.join(base_path, 'db'))
@@ -112,11 +121,12 @@ def get_homecon():
     with open(token_path, 'r') as f:
         token = f.read().splitlines()[0]
 
-    from homecon.core.event import EventManager
+    from homecon.core.event import AsyncEventManager, EventManager
     from homecon.core.states.dal_state_manager import DALStateManager
     from homecon.core.pages.pages import JSONPagesManager
     from homecon.core.plugins.plugin import MemoryPluginManager
-    from homecon.homecon import HomeCon, SyncExecutor
+    from homecon.core.plugins.process import ProcessPlugin
+    from homecon.homecon import AsyncHomeCon, HomeCon, SyncExecutor
 
     from homecon.plugins.websocket.websocket import Websocket
     from homecon.plugins.states.states import States
@@ -129,24 +139,36 @@ def get_homecon():
     from homecon.plugins.weather.weather import Weather
     from homecon.plugins.openweathermap.openweathermap import OpenWeatherMap
 
-    event_manager = EventManager()
-    state_manager = DALStateManager(folder=db_dir, uri='sqlite://homecon.db', event_manager=event_manager)
+    if asyncio_core:
+        event_manager = AsyncEventManager()
+    else:
+        event_manager = EventManager(coalesce=coalesce)
+    state_manager = DALStateManager(folder=db_dir, uri='sqlite://homecon.db', event_manager=event_manager,
+                                    compaction_interval=3600)
     pages_manager = JSONPagesManager(os.path.join(db_dir, 'pages.json'))
+
+    def create_plugin(name, plugin_class, **kwargs):
+        if name in process_plugins:
+            return ProcessPlugin(name, plugin_class, event_manager, state_manager, **kwargs)
+        return plugin_class(name, event_manager, state_manager, pages_manager, **kwargs)
+
     plugin_manager = MemoryPluginManager({
         'websocket': Websocket('websocket', event_manager, state_manager, pages_manager, token=token),
         'states': States('states', event_manager, state_manager, pages_manager),
         'pages': Pages('pages', event_manager, state_manager, pages_manager),
-        'alarms': Alarms('alarms', event_manager, state_manager, pages_manager),
-        'heat_demand': HeatDemand('heat_demand', event_manager, state_manager, pages_manager),
-        'shading': Shading('shading', event_manager, state_manager, pages_manager),
-        'knx': Knx('knx', event_manager, state_manager, pages_manager),
-        'computed': Computed('computed', event_manager, state_manager, pages_manager),
+        'alarms': create_plugin('alarms', Alarms),
+        'heat_demand': create_plugin('heat_demand', HeatDemand),
+        'shading': create_plugin('shading', Shading),
+        'knx': create_plugin('knx', Knx),
+        'computed': create_plugin('computed', Computed),
         'weather': Weather(event_manager, state_manager),
         'openweathermap': OpenWeatherMap(state_manager),
     })
-    executor = SyncExecutor()
-
-    homecon = HomeCon(event_manager, plugin_manager, executor)
+    if asyncio_core:
+        homecon = AsyncHomeCon(event_manager, plugin_manager, state_manager=state_manager)
+    else:
+        executor = SyncExecutor()
+        homecon = HomeCon(event_manager, plugin_manager, executor, state_manager=state_manager)
     return homecon
 
 
@@ -155,7 +177,7 @@ def main(printlog=False, loglevel='INFO', dbloglevel='INFO',
          configure=False, create_folders=True,
          set_static_ip=True, ip=None,
          run_init_script=True, init_script_name='homecon',
-         install_ipopt=True, install_knxd=True):
+         install_ipopt=True, install_knxd=True, asyncio_core=False, process_plugins=(), coalesce=False):
     """
     Main entry point.
     """
@@ -196,7 +218,7 @@ def main(printlog=False, loglevel='INFO', dbloglevel='INFO',
             from homecon.demo.__main__ import get_homecon as get_homecon_demo
             homecon = get_homecon_demo()
         else:
-            homecon = get_homecon()
+            homecon = get_homecon(asyncio_core=asyncio_core, process_plugins=process_plugins, coalesce=coalesce)
 
         # noinspection PyUnusedLocal
         def stop(signum, frame):
@@ -231,6 +253,10 @@ if __name__ == '__main__':
     parser.add_argument('--initscriptname', dest='init_script_name', type=str, default='homecon')
     parser.add_argument('--noipopt', dest='install_ipopt', action='store_false')
     parser.add_argument('--noknxd', dest='install_knxd', action='store_false')
+    parser.add_argument('--coalesce', action='store_true')
+    parser.add_argument('--asyncio', dest='asyncio_core', action='store_true')
+    parser.add_argument('--process', dest='process_plugins', action='append', default=[],
+                        choices=['alarms', 'heat_demand', 'shading', 'computed'])
 
     kwargs = vars(parser.parse_args())
 
@@ -1,12 +1,62 @@
 #!/usr/bin/env python3
+import asyncio
 import logging
+import time
 
-from queue import Queue, Empty
+from collections import deque
+from threading import Condition, Lock
+from typing import Deque, Dict, List, Optional
 
 
 logger = logging.getLogger(__name__)
 
 
+class EventPriority:
+    """
+    Event priority classes, events of a lower class are handled first.
+    """
+    CONTROL = 0
+    STATE = 1
+    UI = 2
+    ADMIN = 3
+
+    NAMES = ('control', 'state', 'ui', 'admin')
+
+    # the priority of event types, events of other types fired with a reply_to are user interface requests
+    # events are only taken in the order they were fired within a class, so all requests to change states and all
+    # changes of states share a class, a value set after adding a state must not be handled before the state is added
+    DEFAULTS = {
+        'state_value_changed': CONTROL,
+        'state_values_changed': CONTROL,
+        'state_value': CONTROL,
+        'state_add': CONTROL,
+        'state_update': CONTROL,
+        'state_delete': CONTROL,
+        'state_added': CONTROL,
+        'state_updated': CONTROL,
+        'state_deleted': CONTROL,
+        'states_reloaded': CONTROL,
+        'reply': UI,
+        'websocket_send': UI,
+        'websocket_reply': UI,
+        'states_export': ADMIN,
+        'states_import': ADMIN,
+        'pages_export': ADMIN,
+        'pages_import': ADMIN,
+        'add_schedule': ADMIN,
+        'delete_schedule': ADMIN,
+    }
+
+    @staticmethod
+    def default(type_: str, reply_to: Optional[str] = None) -> int:
+        priority = EventPriority.DEFAULTS.get(type_)
+        if priority is not None:
+            return priority
+        if reply_to is not None:
+            return EventPriority.UI
+        return EventPriority.STATE
+
+
 class Event:
     """
 
@@ -22,14 +72,19 @@ class Event:
         The target of the event.
     reply_to :
         ???
+    priority :
+        The ``EventPriority`` class of the event, derived from the type when ``None``.
     """
-    def __init__(self, event_manager: 'IEventManager', type_: str, data: dict, source: str = None, target: str = None, reply_to: str = None):
+    def __init__(self, event_manager: 'IEventManager', type_: str, data: dict, source: str = None, target: str = None,
+                 reply_to: str = None, priority: Optional[int] = None):
         self.event_manager = event_manager
         self.type = type_
         self.data = data
         self.source = source
         self.target = target
         self.reply_to = reply_to
+        self.priority = EventPriority.default(type_, reply_to) if priority is None else priority
+        self.timestamp = time.monotonic()
 
     def reply(self, data, **kwargs):
         full_data = {'event': self.type, 'data': data}
@@ -53,29 +108,316 @@ class NoEventError(Exception):
 
 
 class IEventManager:
-    def fire(self, type_: str, data: dict, source: str = None, target: str = None, reply_to: str = None) -> Event:
+    def fire(self, type_: str, data: dict, source: str = None, target: str = None, reply_to: str = None,
+             priority: Optional[int] = None) -> Event:
         raise NotImplementedError
 
     def get(self) -> Event:
         raise NotImplementedError
 
+    def get_batch(self, max_size: Optional[int] = None) -> List[Event]:
+        """
+        Returns the pending events, waiting until there is at least one.
+
+        Parameters
+        ----------
+        max_size :
+            The maximum number of events returned.
+
+        Raises
+        ------
+        NoEventError
+            When no event was fired before the manager stopped waiting.
+        """
+        return [self.get()]
+
+    def statistics(self) -> Dict[str, dict]:
+        """
+        Returns statistics of the queued events.
+        """
+        return {}
+
+    def interrupt(self):
+        """
+        Makes the current or next wait for events raise a ``NoEventError``, used to stop a thread handling events.
+        """
+        pass
+
 
 class EventManager(IEventManager):
-    def __init__(self, get_timeout=0.2):
-        self._queue = Queue()
+    """
+    Event manager keeping events in a queue in memory.
+
+    A thread waiting for events is woken up as soon as an event is fired or ``interrupt`` is called, and takes all
+    pending events up to a maximum batch size at once.
+
+    Events are kept in a queue per ``EventPriority`` class and batches are filled with the events of the highest
+    priority first. To prevent starvation, the events of a lower priority which have been waiting for more than
+    ``starvation_time`` seconds are taken before those of higher priorities. Events are taken in the order they were
+    fired within a priority class, but not across classes.
+
+    In coalescing mode a ``state_value_changed`` event fired while an event of the same state is still pending is
+    merged into the pending event, which keeps its position in the queue and its ``old`` value and gets the ``new``
+    value, version and source of the fired event. Other events are never merged and keep their order.
+
+    Parameters
+    ----------
+    get_timeout :
+        The maximum time in seconds to wait for an event, wait until an event is fired or ``interrupt`` is called
+        when ``None``.
+    max_batch_size :
+        The default maximum number of events returned by ``get_batch``.
+    coalesce :
+        Merge pending ``state_value_changed`` events of the same state.
+    starvation_time :
+        The time in seconds after which a pending event is taken regardless of its priority.
+
+    Attributes
+    ----------
+    fired_count :
+        The number of fired events.
+    coalesced_count :
+        The number of fired events which were merged into a pending event.
+    """
+    COALESCED_EVENT_TYPE = 'state_value_changed'
+
+    def __init__(self, get_timeout: Optional[float] = None, max_batch_size: int = 100, coalesce: bool = False,
+                 starvation_time: float = 1.0):
+        self._queues: List[Deque[Event]] = [deque() for _ in EventPriority.NAMES]
+        self._size = 0
+        self._starvation_time = starvation_time
+        self._taken_counts = [0 for _ in EventPriority.NAMES]
+        self._total_waits = [0. for _ in EventPriority.NAMES]
+        self._max_waits = [0. for _ in EventPriority.NAMES]
+        self._condition = Condition()
         self._get_timeout = get_timeout
+        self._max_batch_size = max_batch_size
+        self._interrupted = False
+        self._coalesce = coalesce
+        self._pending: Dict[str, Event] = {}
+        self.fired_count = 0
+        self.coalesced_count = 0
 
-    def fire(self, type_: str, data: dict, source: str = None, target: str = None, reply_to: str = None) -> Event:
-        event = Event(self, type_, data, source=source, target=target, reply_to=reply_to)
-        logger.debug(f'putting {event} on queue')
-        self._queue.put(event)
+    def fire(self, type_: str, data: dict, source: str = None, target: str = None, reply_to: str = None,
+             priority: Optional[int] = None) -> Event:
+        event = Event(self, type_, data, source=source, target=target, reply_to=reply_to, priority=priority)
+        # formatted lazily, as formatting every fired event is expensive
+        logger.debug('putting %s on queue', event)
+        with self._condition:
+            self.fired_count += 1
+            if self._coalesce and type_ == self.COALESCED_EVENT_TYPE:
+                pending_event = self._merge(event)
+                if pending_event is not None:
+                    return pending_event
+            self._queues[event.priority].append(event)
+            self._size += 1
+            self._condition.notify()
         return event
 
+    def _merge(self, event: Event) -> Optional[Event]:
+        """
+        Merges a state value changed event into the pending event of the same state, must be called with the condition
+        held.
+
+        Returns
+        -------
+        pending_event :
+            The pending event or ``None`` when the event was not merged and must be put on the queue.
+        """
+        state = event.data.get('state')
+        if state is None or event.target is not None or event.reply_to is not None:
+            return None
+
+        pending_event = self._pending.get(state.key)
+        if pending_event is None:
+            self._pending[state.key] = event
+            return None
+
+        pending_event.data = {**event.data, 'old': pending_event.data.get('old')}
+        pending_event.source = event.source
+        self.coalesced_count += 1
+        return pending_event
+
     def get(self) -> Event:
-        try:
-            event = self._queue.get(timeout=self._get_timeout)
-            logger.debug(f'got {event} from queue')
-        except Empty:
+        return self.get_batch(max_size=1)[0]
+
+    def get_batch(self, max_size: Optional[int] = None) -> List[Event]:
+        max_size = max_size or self._max_batch_size
+        with self._condition:
+            self._wait()
+            events = self._take(min(max_size, self._size))
+            if len(self._pending) > 0:
+                # taken events can no longer be merged
+                for event in events:
+                    state = event.data.get('state') if event.type == self.COALESCED_EVENT_TYPE else None
+                    if state is not None and self._pending.get(state.key) is event:
+                        del self._pending[state.key]
+            if self._size > 0:
+                # leave the remaining events to other waiting threads
+                self._condition.notify()
+        logger.debug('got %s events from queue', len(events))
+        return events
+
+    def _take(self, count: int) -> List[Event]:
+        """
+        Takes events from the queues in order of priority, must be called with the condition held.
+        """
+        now = time.monotonic()
+        starved_since = now - self._starvation_time
+        events = []
+        while len(events) < count:
+            # the queue with the oldest starved event, or the queue of the highest priority
+            queue = None
+            for candidate in self._queues:
+                if len(candidate) > 0 and candidate[0].timestamp < starved_since and \
+                        (queue is None or candidate[0].timestamp < queue[0].timestamp):
+                    queue = candidate
+            if queue is None:
+                queue = next(candidate for candidate in self._queues if len(candidate) > 0)
+
+            event = queue.popleft()
+            wait = now - event.timestamp
+            self._taken_counts[event.priority] += 1
+            self._total_waits[event.priority] += wait
+            self._max_waits[event.priority] = max(self._max_waits[event.priority], wait)
+            events.append(event)
+        self._size -= count
+        return events
+
+    def statistics(self) -> Dict[str, dict]:
+        """
+        Returns the number of pending events and the number of taken events and their mean and maximum time in the
+        queue in seconds per priority class.
+        """
+        with self._condition:
+            return {
+                name: {
+                    'depth': len(self._queues[priority]),
+                    'taken': self._taken_counts[priority],
+                    'mean_wait': self._total_waits[priority] / max(self._taken_counts[priority], 1),
+                    'max_wait': self._max_waits[priority],
+                } for priority, name in enumerate(EventPriority.NAMES)
+            }
+
+    def interrupt(self):
+        with self._condition:
+            self._interrupted = True
+            self._condition.notify()
+
+    def _wait(self):
+        """
+        Waits until there is an event in the queue, must be called with the condition held.
+        """
+        deadline = None if self._get_timeout is None else time.monotonic() + self._get_timeout
+        while self._size == 0:
+            if self._interrupted:
+                self._interrupted = False
+                raise NoEventError
+            timeout = None if deadline is None else deadline - time.monotonic()
+            if timeout is not None and timeout <= 0:
+                raise NoEventError
+            self._condition.wait(timeout)
+
+
+class AsyncEventManager(IEventManager):
+    """
+    Event manager keeping events in an ``asyncio.Queue``, used by the ``AsyncHomeCon``.
+
+    Events can be fired from any thread, events fired from other threads than the thread of the asyncio loop are put
+    on the queue through the loop. Events fired before the queue is started are put on the queue when it is started.
+
+    Parameters
+    ----------
+    max_batch_size :
+        The default maximum number of events returned by ``get_batch_async``.
+
+    Attributes
+    ----------
+    fired_count :
+        The number of fired events.
+    """
+    _INTERRUPT = object()
+
+    def __init__(self, max_batch_size: int = 100):
+        self._max_batch_size = max_batch_size
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._lock = Lock()
+        self._early_events: List[Event] = []
+        self._interrupted = False
+        self.fired_count = 0
+
+    def start(self):
+        """
+        Creates the queue in the running asyncio loop, must be called from the loop.
+        """
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            self._queue = asyncio.Queue()
+            for event in self._early_events:
+                self._queue.put_nowait(event)
+            self._early_events = []
+
+    def fire(self, type_: str, data: dict, source: str = None, target: str = None, reply_to: str = None,
+             priority: Optional[int] = None) -> Event:
+        event = Event(self, type_, data, source=source, target=target, reply_to=reply_to, priority=priority)
+        logger.debug('putting %s on queue', event)
+        with self._lock:
+            self.fired_count += 1
+            if self._loop is None:
+                self._early_events.append(event)
+                return event
+        self._put(event)
+        return event
+
+    async def get_batch_async(self, max_size: Optional[int] = None) -> List[Event]:
+        """
+        Returns the pending events, waiting until there is at least one.
+
+        Parameters
+        ----------
+        max_size :
+            The maximum number of events returned.
+
+        Raises
+        ------
+        NoEventError
+            When ``interrupt`` was called while waiting.
+        """
+        max_size = max_size or self._max_batch_size
+        if self._interrupted:
+            self._interrupted = False
+            raise NoEventError
+        event = await self._queue.get()
+        if event is self._INTERRUPT:
             raise NoEventError
+        events = [event]
+        while len(events) < max_size and not self._queue.empty():
+            event = self._queue.get_nowait()
+            if event is self._INTERRUPT:
+                # raised by the next call, after the taken events are handled
+                self._interrupted = True
+                break
+            events.append(event)
+        return events
+
+    def interrupt(self):
+        if self._loop is not None:
+            # through the loop, which also wakes it up when called from a signal handler in the thread of the loop
+            try:
+                self._loop.call_soon_threadsafe(self._queue.put_nowait, self._INTERRUPT)
+            except RuntimeError:
+                pass
+
+    def _put(self, event: Event):
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self._loop:
+            self._queue.put_nowait(event)
         else:
-            return event
+            try:
+                self._loop.call_soon_threadsafe(self._queue.put_nowait, event)
+            except RuntimeError:
+                logger.warning('dropped %s as the asyncio loop is closed', event)
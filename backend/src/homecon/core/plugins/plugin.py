@@ -1,9 +1,10 @@
 #!/usr/bin/env python3
+import asyncio
 import logging
 
-from typing import Iterable, Tuple, Dict
+from typing import Callable, Iterable, Iterator, List, Optional, Set, Tuple, Dict
 from homecon.core.event import Event, IEventManager
-from homecon.core.states.state import IStateManager
+from homecon.core.states.state import IStateManager, StateEventsTypes
 from homecon.core.pages.pages import IPagesManager
 
 logger = logging.getLogger(__name__)
@@ -17,6 +18,13 @@ class IPlugin:
     def start(self):
         pass
 
+    async def start_async(self):
+        """
+        Starts the plugin from the asyncio loop of the ``AsyncHomeCon``, plugins which can run in the loop instead of
+        in their own threads should override this method.
+        """
+        self.start()
+
     def stop(self):
         pass
 
@@ -26,11 +34,56 @@ class IPlugin:
     def handle_event(self, event: Event):
         pass
 
+    def handles_async(self, event_type: str) -> bool:
+        """
+        Returns ``True`` when the ``AsyncHomeCon`` must handle events of a type with ``handle_event_async`` in its
+        asyncio loop, otherwise ``handle_event`` is run in a worker thread.
+        """
+        return False
+
+    async def handle_event_async(self, event: Event):
+        raise NotImplementedError
+
+    def handle_events(self, events: List[Event]):
+        """
+        Handles a batch of events in order, plugins which can handle events more efficiently at once should override
+        this method.
+        """
+        for event in events:
+            self.handle_event(event)
+
+    @property
+    def subscribed_event_types(self) -> Optional[Set[str]]:
+        """
+        The event types handled by the plugin, only events of these types are passed to ``handle_event``.
+
+        All events are passed when ``None``.
+        """
+        return None
+
+    @property
+    def ready(self) -> bool:
+        """
+        ``False`` while ``subscribed_event_types`` can still change, the subscriptions of a plugin are only cached once
+        it is ready.
+        """
+        return True
+
     def __repr__(self):
         return f'<{self.__class__.__name__} {self.name}>'
 
 
 class BasePlugin(IPlugin):
+    """
+    Plugin passing events to its ``listen_<event type>`` methods.
+
+    Listeners can be coroutine functions, which the ``AsyncHomeCon`` runs in its asyncio loop. Other listeners are run
+    in a worker thread, unless ``BLOCKING_LISTENERS`` is ``False``. When HomeCon is not asyncio based, coroutine
+    listeners are run in a new asyncio loop.
+    """
+    # plugins of which the listeners never block can set this to False to have them called in the asyncio loop
+    BLOCKING_LISTENERS = True
+
     def __init__(self, name: str, event_manager: IEventManager, state_manager: IStateManager, pages_manager: IPagesManager):
         self._name = name
         self._event_manager = event_manager
@@ -43,9 +96,17 @@ class BasePlugin(IPlugin):
     def name(self):
         return self._name
 
-    def fire(self, type_: str, data: dict, target: str = None, reply_to: str = None):
+    def fire(self, type_: str, data: dict, target: str = None, reply_to: str = None, priority: Optional[int] = None):
         source = self.name
-        self._event_manager.fire(type_, data, target=target, reply_to=reply_to, source=source)
+        self._event_manager.fire(type_, data, target=target, reply_to=reply_to, source=source, priority=priority)
+
+    @property
+    def subscribed_event_types(self) -> Set[str]:
+        event_types = set(self.listeners.keys())
+        # the default batch listener is only useful when there is a listener for single value changes
+        if StateEventsTypes.STATE_VALUE_CHANGED not in event_types and self._has_default_values_listener():
+            event_types.discard(StateEventsTypes.STATE_VALUES_CHANGED)
+        return event_types
 
     def handle_event(self, event: Event):
         """
@@ -64,10 +125,64 @@ class BasePlugin(IPlugin):
         if listener is not None:
             # noinspection PyBroadException
             try:
-                listener(event)
+                self._call(listener, event)
+            except Exception:
+                logger.exception(f'error in event listener {event.type}')
+
+    def handles_async(self, event_type: str) -> bool:
+        if not self.BLOCKING_LISTENERS:
+            return True
+        listener = self.listeners.get(event_type)
+        if event_type == StateEventsTypes.STATE_VALUES_CHANGED and self._has_default_values_listener():
+            listener = self.listeners.get(StateEventsTypes.STATE_VALUE_CHANGED)
+        return asyncio.iscoroutinefunction(listener)
+
+    async def handle_event_async(self, event: Event):
+        listener = self.listeners.get(event.type, None)
+        if listener is not None:
+            # noinspection PyBroadException
+            try:
+                if event.type == StateEventsTypes.STATE_VALUES_CHANGED and self._has_default_values_listener():
+                    # the changes are passed to the listener of single changes here, as it may be a coroutine
+                    for change_event in self._change_events(event):
+                        await self._call_async(self.listeners[StateEventsTypes.STATE_VALUE_CHANGED], change_event)
+                else:
+                    await self._call_async(listener, event)
             except Exception:
                 logger.exception(f'error in event listener {event.type}')
 
+    def listen_state_values_changed(self, event: Event):
+        """
+        Passes every change in a batch of state value changes to the ``listen_state_value_changed`` listener.
+
+        Plugins which can handle a batch of changes at once should override this method.
+        """
+        listener = self.listeners.get(StateEventsTypes.STATE_VALUE_CHANGED)
+        if listener is not None:
+            for change_event in self._change_events(event):
+                self._call(listener, change_event)
+
+    def _has_default_values_listener(self) -> bool:
+        return type(self).listen_state_values_changed is BasePlugin.listen_state_values_changed
+
+    @staticmethod
+    def _change_events(event: Event) -> Iterator[Event]:
+        for change in event.data['changes']:
+            yield Event(event.event_manager, StateEventsTypes.STATE_VALUE_CHANGED, change,
+                        source=event.source, target=event.target, reply_to=event.reply_to)
+
+    @staticmethod
+    def _call(listener: Callable, event: Event):
+        result = listener(event)
+        if asyncio.iscoroutine(result):
+            asyncio.run(result)
+
+    @staticmethod
+    async def _call_async(listener: Callable, event: Event):
+        result = listener(event)
+        if asyncio.iscoroutine(result):
+            await result
+
     def _get_listeners(self):
         """
         Gets listener methods and adds them to the listeners dictionary.
@@ -84,6 +199,9 @@ class IPluginManager:
     def start(self):
         raise NotImplementedError
 
+    async def start_async(self):
+        self.start()
+
     def stop(self):
         raise NotImplementedError
 
@@ -115,6 +233,10 @@ class MemoryPluginManager(IPluginManager):
         for plugin in self._plugins.values():
             plugin.start()
 
+    async def start_async(self):
+        for plugin in self._plugins.values():
+            await plugin.start_async()
+
     def stop(self):
         for plugin in self._plugins.values():
             plugin.stop()
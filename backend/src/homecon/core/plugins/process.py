@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+import asyncio
+import logging
+import multiprocessing
+
+from threading import Event as ThreadingEvent, Lock, Thread
+from typing import Any, Callable, List, Optional, Set, Type
+
+from homecon.core.event import Event, IEventManager
+from homecon.core.plugins.plugin import IPlugin
+from homecon.core.states.state import IStateManager, State, StateEventsTypes
+from homecon.core.states.replica_state_manager import ReplicaStateManager
+
+
+logger = logging.getLogger(__name__)
+
+
+# the events of which the states are synced to the replicated states of a plugin in a worker process
+STATE_EVENT_TYPES = {
+    StateEventsTypes.STATE_VALUE_CHANGED,
+    StateEventsTypes.STATE_VALUES_CHANGED,
+    StateEventsTypes.STATE_ADDED,
+    StateEventsTypes.STATE_UPDATED,
+    StateEventsTypes.STATE_DELETED,
+    StateEventsTypes.STATES_RELOADED,
+}
+
+_READY = 'ready'
+_FIRE = 'fire'
+
+
+class _EncodedState:
+    """
+    A serialized state in the data of an event sent to another process, as states are bound to their state manager.
+    """
+    __slots__ = ('serialized',)
+
+    def __init__(self, serialized: dict):
+        self.serialized = serialized
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, State):
+        return _EncodedState(value.serialize())
+    if isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_encode(item) for item in value]
+    return value
+
+
+def _decode(value: Any, decode_state: Callable[[dict], Optional[State]]) -> Any:
+    if isinstance(value, _EncodedState):
+        return decode_state(value.serialized)
+    if isinstance(value, dict):
+        return {key: _decode(item, decode_state) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode(item, decode_state) for item in value]
+    return value
+
+
+class _ConnectionEventManager(IEventManager):
+    """
+    Event manager of a plugin in a worker process, which sends the fired events to the main process.
+    """
+    def __init__(self, connection, lock: Lock):
+        self._connection = connection
+        self._lock = lock
+
+    def fire(self, type_: str, data: dict, source: str = None, target: str = None, reply_to: str = None,
+             priority: Optional[int] = None) -> Event:
+        event = Event(self, type_, data, source=source, target=target, reply_to=reply_to, priority=priority)
+        with self._lock:
+            self._connection.send((_FIRE, (type_, _encode(data), source, target, reply_to, priority)))
+        return event
+
+
+def _run_plugin(connection, name: str, plugin_class: Type[IPlugin], states_list: List[dict], args: tuple,
+                kwargs: dict):
+    """
+    Creates and runs a plugin in a worker process until ``None`` is received.
+    """
+    lock = Lock()
+    event_manager = _ConnectionEventManager(connection, lock)
+    state_manager = ReplicaStateManager(event_manager, states_list)
+    plugin = plugin_class(name, event_manager, state_manager, None, *args, **kwargs)
+    subscribed_event_types = plugin.subscribed_event_types
+    with lock:
+        connection.send((_READY, subscribed_event_types))
+    plugin.start()
+
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+
+        events = []
+        for type_, data, source, target, reply_to, priority in message:
+            if type_ == StateEventsTypes.STATES_RELOADED:
+                state_manager.reload(data.pop('states'))
+            deleted = type_ == StateEventsTypes.STATE_DELETED
+            data = _decode(data, lambda state_dict: state_manager.sync(state_dict, deleted=deleted))
+            if subscribed_event_types is None or type_ in subscribed_event_types:
+                events.append(Event(event_manager, type_, data, source=source, target=target, reply_to=reply_to,
+                                    priority=priority))
+        if len(events) > 0:
+            plugin.handle_events(events)
+
+    plugin.stop()
+    plugin.join()
+
+
+class ProcessPlugin(IPlugin):
+    """
+    Plugin hosting a plugin in a worker process, so CPU heavy plugins do not hold the interpreter lock of the process
+    handling the I/O. Process plugins can be added to a ``MemoryPluginManager`` like any other plugin.
+
+    Events are sent to the worker process over a pipe, where the states in the event data are replaced by the states of
+    a ``ReplicaStateManager``. State events are always sent, to keep the replicated states up to date. Events fired in
+    the worker process are fired by the event manager of the main process, values set in the worker process are sent
+    as ``state_value`` events and are set by the ``States`` plugin.
+
+    The worker process is spawned, so the plugin class must be importable and the extra arguments picklable. The
+    hosted plugin gets no pages manager.
+
+    Parameters
+    ----------
+    name :
+        The name of the plugin.
+    plugin_class :
+        The class of the hosted plugin, instantiated in the worker process with the name, an event manager, a state
+        manager, ``None`` as pages manager and the extra arguments.
+    event_manager :
+        The event manager of the main process.
+    state_manager :
+        The state manager of the main process.
+    start_timeout :
+        The maximum time in seconds to wait for the worker process to create the plugin.
+    """
+    def __init__(self, name: str, plugin_class: Type[IPlugin], event_manager: IEventManager,
+                 state_manager: IStateManager, *args, start_timeout: float = 60., **kwargs):
+        self._name = name
+        self._plugin_class = plugin_class
+        self._event_manager = event_manager
+        self._state_manager = state_manager
+        self._args = args
+        self._kwargs = kwargs
+        self._start_timeout = start_timeout
+
+        self._connection = None
+        self._send_lock = Lock()
+        self._process: Optional[multiprocessing.Process] = None
+        self._receiver: Optional[Thread] = None
+        self._ready = ThreadingEvent()
+        self._subscribed_event_types: Optional[Set[str]] = set()
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def subscribed_event_types(self) -> Optional[Set[str]]:
+        if self._subscribed_event_types is None:
+            return None
+        return self._subscribed_event_types | STATE_EVENT_TYPES
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def start(self):
+        self._spawn()
+        self._wait_ready()
+
+    async def start_async(self):
+        self._spawn()
+        # waiting for the worker process must not block the asyncio loop
+        await asyncio.get_running_loop().run_in_executor(None, self._wait_ready)
+
+    def _spawn(self):
+        context = multiprocessing.get_context('spawn')
+        self._connection, connection = context.Pipe()
+        self._process = context.Process(
+            target=_run_plugin, name=f'plugin-{self._name}', daemon=True,
+            args=(connection, self._name, self._plugin_class, self._state_manager.state_list(), self._args,
+                  self._kwargs))
+        self._process.start()
+        connection.close()
+
+        self._receiver = Thread(target=self._receive, name=f'plugin-{self._name}-receiver', daemon=True)
+        self._receiver.start()
+
+    def _wait_ready(self):
+        if not self._ready.wait(self._start_timeout):
+            logger.error(f'plugin {self._name} did not start in {self._start_timeout} s')
+
+    def stop(self):
+        if self._connection is not None:
+            self._send(None)
+
+    def join(self):
+        if self._process is not None:
+            self._process.join(self._start_timeout)
+            if self._process.is_alive():
+                logger.warning(f'plugin {self._name} did not stop, terminating its process')
+                self._process.terminate()
+        if self._receiver is not None:
+            self._receiver.join()
+
+    def handle_event(self, event: Event):
+        self.handle_events([event])
+
+    def handle_events(self, events: List[Event]):
+        """
+        Sends a batch of events to the worker process as a single message.
+        """
+        message = []
+        for event in events:
+            data = event.data
+            if event.type == StateEventsTypes.STATES_RELOADED:
+                data = {**data, 'states': self._state_manager.state_list()}
+            message.append((event.type, _encode(data), event.source, event.target, event.reply_to, event.priority))
+        self._send(message)
+
+    def _send(self, message: Optional[list]):
+        # noinspection PyBroadException
+        try:
+            with self._send_lock:
+                self._connection.send(message)
+        except Exception:
+            logger.exception(f'could not send events to plugin {self._name}')
+
+    def _receive(self):
+        """
+        Fires the events fired in the worker process until the worker process exits.
+        """
+        while True:
+            try:
+                kind, content = self._connection.recv()
+            except (EOFError, OSError):
+                break
+
+            if kind == _READY:
+                self._subscribed_event_types = content
+                self._ready.set()
+            else:
+                type_, data, source, target, reply_to, priority = content
+                data = _decode(data, lambda state_dict: self._state_manager.get(key=state_dict['key']))
+                self._event_manager.fire(type_, data, source=source, target=target, reply_to=reply_to,
+                                         priority=priority)
+
+        if not self._ready.is_set():
+            logger.error(f'plugin {self._name} exited before it started')
+            self._ready.set()
@@ -2,19 +2,131 @@ import json
 import logging
 import time
 
-from typing import Any, Optional, List
+from dataclasses import dataclass, replace
+from threading import Lock, RLock, Timer
+from typing import Any, Optional, List, Dict, Tuple
 from pydal import DAL, Field
 
 from homecon.core.states.state import State, TimestampedValue, CouldNotStoreStateException
 from homecon.core.states.memory_state_manager import MemoryStateManager
+from homecon.core.states.value_codec import ValueCodec, NumberValueCodec, DEFAULT_VALUE_CODECS
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class WriteBehindMetrics:
+    queue_depth: int = 0
+    flushes: int = 0
+    flushed_states: int = 0
+    flushed_logs: int = 0
+    failed_flushes: int = 0
+    last_flush_duration: float = 0.
+    max_flush_duration: float = 0.
+    total_flush_duration: float = 0.
+
+
+@dataclass
+class RetentionTier:
+    """
+    A tier of the values log retention policy of a state.
+
+    Parameters
+    ----------
+    resolution :
+        The length in seconds of the buckets over which values are averaged, ``0`` for the raw values.
+    duration :
+        The time in seconds values are kept, ``None`` to keep them forever.
+    """
+    resolution: int = 0
+    duration: Optional[float] = None
+
+    @staticmethod
+    def from_config(config: dict) -> List['RetentionTier']:
+        """
+        Parses the ``retention`` option of a state config, a list of dicts with ``resolution`` and ``duration`` keys.
+
+        Returns
+        -------
+        tiers : list
+            The tiers sorted by resolution, an empty list when the state has no valid retention policy. Raw values are
+            kept forever when the policy has no tier with resolution ``0``.
+        """
+        try:
+            tiers = [RetentionTier(**tier) for tier in config.get('retention', [])]
+        except TypeError:
+            logger.exception(f'invalid retention config {config.get("retention")}')
+            return []
+        if len(tiers) > 0 and all(tier.resolution > 0 for tier in tiers):
+            tiers.append(RetentionTier(0, None))
+        return sorted(tiers, key=lambda tier: tier.resolution)
+
+
 class DALStateManager(MemoryStateManager):
-    def __init__(self, folder: str, uri: str, *args, **kwargs):
+    """
+    State manager which persists states and their values log in a database through pydal.
+
+    Parameters
+    ----------
+    folder :
+        The folder of the database.
+    uri :
+        The pydal database uri.
+    write_behind :
+        When ``True``, state updates and log rows are queued and written in a single transaction once ``flush_size``
+        updates are queued or ``flush_interval`` seconds after the first queued update, whichever comes first.
+    flush_size :
+        The maximum number of queued states and log rows before a flush.
+    flush_interval :
+        The maximum time in seconds a queued update is kept in memory.
+    value_codecs :
+        Value codecs per state type, added to ``DEFAULT_VALUE_CODECS``. Values of states of which the type has no codec
+        are stored as json.
+    compaction_interval :
+        The interval in seconds at which ``compact`` is run in a background thread, ``None`` to disable it.
+
+    Notes
+    -----
+    The values log of a state can be limited with a ``retention`` config option, a list of tiers with a
+    ``resolution`` in seconds and a ``duration`` in seconds, or ``None`` to keep them forever. Raw values have
+    resolution ``0``. For example, raw values for 14 days, 5 minute averages for a year and hourly averages forever::
+
+        {'retention': [{'resolution': 0, 'duration': 1209600}, {'resolution': 300, 'duration': 31536000},
+                       {'resolution': 3600, 'duration': None}]}
+
+    ``compact`` averages numeric values over the buckets of each tier into the ``state_values_aggregate`` table and
+    removes values older than the duration of their tier. Only states of which the type has a ``NumberValueCodec`` are
+    compacted, raw values without a number are always kept. ``get_state_values_log`` returns values from the finest tier
+    which still covers the start of the requested range.
+
+    Attributes
+    ----------
+    load_time :
+        The time in seconds it took to load the states from the database at startup.
+    """
+    LOAD_CHUNK_SIZE = 1000
+    MIGRATE_CHUNK_SIZE = 1000
+
+    def __init__(self, folder: str, uri: str, *args, write_behind: bool = False, flush_size: int = 500,
+                 flush_interval: float = 1.0, value_codecs: Optional[Dict[str, ValueCodec]] = None,
+                 compaction_interval: Optional[float] = None, **kwargs):
         super().__init__(*args, **kwargs)
 
+        self._write_behind = write_behind
+        self._flush_size = flush_size
+        self._flush_interval = flush_interval
+        self._value_codecs = {**DEFAULT_VALUE_CODECS, **(value_codecs or {})}
+        self._default_value_codec = ValueCodec()
+        self._dirty_states: Dict[str, State] = {}
+        self._pending_logs: List[Tuple[str, float, Optional[float], Optional[str]]] = []
+        self._queue_lock = Lock()
+        self._db_lock = RLock()
+        self._flush_timer: Optional[Timer] = None
+        self._metrics = WriteBehindMetrics()
+        self._compaction_interval = compaction_interval
+        self._compaction_timer: Optional[Timer] = None
+        self._retention_tiers: Dict[str, List[RetentionTier]] = {}
+
         self._db = DAL(uri, folder=folder)
         self._table = self._db.define_table(
             'states',
@@ -28,7 +140,8 @@ class DALStateManager(MemoryStateManager):
             Field('description', type='string'),
             Field('log_key', type='string', default=State.NO_LOGGING_KEY),
             Field('config', type='string', default='{}'),
-            Field('value', type='string')
+            Field('value', type='string'),
+            Field('value_number', type='double'),
         )
 
         self._table_values_log = self._db.define_table(
@@ -36,90 +149,539 @@ class DALStateManager(MemoryStateManager):
             Field('state_key', type='string'),
             Field('timestamp', type='float'),
             Field('value', type='string'),
+            Field('value_number', type='double'),
+        )
+        self._create_index(self._table_values_log, 'state_values_log_state_key_timestamp',
+                           self._table_values_log.state_key, self._table_values_log.timestamp)
+
+        self._table_values_aggregate = self._db.define_table(
+            'state_values_aggregate',
+            Field('state_key', type='string'),
+            Field('resolution', type='integer'),
+            Field('timestamp', type='float'),
+            Field('value', type='double'),
+            Field('count', type='integer'),
         )
+        self._create_index(self._table_values_aggregate, 'state_values_aggregate_state_key_resolution_timestamp',
+                           self._table_values_aggregate.state_key, self._table_values_aggregate.resolution,
+                           self._table_values_aggregate.timestamp)
+
+        self.load_time = self._load_states()
 
-        # load states into memory
-        for row in self._db().select(self._db.states.ALL):
-            state = self._row_to_state(row)
-            self._states[state.key] = state
+        if self._compaction_interval is not None:
+            self._schedule_compaction()
+
+    @property
+    def metrics(self) -> WriteBehindMetrics:
+        return replace(self._metrics, queue_depth=len(self._dirty_states) + len(self._pending_logs))
+
+    def stop(self):
+        if self._compaction_timer is not None:
+            self._compaction_timer.cancel()
+            self._compaction_timer = None
+        if self._write_behind:
+            self.flush()
+        super().stop()
 
     def delete(self, state: State):
-        try:
-            self._db(self._table.key == state.key).delete()
-            self._db.commit()
-        except Exception:
-            logger.exception('could not delete state')
-        else:
-            super().delete(state)
+        with self._queue_lock:
+            self._dirty_states.pop(state.key, None)
+        self._retention_tiers.pop(state.key, None)
+        with self._db_lock:
+            try:
+                self._db(self._table.key == state.key).delete()
+                self._db.commit()
+            except Exception:
+                logger.exception('could not delete state')
+                return
+        super().delete(state)
 
     def update(self, state: State):
-        try:
-            # noinspection PyProtectedMember
-            self._db._adapter.reconnect()
-            row = self._db(self._table.key == state.key).select().first()
-            row.update_record(name=state.name, parent=None if state.parent is None else state.parent.key, type=state.type, quantity=state.quantity,
-                              unit=state.unit, label=state.label, description=state.description, log_key=state.log_key,
-                              config=json.dumps(state.config), value=json.dumps(state.value))
+        self._update_index(state)
+        self._retention_tiers.pop(state.key, None)
+        if self._write_behind:
+            self._enqueue(state)
+            return
+
+        with self._db_lock:
+            try:
+                # noinspection PyProtectedMember
+                self._db._adapter.reconnect()
+                row = self._db(self._table.key == state.key).select().first()
+                row.update_record(**self._state_fields(state))
+
+                if state.log_key != State.NO_LOGGING_KEY:
+                    self._store_state_log(state)
+
+                self._db.commit()
+                # noinspection PyProtectedMember
+                self._db._adapter.close()
+                logger.debug(f'updated state {state}')
+            except Exception as e:
+                logger.exception('could not store state')
+                raise CouldNotStoreStateException from e
+
+    def _update_values(self, states: List[State]):
+        if self._write_behind:
+            for state in states:
+                self._enqueue(state)
+            return
+
+        timestamp = time.time()
+        with self._db_lock:
+            try:
+                # noinspection PyProtectedMember
+                self._db._adapter.reconnect()
+                for state in states:
+                    value_number, value = self._encode(state)
+                    self._db(self._table.key == state.key).update(value=value, value_number=value_number)
+                self._store_state_logs(states, timestamp)
+                self._db.commit()
+                # noinspection PyProtectedMember
+                self._db._adapter.close()
+                logger.debug(f'updated {len(states)} state values')
+            except Exception as e:
+                logger.exception('could not store state values')
+                self._db.rollback()
+                raise CouldNotStoreStateException from e
+
+    def flush(self):
+        """
+        Writes all queued states and log rows to the database in a single transaction.
+        """
+        with self._queue_lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            dirty_states = list(self._dirty_states.values())
+            pending_logs = self._pending_logs
+            self._dirty_states = {}
+            self._pending_logs = []
+
+        if len(dirty_states) == 0 and len(pending_logs) == 0:
+            return
 
+        start = time.time()
+        with self._db_lock:
+            try:
+                # noinspection PyProtectedMember
+                self._db._adapter.reconnect()
+                for state in dirty_states:
+                    self._db(self._table.key == state.key).update(**self._state_fields(state))
+                if len(pending_logs) > 0:
+                    self._table_values_log.bulk_insert([
+                        {'state_key': log_key, 'timestamp': timestamp, 'value': value, 'value_number': value_number}
+                        for log_key, timestamp, value_number, value in pending_logs
+                    ])
+                self._db.commit()
+                # noinspection PyProtectedMember
+                self._db._adapter.close()
+            except Exception:
+                logger.exception(f'could not flush {len(dirty_states)} states and {len(pending_logs)} log rows')
+                self._db.rollback()
+                self._requeue(dirty_states, pending_logs)
+                return
+
+        duration = time.time() - start
+        self._metrics.flushes += 1
+        self._metrics.flushed_states += len(dirty_states)
+        self._metrics.flushed_logs += len(pending_logs)
+        self._metrics.last_flush_duration = duration
+        self._metrics.max_flush_duration = max(self._metrics.max_flush_duration, duration)
+        self._metrics.total_flush_duration += duration
+        logger.debug(f'flushed {len(dirty_states)} states and {len(pending_logs)} log rows in {duration:.3f} s')
+
+    def _requeue(self, dirty_states: List[State], pending_logs: List[Tuple[str, float, Optional[float], Optional[str]]]):
+        """
+        Puts the states and log rows of a failed flush back in the queue, so they are written by the next flush.
+        """
+        with self._queue_lock:
+            self._metrics.failed_flushes += 1
+            # states queued since the flush are more recent
+            self._dirty_states = {**{state.key: state for state in dirty_states}, **self._dirty_states}
+            self._pending_logs = pending_logs + self._pending_logs
+            if self._flush_timer is None:
+                self._flush_timer = Timer(self._flush_interval, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def _enqueue(self, state: State):
+        with self._queue_lock:
+            self._dirty_states[state.key] = state
             if state.log_key != State.NO_LOGGING_KEY:
-                self._store_state_log(state)
+                if self._value_log is not None:
+                    self._value_log.append(state.log_key, time.time(), state.value)
+                else:
+                    self._pending_logs.append((state.log_key, time.time(), *self._encode(state)))
 
-            self._db.commit()
-            # noinspection PyProtectedMember
-            self._db._adapter.close()
-            logger.debug(f'updated state {state}')
-        except Exception as e:
-            logger.exception('could not store state')
-            raise CouldNotStoreStateException from e
+            flush_now = len(self._dirty_states) + len(self._pending_logs) >= self._flush_size
+            if not flush_now and self._flush_timer is None:
+                self._flush_timer = Timer(self._flush_interval, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+        if flush_now:
+            self.flush()
 
     def get_state_values_log(self, state: State, since: float, until: Optional[float] = None) -> List[TimestampedValue]:
+        if self._value_log is not None:
+            return self._value_log.get(state.log_key, since, until=until)
+        if self._write_behind:
+            self.flush()
+
+        # use the finest tier which covers since or the coarsest tier when none does
+        now = time.time()
+        resolution = 0
+        for tier in self._get_retention_tiers(state):
+            resolution = tier.resolution
+            if tier.duration is None or now - tier.duration <= since:
+                break
+        with self._db_lock:
+            if resolution > 0:
+                return self._get_aggregated_values_log(state, resolution, since, until=until)
+            return self._get_raw_values_log(state, since, until=until)
+
+    def _get_aggregated_values_log(self, state: State, resolution: int, since: float,
+                                   until: Optional[float] = None) -> List[TimestampedValue]:
+        """
+        Returns the averaged values of a tier, followed by the raw values after the last aggregated bucket.
+        """
+        table = self._table_values_aggregate
+        query = (table.state_key == state.log_key) & (table.resolution == resolution) & (table.timestamp >= since)
+        if until is not None:
+            query &= table.timestamp < until
+        rows = self._db(query).select(table.timestamp, table.value, orderby=table.timestamp)
+        timeseries = [TimestampedValue(row['timestamp'], row['value']) for row in rows]
+        if len(timeseries) == 0:
+            return self._get_raw_values_log(state, since, until=until)
+
+        raw_since = timeseries[-1].timestamp + resolution
+        if until is None or raw_since < until:
+            timeseries += [value for value in self._get_raw_values_log(state, raw_since, until=until)
+                           if value.timestamp >= raw_since]
+        return timeseries
+
+    def _get_raw_values_log(self, state: State, since: float, until: Optional[float] = None) -> List[TimestampedValue]:
         table = self._table_values_log
         if until is None:
             query = (table.state_key == state.log_key) & (table.timestamp >= since)
         else:
             query = (table.state_key == state.log_key) & (table.timestamp >= since) & (table.timestamp < until)
-        rows = self._db(query).select(table.ALL)
-        timeseries = [TimestampedValue(row['timestamp'], json.loads(row['value'])) for row in rows]
+        codec = self._get_value_codec(state.type)
+        rows = self._db(query).select(table.timestamp, table.value_number, table.value, orderby=table.timestamp)
+        timeseries = [TimestampedValue(row['timestamp'], codec.decode(row['value_number'], row['value'])) for row in rows]
 
         if len(timeseries) > 0 and timeseries[0].timestamp > since:
-            # get the first entry less than since
-            row = self._db((table.state_key == state.log_key) & (table.timestamp < since)).select(table.ALL).last()
+            # get the last entry before since
+            row = self._db((table.state_key == state.log_key) & (table.timestamp < since)).select(
+                table.timestamp, table.value_number, table.value, orderby=~table.timestamp, limitby=(0, 1)).first()
             if row is not None:
-                timeseries = [TimestampedValue(row['timestamp'], json.loads(row['value']))] + timeseries
+                timeseries = [TimestampedValue(row['timestamp'], codec.decode(row['value_number'], row['value']))] \
+                    + timeseries
         return timeseries
 
-    def _row_to_state(self, row) -> State:
-        parent = self._states.get(row['parent'])  # FIXME this could cause problems related to the order of states in the db
-        return State(self, self.event_manager, row['key'], row['name'], parent=parent, type=row['type'], quantity=row['quantity'],
-                     unit=row['unit'], label=row['label'], description=row['description'], log_key=row['log_key'], config=json.loads(row['config']),
-                     value=json.loads(row['value']) if row['value'] is not None else row['value'])
+    def _replace_states(self, states_list: List[dict]):
+        with self._queue_lock:
+            self._dirty_states = {}
+        self._retention_tiers = {}
+        super()._replace_states(states_list)
 
-    def _create_state(self, key: str, name: str, parent: Optional[State] = None,
-                      type: Optional[str] = None, quantity: Optional[str] = None, unit: Optional[str] = None,
-                      label: Optional[str] = None, description: Optional[str] = None, log_key: Optional[str] = '',
-                      config: Optional[dict] = None, value: Optional[Any] = None) -> State:
-        try:
+        states = self.all()
+        timestamp = time.time()
+        with self._db_lock:
+            try:
+                # noinspection PyProtectedMember
+                self._db._adapter.reconnect()
+                self._db(self._table.id > 0).delete()
+                self._table.bulk_insert([dict(key=state.key, **self._state_fields(state)) for state in states])
+                self._store_state_logs(states, timestamp)
+                self._db.commit()
+                # noinspection PyProtectedMember
+                self._db._adapter.close()
+            except Exception as e:
+                logger.exception('could not store imported states')
+                self._db.rollback()
+                raise CouldNotStoreStateException from e
+
+    def migrate_values(self) -> int:
+        """
+        Moves values stored as json to the numeric columns for states of which the type has a numeric codec.
+
+        Values stored as json remain readable, so databases created before the numeric columns were added can be used
+        without migrating them. Migrating shrinks the values log and avoids decoding json when reading it.
+
+        Returns
+        -------
+        count : int
+            The number of migrated rows.
+        """
+        if self._write_behind:
+            self.flush()
+
+        count = 0
+        table = self._table_values_log
+        with self._db_lock:
             # noinspection PyProtectedMember
             self._db._adapter.reconnect()
-            self._db.states.insert(key=key, name=name, parent=None if parent is None else parent.key, type=type,
-                                   quantity=quantity, unit=unit, label=label, description=description, log_key=log_key,
-                                   config=json.dumps(config), value=json.dumps(value))
+            for state in self.all():
+                if state.type not in self._value_codecs:
+                    continue
+                value_number, value = self._encode(state)
+                if value_number is not None:
+                    count += self._db((self._table.key == state.key) & (self._table.value_number == None)).update(
+                        value=value, value_number=value_number)
+                if state.log_key == State.NO_LOGGING_KEY:
+                    continue
+
+                codec = self._value_codecs[state.type]
+                last_id = 0
+                while True:
+                    query = (table.state_key == state.log_key) & (table.value_number == None) & (table.id > last_id)
+                    rows = self._db(query).select(table.id, table.value, orderby=table.id,
+                                                  limitby=(0, self.MIGRATE_CHUNK_SIZE))
+                    if len(rows) == 0:
+                        break
+                    for row in rows:
+                        value_number, value = codec.encode(codec.decode(None, row['value']))
+                        if value_number is not None:
+                            self._db(table.id == row['id']).update(value=value, value_number=value_number)
+                            count += 1
+                    last_id = rows[-1]['id']
+                    self._db.commit()
             self._db.commit()
             # noinspection PyProtectedMember
             self._db._adapter.close()
-        except Exception as e:
-            logger.exception('could not store state')
-            raise CouldNotStoreStateException from e
+        logger.info(f'migrated {count} values')
+        return count
+
+    def compact(self, now: Optional[float] = None) -> int:
+        """
+        Applies the retention policy of all states to their values log.
+
+        Every complete bucket of an aggregate tier which is not aggregated yet is averaged from the raw values, after
+        which raw values and averages older than the duration of their tier are deleted.
+
+        Returns
+        -------
+        count : int
+            The number of added aggregate rows.
+        """
+        if self._value_log is not None:
+            return 0
+        if self._write_behind:
+            self.flush()
+
+        now = time.time() if now is None else now
+        count = 0
+        start = time.time()
+        for state in self.all():
+            if state.log_key == State.NO_LOGGING_KEY:
+                continue
+            tiers = self._get_retention_tiers(state)
+            if len(tiers) == 0:
+                continue
+            if not isinstance(self._get_value_codec(state.type), NumberValueCodec):
+                logger.warning(f'the values log of {state} is not compacted, as its type {state.type} is not numeric')
+                continue
+            with self._db_lock:
+                try:
+                    # noinspection PyProtectedMember
+                    self._db._adapter.reconnect()
+                    for tier in tiers:
+                        if tier.resolution > 0:
+                            count += self._aggregate(state.log_key, tier.resolution, now)
+                    for tier in tiers:
+                        if tier.duration is not None:
+                            self._prune(state.log_key, tier, now - tier.duration)
+                    self._db.commit()
+                    # noinspection PyProtectedMember
+                    self._db._adapter.close()
+                except Exception:
+                    logger.exception(f'could not compact the values log of {state}')
+                    self._db.rollback()
+        logger.debug(f'added {count} aggregate rows in {time.time() - start:.3f} s')
+        return count
+
+    def _aggregate(self, log_key: str, resolution: int, now: float) -> int:
+        aggregate_table = self._table_values_aggregate
+        last = self._db((aggregate_table.state_key == log_key) & (aggregate_table.resolution == resolution)).select(
+            aggregate_table.timestamp, orderby=~aggregate_table.timestamp, limitby=(0, 1)).first()
+
+        table = self._table_values_log
+        query = (table.state_key == log_key) & (table.timestamp < now // resolution * resolution)
+        if last is not None:
+            query &= table.timestamp >= last['timestamp'] + resolution
+
+        bucket = (table.timestamp / resolution).cast('integer')
+        average = table.value_number.avg()
+        count = table.value_number.count()
+        rows = self._db(query).select(bucket, average, count, groupby=bucket, orderby=bucket)
+        aggregates = [
+            {'state_key': log_key, 'resolution': resolution, 'timestamp': float(row[bucket] * resolution),
+             'value': row[average], 'count': row[count]}
+            for row in rows if row[count] > 0
+        ]
+        if len(aggregates) > 0:
+            aggregate_table.bulk_insert(aggregates)
+        return len(aggregates)
+
+    def _prune(self, log_key: str, tier: RetentionTier, before: float):
+        if tier.resolution == 0:
+            table = self._table_values_log
+            # values without a number are not aggregated, so they are kept
+            self._db((table.state_key == log_key) & (table.timestamp < before)
+                     & (table.value_number != None)).delete()  # noqa: E711
         else:
-            state = State(self, self.event_manager, key, name, parent=parent, type=type,
-                          quantity=quantity, unit=unit, label=label, description=description, log_key=log_key,
-                          config=config, value=value)
+            table = self._table_values_aggregate
+            self._db((table.state_key == log_key) & (table.resolution == tier.resolution)
+                     & (table.timestamp < before)).delete()
 
-            self._store_state_log(state)
-            self._db.commit()
+    def _get_retention_tiers(self, state: State) -> List[RetentionTier]:
+        """
+        Returns the cached retention tiers of a state, the config is only decoded for states with a retention policy.
+        """
+        tiers = self._retention_tiers.get(state.key)
+        if tiers is None:
+            tiers = RetentionTier.from_config(state.config) if '"retention"' in state.config_json() else []
+            self._retention_tiers[state.key] = tiers
+        return tiers
 
-            self._states[state.key] = state
-            return state
+    def _schedule_compaction(self):
+        self._compaction_timer = Timer(self._compaction_interval, self._run_compaction)
+        self._compaction_timer.daemon = True
+        self._compaction_timer.start()
+
+    def _run_compaction(self):
+        self.compact()
+        if self._compaction_timer is not None:
+            self._schedule_compaction()
+
+    @staticmethod
+    def _create_index(table, name: str, *fields):
+        try:
+            table.create_index(name, *fields)
+        except RuntimeError:
+            logger.debug(f'index {name} already exists')
+
+    def _get_value_codec(self, type_: Optional[str]) -> ValueCodec:
+        return self._value_codecs.get(type_, self._default_value_codec)
+
+    def _encode(self, state: State) -> Tuple[Optional[float], Optional[str]]:
+        return self._get_value_codec(state.type).encode(state.value)
+
+    def _state_fields(self, state: State) -> dict:
+        value_number, value = self._encode(state)
+        return dict(name=state.name, parent=None if state.parent is None else state.parent.key, type=state.type,
+                    quantity=state.quantity, unit=state.unit, label=state.label, description=state.description,
+                    log_key=state.log_key, config=state.config_json(), value=value, value_number=value_number)
+
+    def _load_states(self) -> float:
+        """
+        Loads all states from the database into memory.
+
+        Rows are fetched from the cursor in chunks of ``LOAD_CHUNK_SIZE`` and converted to states without a parent.
+        Parents are linked once all states are loaded, so the order of the rows in the database does not matter.
+
+        Returns
+        -------
+        load_time : float
+            The time in seconds it took to load the states.
+        """
+        start = time.time()
+        table = self._table
+        fields = [table.key, table.name, table.parent, table.type, table.quantity, table.unit, table.label,
+                  table.description, table.log_key, table.config, table.value, table.value_number]
+        # noinspection PyProtectedMember
+        cursor = self._db._adapter.execute(self._db(table)._select(*fields, orderby=table.id))
+
+        states: Dict[str, State] = {}
+        parent_keys: Dict[str, Optional[str]] = {}
+        rows = cursor.fetchmany(self.LOAD_CHUNK_SIZE)
+        while len(rows) > 0:
+            for row in rows:
+                state = self._row_to_state(row)
+                states[state.key] = state
+                parent_keys[state.key] = row[2]
+            rows = cursor.fetchmany(self.LOAD_CHUNK_SIZE)
+
+        for state in states.values():
+            parent_key = parent_keys[state.key]
+            if parent_key is not None:
+                state.parent = states.get(parent_key)
+                if state.parent is None:
+                    logger.warning(f'parent {parent_key} of {state.key} does not exist, state is added as a root state')
+
+        # add parents before their children, keeping the database order otherwise
+        for state in states.values():
+            chain = []
+            chain_keys = set()
+            ancestor = state
+            while ancestor is not None and ancestor.key not in self._states:
+                if ancestor.key in chain_keys:
+                    logger.warning(f'{chain[-1].key} is part of a parent cycle, state is added as a root state')
+                    chain[-1].parent = None
+                    break
+                chain.append(ancestor)
+                chain_keys.add(ancestor.key)
+                ancestor = ancestor.parent
+            for ancestor in reversed(chain):
+                self._add_state(ancestor)
+
+        load_time = time.time() - start
+        logger.info(f'loaded {len(states)} states in {load_time:.3f} s')
+        return load_time
+
+    def _row_to_state(self, row: tuple) -> State:
+        key, name, _, type, quantity, unit, label, description, log_key, config, value, value_number = row
+        return State(self, self.event_manager, key, name, type=type, quantity=quantity, unit=unit, label=label,
+                     description=description, log_key=log_key, raw_config=config,
+                     value=self._get_value_codec(type).decode(value_number, value))
+
+    def _create_state(self, key: str, name: str, parent: Optional[State] = None,
+                      type: Optional[str] = None, quantity: Optional[str] = None, unit: Optional[str] = None,
+                      label: Optional[str] = None, description: Optional[str] = None, log_key: Optional[str] = '',
+                      config: Optional[dict] = None, value: Optional[Any] = None) -> State:
+        state = State(self, self.event_manager, key, name, parent=parent, type=type,
+                      quantity=quantity, unit=unit, label=label, description=description, log_key=log_key,
+                      config=config, value=value)
+        with self._db_lock:
+            try:
+                value_number, encoded_value = self._get_value_codec(type).encode(value)
+                # noinspection PyProtectedMember
+                self._db._adapter.reconnect()
+                self._db.states.insert(key=key, name=name, parent=None if parent is None else parent.key, type=type,
+                                       quantity=quantity, unit=unit, label=label, description=description,
+                                       log_key=log_key, config=json.dumps(config), value=encoded_value,
+                                       value_number=value_number)
+                self._store_state_log(state)
+                self._db.commit()
+                # noinspection PyProtectedMember
+                self._db._adapter.close()
+            except Exception as e:
+                logger.exception('could not store state')
+                raise CouldNotStoreStateException from e
+
+        self._add_state(state)
+        return state
+
+    def _store_state_logs(self, states: List[State], timestamp: float):
+        logged_states = [state for state in states if state.log_key != State.NO_LOGGING_KEY]
+        if self._value_log is not None:
+            for state in logged_states:
+                self._value_log.append(state.log_key, timestamp, state.value)
+        elif len(logged_states) > 0:
+            rows = []
+            for state in logged_states:
+                value_number, value = self._encode(state)
+                rows.append({'state_key': state.log_key, 'timestamp': timestamp, 'value': value,
+                             'value_number': value_number})
+            self._table_values_log.bulk_insert(rows)
 
     def _store_state_log(self, state):
-        self._table_values_log.insert(state_key=state.log_key, timestamp=time.time(), value=json.dumps(state.value))
+        if self._value_log is not None:
+            if state.log_key != State.NO_LOGGING_KEY:
+                self._value_log.append(state.log_key, time.time(), state.value)
+            return
+        value_number, value = self._encode(state)
+        self._table_values_log.insert(state_key=state.log_key, timestamp=time.time(), value=value,
+                                      value_number=value_number)
@@ -0,0 +1,150 @@
+from typing import Dict, Optional, List
+
+from homecon.core.states.state import State
+
+
+class StateIndex:
+    """
+    Maintains a path to state mapping and a parent to children mapping for a state manager.
+
+    The full path of every indexed state is stored, so a lookup by path is a single dict access and the path of a new
+    child can be derived from the path of its parent without walking up the parent chain. The children of every state
+    are stored per parent key, in insertion order.
+    """
+    ROOT = None
+
+    _REGEX_SPECIAL_CHARACTERS = set('.^$*+?{}[]\\|()')
+    _REGEX_QUANTIFIERS = set('*?{')
+
+    def __init__(self):
+        self._states_by_path: Dict[str, State] = {}
+        self._paths_by_key: Dict[str, str] = {}
+        self._parent_keys: Dict[str, Optional[str]] = {}
+        self._children: Dict[Optional[str], Dict[str, State]] = {}
+        self._order: Dict[str, int] = {}
+        self._counter = 0
+
+    def get(self, path: str) -> Optional[State]:
+        return self._states_by_path.get(path)
+
+    def get_path(self, state: State) -> Optional[str]:
+        return self._paths_by_key.get(state.key)
+
+    def child_path(self, name: str, parent: Optional[State] = None) -> str:
+        if parent is None:
+            return '/{}'.format(name)
+        parent_path = self._paths_by_key.get(parent.key)
+        if parent_path is None:
+            parent_path = parent.path
+        return '{}/{}'.format(parent_path, name)
+
+    def children(self, state: Optional[State]) -> List[State]:
+        return list(self._children.get(self.ROOT if state is None else state.key, {}).values())
+
+    def descendants(self, state: Optional[State]) -> List[State]:
+        """
+        Returns all descendants of a state, parents before their children.
+        """
+        descendants = []
+        level = self.children(state)
+        while len(level) > 0:
+            descendants.extend(level)
+            level = [child for s in level for child in self._children.get(s.key, {}).values()]
+        return descendants
+
+    def sort(self, states: List[State]) -> List[State]:
+        """
+        Sorts states in the order they were added to the index.
+        """
+        return sorted(states, key=lambda s: self._order.get(s.key, -1))
+
+    def subtree_root(self, expr: str) -> Optional[State]:
+        """
+        Returns the deepest state whose descendants include every state with a path matching a regular expression, or
+        ``None`` when the whole tree has to be searched.
+        """
+        if '|' in expr:
+            return None
+        literal = ''
+        for character in expr:
+            if character in self._REGEX_SPECIAL_CHARACTERS:
+                if character in self._REGEX_QUANTIFIERS:
+                    literal = literal[:-1]
+                break
+            literal += character
+        root_path = literal[:literal.rfind('/')]
+        if len(root_path) == 0:
+            return None
+        return self._states_by_path.get(root_path)
+
+    def add(self, state: State) -> None:
+        parent_key = self.ROOT if state.parent is None else state.parent.key
+        path = self.child_path(state.name, parent=state.parent)
+        self._paths_by_key[state.key] = path
+        self._states_by_path[path] = state
+        self._parent_keys[state.key] = parent_key
+        self._children.setdefault(parent_key, {})[state.key] = state
+        self._order[state.key] = self._counter
+        self._counter += 1
+
+    def remove(self, state: State) -> None:
+        path = self._paths_by_key.pop(state.key, None)
+        if path is not None and self._states_by_path.get(path) is state:
+            del self._states_by_path[path]
+        parent_key = self._parent_keys.pop(state.key, self.ROOT)
+        self._children.get(parent_key, {}).pop(state.key, None)
+        self._order.pop(state.key, None)
+
+    def is_current(self, state: State) -> bool:
+        """
+        Checks if the indexed parent and path of a state are up to date.
+        """
+        parent_key = self.ROOT if state.parent is None else state.parent.key
+        return (state.key in self._parent_keys and self._parent_keys[state.key] == parent_key
+                and self._paths_by_key.get(state.key) == self.child_path(state.name, parent=state.parent))
+
+    def update(self, state: State) -> List[State]:
+        """
+        Updates the index after a state was renamed or moved to a different parent.
+
+        Returns
+        -------
+        states : list
+            The states of which the path has changed, the state itself and all its descendants.
+        """
+        old_path = self._paths_by_key.get(state.key)
+        if old_path is None:
+            self.add(state)
+            return [state]
+
+        parent_key = self.ROOT if state.parent is None else state.parent.key
+        old_parent_key = self._parent_keys[state.key]
+        if parent_key != old_parent_key:
+            self._children.get(old_parent_key, {}).pop(state.key, None)
+            self._children.setdefault(parent_key, {})[state.key] = state
+            self._parent_keys[state.key] = parent_key
+
+        new_path = self.child_path(state.name, parent=state.parent)
+        if old_path == new_path:
+            return []
+
+        moved = [state] + self.descendants(state)
+        for moved_state in moved:
+            path = self._paths_by_key[moved_state.key]
+            if self._states_by_path.get(path) is moved_state:
+                del self._states_by_path[path]
+        for moved_state in moved:
+            moved_path = new_path + self._paths_by_key[moved_state.key][len(old_path):]
+            self._paths_by_key[moved_state.key] = moved_path
+            self._states_by_path[moved_path] = moved_state
+        return moved
+
+    def clear(self) -> None:
+        self._states_by_path.clear()
+        self._paths_by_key.clear()
+        self._parent_keys.clear()
+        self._children.clear()
+        self._order.clear()
+
+    def __len__(self):
+        return len(self._paths_by_key)
@@ -1,58 +1,211 @@
 import re
 import time
-from typing import Optional, List, Any
+from collections import OrderedDict
+from functools import lru_cache
+from threading import RLock
+from typing import Optional, List, Any, Dict, Tuple, Pattern
 from uuid import uuid4
 
 from homecon.core.states.state import IStateManager, State, TimestampedValue
+from homecon.core.states.index import StateIndex
+from homecon.core.states.value_log import MemoryValueLog
+
+
+@lru_cache(maxsize=1024)
+def _compile(expr: str) -> Pattern:
+    return re.compile(expr)
 
 
 class MemoryStateManager(IStateManager):
-    def __init__(self, *args, **kwargs):
+    """
+    State manager which keeps all states in memory.
+
+    Parameters
+    ----------
+    max_log_count :
+        The maximum number of logged values kept in memory per log key, unbounded if ``None``.
+    max_log_age :
+        The maximum age in seconds of the logged values kept in memory, unbounded if ``None``.
+
+    Notes
+    -----
+    The results of ``find`` are cached per expression and kept up to date when states are added, deleted, renamed
+    or moved, so repeated calls with the same expression do not match all states again.
+
+    The state manager can be used from multiple threads. Adding, deleting, renaming and moving states is serialized
+    by a writer lock. Readers do not take the lock: lookups are single dict reads, the cached ``find`` results are
+    copied on write and ``all`` and ``children`` return snapshots which are rebuilt once after the states have
+    changed. Value updates of a single state are serialized by its ``state_lock``.
+    """
+    FIND_CACHE_SIZE = 256
+
+    def __init__(self, *args, max_log_count: Optional[int] = None, max_log_age: Optional[float] = None, **kwargs):
         super().__init__(*args, **kwargs)
         self._states = {}
-        self._state_timeseries = {}
+        self._state_timeseries = MemoryValueLog(max_count=max_log_count, max_age=max_log_age)
+        self._index = StateIndex()
+        self._find_cache: Dict[str, Tuple[Pattern, Dict[str, State]]] = OrderedDict()
+        self._lock = RLock()
+        self._structure_version = 0
+        self._all_snapshot: Tuple[int, Tuple[State, ...]] = (-1, ())
+        self._children_snapshots: Dict[Optional[str], Tuple[int, Tuple[State, ...]]] = {}
 
     def all(self):
-        return list(self._states.values())
+        version, states = self._all_snapshot
+        if version != self._structure_version:
+            with self._lock:
+                version, states = self._structure_version, tuple(self._states.values())
+                self._all_snapshot = (version, states)
+        return list(states)
+
+    def add(self, *args, **kwargs) -> Optional[State]:
+        # checking if the state exists and creating it must be atomic
+        with self._lock:
+            return super().add(*args, **kwargs)
 
     # noinspection PyShadowingBuiltins
     def get(self, path: str = None, key: str = None):
         if key is not None:
             return self._states.get(key, None)
         else:
-            for state in self._states.values():
-                if state.path == path:
-                    return state
+            return self._index.get(path)
 
     def exists(self, name, parent: State = None):
-        temp_state = State(self, self.event_manager, 0, name, parent=parent)
-        path = temp_state.path
-        state = self.get(path=path)
+        state = self._index.get(self._index.child_path(name, parent=parent))
         return state or False
 
     def find(self, expr: str):
-        compiled = re.compile(expr)
-        return [state for state in self._states.values() if compiled.match(state.path)]
+        return list(self._find(expr).values())
+
+    def matches(self, expr: str, state: State) -> bool:
+        return state.key in self._find(expr)
+
+    def _find(self, expr: str) -> Dict[str, State]:
+        """
+        Returns the cached result of an expression, which must not be modified as it is shared between threads.
+        """
+        cached = self._find_cache.get(expr)
+        if cached is not None:
+            self._touch_find_cache(expr)
+            return cached[1]
+
+        with self._lock:
+            cached = self._find_cache.get(expr)
+            if cached is not None:
+                self._touch_find_cache(expr)
+                return cached[1]
+
+            compiled = _compile(expr)
+            root = self._index.subtree_root(expr)
+            if root is None:
+                candidates = self._states.values()
+            else:
+                candidates = self._index.sort(self._index.descendants(root))
+            result = {state.key: state for state in candidates
+                      if compiled.match(self._index.get_path(state) or state.path)}
+
+            self._find_cache[expr] = (compiled, result)
+            if len(self._find_cache) > self.FIND_CACHE_SIZE:
+                self._find_cache.popitem(last=False)
+            return result
+
+    def _touch_find_cache(self, expr: str):
+        """
+        Marks a cached expression as most recently used, so the least recently used expression is evicted first.
+        """
+        try:
+            self._find_cache.move_to_end(expr)
+        except KeyError:
+            # evicted by another thread after it was read
+            pass
+
+    def _update_find_cache(self, states: List[State], sort: bool = True):
+        """
+        Replaces the cached results which change when states are added or moved, must be called with the lock held.
+        """
+        for expr, (compiled, result) in list(self._find_cache.items()):
+            added = []
+            removed = []
+            for state in states:
+                match = compiled.match(self._index.get_path(state) or state.path) is not None
+                if match and state.key not in result:
+                    added.append(state)
+                elif not match and state.key in result:
+                    removed.append(state)
+            if len(added) == 0 and len(removed) == 0:
+                continue
+
+            new_result = dict(result)
+            for state in removed:
+                del new_result[state.key]
+            for state in added:
+                new_result[state.key] = state
+            if sort and len(added) > 0:
+                new_result = {s.key: s for s in self._index.sort(list(new_result.values()))}
+            self._find_cache[expr] = (compiled, new_result)
+
+    def _update_index(self, state: State):
+        if self._index.is_current(state):
+            return
+        with self._lock:
+            moved_states = self._index.update(state)
+            if len(moved_states) > 0:
+                self._structure_version += 1
+                self._update_find_cache(moved_states)
+
+    def children(self, state: Optional[State]) -> List[State]:
+        key = None if state is None else state.key
+        snapshot = self._children_snapshots.get(key)
+        if snapshot is None or snapshot[0] != self._structure_version:
+            with self._lock:
+                snapshot = (self._structure_version, tuple(self._index.children(state)))
+                self._children_snapshots[key] = snapshot
+        return list(snapshot[1])
 
     def delete(self, state: State):
-        del self._states[state.key]
+        with self._lock:
+            if self._states.pop(state.key, None) is None:
+                return
+            self._index.remove(state)
+            self._children_snapshots.pop(state.key, None)
+            self._structure_version += 1
+            for expr, (compiled, result) in list(self._find_cache.items()):
+                if state.key in result:
+                    self._find_cache[expr] = (compiled, {k: s for k, s in result.items() if k != state.key})
         super().delete(state)
 
     def update(self, state: State):
+        self._update_index(state)
         if state.log_key != state.NO_LOGGING_KEY:
-            if state.log_key not in self._state_timeseries:
-                self._state_timeseries[state.log_key] = []
-            self._state_timeseries[state.log_key].append(TimestampedValue(time.time(), state.value))
+            value_log = self._state_timeseries if self._value_log is None else self._value_log
+            value_log.append(state.log_key, time.time(), state.value)
 
     def get_state_values_log(self, state: State, since: float, until: Optional[float] = None) -> List[TimestampedValue]:
-        full_timeseries = self._state_timeseries.get(state.log_key, [])
+        value_log = self._state_timeseries if self._value_log is None else self._value_log
+        return value_log.get(state.log_key, since, until=until)
 
-        timeseries = [v for v in full_timeseries if since <= v.timestamp and (until is None or v.timestamp < until)]
-        if len(timeseries) > 0 and timeseries[0].timestamp > since:
-            initial_values = [v for v in full_timeseries if v.timestamp < timeseries[0].timestamp]
-            if len(initial_values) > 0:
-                timeseries = [initial_values[-1]] + timeseries
-        return timeseries
+    def _replace_states(self, states_list: List[dict]):
+        with self._lock:
+            self._states.clear()
+            self._index.clear()
+            self._find_cache.clear()
+            self._children_snapshots.clear()
+            # the snapshots must be invalidated when no states are added as well
+            self._structure_version += 1
+            self._all_snapshot = (-1, ())
+            for state_dict in states_list:
+                parent_key = state_dict.get('parent')
+                parent = None if parent_key is None else self._states.get(parent_key)
+                if self._index.get(self._index.child_path(state_dict['name'], parent=parent)) is not None:
+                    continue
+                self._add_state(self._state_from_dict(state_dict, parent))
+
+    def _state_from_dict(self, state_dict: dict, parent: Optional[State]) -> State:
+        return State(self, self.event_manager, state_dict['key'], state_dict['name'], parent=parent,
+                     type=state_dict.get('type'), quantity=state_dict.get('quantity'), unit=state_dict.get('unit'),
+                     label=state_dict.get('label'), description=state_dict.get('description'),
+                     log_key=state_dict.get('log_key', State.NO_LOGGING_KEY), config=state_dict.get('config'),
+                     value=state_dict.get('value'))
 
     def _create_state(self, key: str, name: str, parent: Optional[State] = None,
                       type: Optional[str] = None, quantity: Optional[str] = None, unit: Optional[str] = None,
@@ -63,5 +216,13 @@ class MemoryStateManager(IStateManager):
                       quantity=quantity, unit=unit, label=label,
                       description=description, log_key=log_key, config=config,
                       value=value)
-        self._states[state.key] = state
+        self._add_state(state)
         return state
+
+    def _add_state(self, state: State):
+        with self._lock:
+            self._states[state.key] = state
+            self._index.add(state)
+            self._structure_version += 1
+            # a new state is always the last state in the index, so the cached results remain sorted
+            self._update_find_cache([state], sort=False)
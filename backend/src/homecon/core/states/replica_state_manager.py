@@ -0,0 +1,166 @@
+import json
+
+from typing import Any, Dict, List, Optional, Set
+
+from homecon.core.event import Event, IEventManager
+from homecon.core.states.state import State, sort_states_list
+from homecon.core.states.memory_state_manager import MemoryStateManager
+
+
+class _DiscardingEventManager(IEventManager):
+    """
+    Event manager of the replicated states, which do not fire events as they are fired by the owner of the states.
+    """
+    def fire(self, type_: str, data: dict, source: str = None, target: str = None, reply_to: str = None,
+             priority: Optional[int] = None) -> Event:
+        return Event(self, type_, data, source=source, target=target, reply_to=reply_to, priority=priority)
+
+
+class ReplicaState(State):
+    """
+    State of a ``ReplicaStateManager``.
+
+    Setting the value or updating the state fires an event to the state manager owning the states instead of changing
+    the state, the replica is changed once the state manager owning the states fires the change.
+    """
+    __slots__ = ()
+
+    def set_value(self, val, source: str = None) -> bool:
+        """
+        Sends the value to the state manager owning the states, which filters it, so ``True`` does not guarantee the
+        value is set.
+        """
+        self._state_manager.write('state_value', {'key': self.key, 'value': val}, source=source)
+        return True
+
+    def compare_and_set(self, expected_version: int, val, source: str = None) -> bool:
+        """
+        Sets the value only when the state was not changed since ``expected_version``.
+
+        As the value is set by the state manager owning the states, ``True`` is returned when the replicated state has
+        the expected version, which does not guarantee the value is set.
+        """
+        if self._version != expected_version:
+            return False
+        self._state_manager.write('state_value', {'key': self.key, 'value': val, 'version': expected_version},
+                                  source=source)
+        return True
+
+    def update(self, **kwargs) -> None:
+        if 'parent' in kwargs:
+            kwargs['parent'] = None if kwargs['parent'] is None else kwargs['parent'].key
+        self._state_manager.write('state_update', {'key': self.key, **kwargs})
+
+
+class ReplicaStateManager(MemoryStateManager):
+    """
+    State manager keeping a copy of the states of a state manager in another process.
+
+    The replica is kept up to date with ``sync`` from the states in the events fired by the state manager owning the
+    states. Adding, updating or deleting states and setting values fires ``state_add``, ``state_update``,
+    ``state_delete`` and ``state_value`` events which are handled by the ``States`` plugin of the process owning the
+    states. Updates, deletions and values only change the replica when the change comes back, so it never holds values
+    the owner filtered. Added states are added to the replica right away, so they can be used by the plugin, and are
+    replaced by the state of the owner when it is synced.
+
+    The values logs are not replicated.
+
+    Parameters
+    ----------
+    event_manager :
+        The event manager through which events are fired to the process owning the states.
+    states_list :
+        The serialized states to start from.
+    """
+    def __init__(self, event_manager: IEventManager, states_list: List[dict], **kwargs):
+        super().__init__(event_manager, **kwargs)
+        self._state_event_manager = _DiscardingEventManager()
+        # states added in the replica which were not synced from the owner yet
+        self._unsynced_keys: Set[str] = set()
+        self.reload(states_list)
+
+    def write(self, type_: str, data: dict, source: Optional[str] = None):
+        """
+        Fires an event changing the states to the process owning the states.
+        """
+        self.event_manager.fire(type_, data, source=source)
+
+    def reload(self, states_list: List[dict]):
+        """
+        Replaces all states by a list of serialized states.
+        """
+        ordered_states_list, _ = sort_states_list(states_list)
+        self._unsynced_keys.clear()
+        self._replace_states(ordered_states_list)
+        self.invalidate_state_list()
+
+    def sync(self, state_dict: dict, deleted: bool = False) -> State:
+        """
+        Updates the replicated state from a serialized state, adds it when it is not replicated yet.
+
+        Parameters
+        ----------
+        state_dict :
+            The serialized state.
+        deleted :
+            Remove the state from the replica.
+
+        Returns
+        -------
+        state :
+            The replicated state.
+        """
+        state = self.get(key=state_dict['key'])
+        parent = None if state_dict.get('parent') is None else self.get(key=state_dict['parent'])
+        if state is None:
+            with self._lock:
+                state = self._state_from_dict(state_dict, parent)
+                self._add_state(state)
+            self.invalidate_state_list()
+        elif state_dict['version'] > state.version or state.key in self._unsynced_keys:
+            # changed directly as the methods of a replicated state fire events to the owner of the states
+            State.update(state, name=state_dict['name'], parent=parent, type=state_dict['type'],
+                         quantity=state_dict['quantity'], unit=state_dict['unit'], label=state_dict['label'],
+                         description=state_dict['description'], log_key=state_dict['log_key'],
+                         config=state_dict['config'], value=state_dict['value'])
+            # noinspection PyProtectedMember
+            state._version = state_dict['version']
+        self._unsynced_keys.discard(state.key)
+
+        if deleted:
+            super().delete(state)
+        return state
+
+    def delete(self, state: State):
+        self.write('state_delete', {'key': state.key})
+
+    def update(self, state: State):
+        # values are not logged in the replica
+        self._update_index(state)
+
+    def set_values(self, values: Dict[State, Any], source: Optional[str] = None):
+        for state, value in values.items():
+            state.set_value(value, source=source)
+
+    def import_states(self, states_list: List[dict]):
+        # the replica is reloaded when the owner fires states_reloaded
+        self.write('states_import', {'value': json.dumps(states_list)})
+
+    def _create_state(self, key: str, name: str, parent: Optional[State] = None, **kwargs) -> State:
+        self.write('state_add', {'key': key, 'name': name, 'parent': None if parent is None else parent.key,
+                                 **kwargs})
+        # the state is added to the replica right away so it can be used, the owner adds the same state
+        state = ReplicaState(self, self._state_event_manager, key, name, parent=parent, **kwargs)
+        self._add_state(state)
+        self._unsynced_keys.add(key)
+        return state
+
+    def _state_from_dict(self, state_dict: dict, parent: Optional[State]) -> State:
+        state = ReplicaState(self, self._state_event_manager, state_dict['key'], state_dict['name'], parent=parent,
+                             type=state_dict.get('type'), quantity=state_dict.get('quantity'),
+                             unit=state_dict.get('unit'), label=state_dict.get('label'),
+                             description=state_dict.get('description'),
+                             log_key=state_dict.get('log_key', State.NO_LOGGING_KEY), config=state_dict.get('config'),
+                             value=state_dict.get('value'))
+        state._version = state_dict.get('version', 0)
+        return state
@@ -0,0 +1,250 @@
+import json
+import logging
+import os
+import shutil
+import time
+
+from threading import Lock, RLock, Thread, Timer
+from typing import Any, Dict, List, Optional
+
+from homecon.core.states.state import State, sort_states_list
+from homecon.core.states.memory_state_manager import MemoryStateManager
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotStateManager(MemoryStateManager):
+    """
+    State manager which keeps all states in memory and persists them in a snapshot and a write ahead log.
+
+    Every added, updated or deleted state is appended to the write ahead log as a json line. The log is written to
+    disk every ``fsync_interval`` seconds, so at most the changes of the last interval are lost when the process
+    crashes. Once the log holds ``snapshot_size`` records, all states are written to a new snapshot in a background
+    thread. The log is rotated when the states are captured and the previous log is removed once the snapshot is
+    written. On startup the snapshot is loaded and the previous and current log are replayed, after which a new
+    snapshot is written.
+
+    The values log is kept in memory and is not persisted.
+
+    Parameters
+    ----------
+    folder :
+        The folder of the snapshot and write ahead log files.
+    fsync_interval :
+        The maximum time in seconds an appended record is not synced to disk.
+    snapshot_size :
+        The number of records in the write ahead log after which a new snapshot is written.
+
+    Attributes
+    ----------
+    load_time :
+        The time in seconds it took to load the snapshot and replay the write ahead log at startup.
+    """
+    SNAPSHOT_FILENAME = 'states.snapshot.json'
+    WAL_FILENAME = 'states.wal'
+    PREVIOUS_WAL_FILENAME = 'states.wal.previous'
+
+    UPSERT = 'upsert'
+    DELETE = 'delete'
+    RELOAD = 'reload'
+
+    def __init__(self, folder: str, *args, fsync_interval: float = 1.0, snapshot_size: int = 10000, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._folder = folder
+        self._fsync_interval = fsync_interval
+        self._snapshot_size = snapshot_size
+        self._wal_lock = RLock()
+        self._snapshot_lock = Lock()
+        self._snapshot_thread: Optional[Thread] = None
+        self._sync_timer: Optional[Timer] = None
+        self._wal_size = 0
+        self._wal = None
+
+        os.makedirs(folder, exist_ok=True)
+        self.load_time = self._load()
+        self.snapshot()
+
+    @property
+    def _snapshot_path(self) -> str:
+        return os.path.join(self._folder, self.SNAPSHOT_FILENAME)
+
+    @property
+    def _wal_path(self) -> str:
+        return os.path.join(self._folder, self.WAL_FILENAME)
+
+    @property
+    def _previous_wal_path(self) -> str:
+        return os.path.join(self._folder, self.PREVIOUS_WAL_FILENAME)
+
+    def stop(self):
+        with self._wal_lock:
+            snapshot_thread = self._snapshot_thread
+        if snapshot_thread is not None:
+            snapshot_thread.join()
+        self.snapshot()
+        with self._wal_lock:
+            self._wal.close()
+        super().stop()
+
+    def snapshot(self):
+        """
+        Writes all states to a new snapshot and clears the write ahead log.
+
+        Only capturing the states and rotating the log block changes to the states, the snapshot is written after.
+        """
+        with self._snapshot_lock:
+            start = time.time()
+            # the states lock is taken first, as states are appended to the log while it is held
+            with self._lock, self._wal_lock:
+                if self._sync_timer is not None:
+                    self._sync_timer.cancel()
+                    self._sync_timer = None
+                states = self.export_states()
+                previous_wal = self._rotate_wal()
+
+            if previous_wal is not None:
+                previous_wal.flush()
+                os.fsync(previous_wal.fileno())
+                previous_wal.close()
+
+            temporary_path = self._snapshot_path + '.tmp'
+            with open(temporary_path, 'w') as f:
+                json.dump(states, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary_path, self._snapshot_path)
+            os.remove(self._previous_wal_path)
+            logger.debug(f'wrote snapshot in {time.time() - start:.3f} s')
+
+    def _rotate_wal(self):
+        """
+        Moves the write ahead log to the previous log and opens a new log, must be called with the locks held.
+
+        Returns
+        -------
+        previous_wal :
+            The file of the previous log when it must still be synced and closed.
+        """
+        previous_wal = self._wal
+        if os.path.exists(self._previous_wal_path):
+            # the previous snapshot was not written, the records are kept until a snapshot is written
+            if previous_wal is not None:
+                previous_wal.close()
+                previous_wal = None
+            if os.path.exists(self._wal_path):
+                with open(self._wal_path) as f, open(self._previous_wal_path, 'a') as previous_f:
+                    shutil.copyfileobj(f, previous_f)
+                    previous_f.flush()
+                    os.fsync(previous_f.fileno())
+        elif os.path.exists(self._wal_path):
+            os.replace(self._wal_path, self._previous_wal_path)
+        else:
+            open(self._previous_wal_path, 'w').close()
+
+        self._wal = open(self._wal_path, 'w')
+        self._wal_size = 0
+        return previous_wal
+
+    def sync(self):
+        """
+        Writes all appended records to disk.
+        """
+        with self._wal_lock:
+            if self._sync_timer is not None:
+                self._sync_timer.cancel()
+                self._sync_timer = None
+            if not self._wal.closed:
+                self._wal.flush()
+                os.fsync(self._wal.fileno())
+
+    def delete(self, state: State):
+        super().delete(state)
+        self._append({'op': self.DELETE, 'key': state.key})
+
+    def update(self, state: State):
+        super().update(state)
+        self._append({'op': self.UPSERT, 'state': self._state_to_dict(state)})
+
+    def _create_state(self, *args, **kwargs) -> State:
+        state = super()._create_state(*args, **kwargs)
+        self._append({'op': self.UPSERT, 'state': self._state_to_dict(state)})
+        return state
+
+    def _replace_states(self, states_list: List[dict]):
+        super()._replace_states(states_list)
+        self._append({'op': self.RELOAD, 'states': self.export_states()})
+
+    def _append(self, record: dict):
+        line = json.dumps(record) + '\n'
+        with self._wal_lock:
+            self._wal.write(line)
+            self._wal_size += 1
+            if self._wal_size >= self._snapshot_size and self._snapshot_thread is None:
+                self._snapshot_thread = Thread(target=self._run_snapshot, name='snapshot', daemon=True)
+                self._snapshot_thread.start()
+            if self._sync_timer is None:
+                self._sync_timer = Timer(self._fsync_interval, self.sync)
+                self._sync_timer.daemon = True
+                self._sync_timer.start()
+
+    def _run_snapshot(self):
+        # noinspection PyBroadException
+        try:
+            self.snapshot()
+        except Exception:
+            logger.exception('could not write snapshot')
+        finally:
+            with self._wal_lock:
+                self._snapshot_thread = None
+
+    def _load(self) -> float:
+        """
+        Loads the snapshot and replays the write ahead log.
+
+        Returns
+        -------
+        load_time : float
+            The time in seconds it took to load the states.
+        """
+        start = time.time()
+        states: Dict[str, dict] = {}
+        if os.path.exists(self._snapshot_path):
+            with open(self._snapshot_path) as f:
+                for state_dict in json.load(f):
+                    states[state_dict['key']] = state_dict
+
+        records = 0
+        # the previous log is replayed on the snapshot it was rotated for, which has the same result when the
+        # snapshot was written already
+        for path in (self._previous_wal_path, self._wal_path):
+            if not os.path.exists(path):
+                continue
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # a partially written last record
+                        logger.warning(f'skipped invalid write ahead log record {line!r}')
+                        continue
+                    self._replay(states, record)
+                    records += 1
+
+        ordered_states_list, orphans = sort_states_list(list(states.values()))
+        if len(orphans) > 0:
+            logger.warning(f'{orphans} do not have valid parents and have not been loaded')
+        super()._replace_states(ordered_states_list)
+
+        load_time = time.time() - start
+        logger.info(f'loaded {len(self._states)} states and replayed {records} records in {load_time:.3f} s')
+        return load_time
+
+    def _replay(self, states: Dict[str, dict], record: Dict[str, Any]):
+        if record['op'] == self.UPSERT:
+            states[record['state']['key']] = record['state']
+        elif record['op'] == self.DELETE:
+            states.pop(record['key'], None)
+        elif record['op'] == self.RELOAD:
+            states.clear()
+            for state_dict in record['states']:
+                states[state_dict['key']] = state_dict
@@ -1,12 +1,21 @@
 #!/usr/bin/env python3
+import json
 import logging
+import sys
+import time
 
-from typing import Any, List, Optional
+from itertools import count
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple, TYPE_CHECKING
 from dataclasses import dataclass
+from threading import Lock, RLock, Timer
 from uuid import uuid4
 
 from homecon.core.event import IEventManager, Event
 
+if TYPE_CHECKING:
+    from homecon.core.states.value_log import IValueLog
+
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +25,8 @@ class StateEventsTypes:
     STATE_UPDATED = 'state_updated'
     STATE_DELETED = 'state_deleted'
     STATE_ADDED = 'state_added'
+    STATES_RELOADED = 'states_reloaded'
+    STATE_VALUES_CHANGED = 'state_values_changed'
 
 
 class InvalidEventException(Exception):
@@ -45,11 +56,43 @@ class StateValueChangedEvent:
             raise InvalidEventException from e
 
     def event_data(self) -> dict:
-        return {'state': self.state, 'old': self.old, 'new': self.state.value}
+        return {'state': self.state, 'old': self.old, 'new': self.state.value, 'version': self.state.version}
+
+    def fire(self, event_manager: IEventManager):
+        event_manager.fire(self.type, data=self.event_data(),
+                           source=self.source, target=self.target, reply_to=self.reply_to)
+
+
+@dataclass
+class StateValuesChangedEvent:
+    """
+    A batch of state value changes fired as a single event.
+    """
+    type = StateEventsTypes.STATE_VALUES_CHANGED
+    changes: List[StateValueChangedEvent]
+    source: Optional[str] = None
+    target: Optional[str] = None
+    reply_to: Optional[str] = None
+
+    @staticmethod
+    def from_event(event: Event) -> 'StateValuesChangedEvent':
+        if event.type != StateEventsTypes.STATE_VALUES_CHANGED:
+            raise InvalidEventException('invalid event type')
+
+        try:
+            return StateValuesChangedEvent(
+                [StateValueChangedEvent(change['state'], change['old'], event.source, event.target, event.reply_to)
+                 for change in event.data['changes']],
+                event.source, event.target, event.reply_to
+            )
+        except KeyError as e:
+            raise InvalidEventException from e
+
+    def event_data(self) -> dict:
+        return {'changes': [change.event_data() for change in self.changes]}
 
     def fire(self, event_manager: IEventManager):
-        event_manager.fire(self.type,
-                           data={'state': self.state, 'old': self.old, 'new': self.state.value},
+        event_manager.fire(self.type, data=self.event_data(),
                            source=self.source, target=self.target, reply_to=self.reply_to)
 
 
@@ -59,7 +102,38 @@ class TimestampedValue:
     value: Any
 
 
+def _intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
 class State:
+    """
+    A HomeCon state.
+
+    The config can be supplied json encoded through ``raw_config``, in which case it is only decoded when it is first
+    accessed. The type, quantity and unit strings are interned as they are shared by many states.
+
+    Values set through ``set_value`` can be filtered with the following config options, a filtered value is not stored,
+    not logged and does not fire a ``state_value_changed`` event:
+
+    - ``deadband``: numeric values differing less than this from the current value are filtered.
+    - ``relative_deadband``: numeric values differing less than this fraction of the current value are filtered.
+    - ``min_interval``: values set within this number of seconds after the last accepted value are deferred, the last
+      deferred value is set once the interval has passed.
+    - ``max_interval``: values set more than this number of seconds after the last accepted value are never filtered.
+
+    Every accepted value and every update increments the state ``version``, which allows detecting concurrent writes
+    with ``compare_and_set``. Versions are kept in memory and start at 0 when the states are loaded.
+
+    The result of ``serialize`` is cached until the state or one of its ancestors is changed.
+    """
+    __slots__ = ('_state_manager', '_event_manager', 'key', 'name', 'parent', '_type', '_quantity', '_unit', 'label',
+                 'description', 'log_key', '_config', '_raw_config', '_value', '_value_timestamp', '_version',
+                 '_serialized', '_deferred', '_deferred_timer')
 
     NO_LOGGING_KEY = ''
 
@@ -68,7 +142,7 @@ class State:
                  parent: 'State' = None,
                  type: str = None, quantity: str = None, unit: str = None, label: str = None, description: str = None,
                  log_key: Optional[str] = '',
-                 config: dict = None, value: Any = None):
+                 config: dict = None, value: Any = None, raw_config: Optional[str] = None):
         self._state_manager = state_manager
         self._event_manager = event_manager
         self.key = key
@@ -80,8 +154,63 @@ class State:
         self.label = label
         self.description = description
         self.log_key = str(uuid4()) if log_key is None else log_key
-        self.config = config or {}
+        self._config = None if raw_config is not None else config or {}
+        self._raw_config = raw_config
         self._value = value
+        self._value_timestamp: Optional[float] = None
+        self._version = 0
+        self._serialized: Optional[dict] = None
+        # the last value and source set within the min_interval, set by the timer once the interval has passed
+        self._deferred: Optional[Tuple[Any, Optional[str]]] = None
+        self._deferred_timer: Optional[Timer] = None
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @property
+    def type(self) -> Optional[str]:
+        return self._type
+
+    @type.setter
+    def type(self, type_: Optional[str]) -> None:
+        self._type = _intern(type_)
+
+    @property
+    def quantity(self) -> Optional[str]:
+        return self._quantity
+
+    @quantity.setter
+    def quantity(self, quantity: Optional[str]) -> None:
+        self._quantity = _intern(quantity)
+
+    @property
+    def unit(self) -> Optional[str]:
+        return self._unit
+
+    @unit.setter
+    def unit(self, unit: Optional[str]) -> None:
+        self._unit = _intern(unit)
+
+    @property
+    def config(self) -> dict:
+        if self._raw_config is not None:
+            self._config = json.loads(self._raw_config) or {}
+            self._raw_config = None
+        return self._config
+
+    @config.setter
+    def config(self, config: dict) -> None:
+        self._config = config
+        self._raw_config = None
+
+    def config_json(self) -> str:
+        """
+        Returns the json encoded config without decoding it when it was never accessed.
+        """
+        if self._raw_config is not None:
+            return self._raw_config
+        return json.dumps(self._config)
 
     def notify_created(self):
         self._event_manager.fire(StateEventsTypes.STATE_ADDED, data={'state': self})
@@ -90,7 +219,7 @@ class State:
         self._event_manager.fire(StateEventsTypes.STATE_DELETED, data={'state': self})
 
     def notify_updated(self):
-        self._event_manager.fire(StateEventsTypes.STATE_UPDATED, data={'state': self})
+        self._event_manager.fire(StateEventsTypes.STATE_UPDATED, data={'state': self, 'version': self._version})
 
     def notify_value_changed(self, old_val=None, source=None):
         StateValueChangedEvent(self, old_val, source=source).fire(self._event_manager)
@@ -104,47 +233,165 @@ class State:
         if self._value != val or self.config.get('force_change', False):
             self.set_value(val)
 
-    def set_value(self, val, source: str = None) -> None:
-        old_val = self._value
+    def set_value(self, val, source: str = None) -> bool:
+        """
+        Sets, stores and notifies a new value, returns ``False`` when the value was filtered or deferred.
+        """
+        with self._state_manager.state_lock(self):
+            old_val = self._value
+            if not self._apply_value(val, source=source):
+                return False
+            self._state_manager.update(self)
+            self.notify_value_changed(old_val=old_val, source=source)
+            return True
+
+    def compare_and_set(self, expected_version: int, val, source: str = None) -> bool:
+        """
+        Sets the value only when the state was not changed since ``expected_version``.
+
+        Parameters
+        ----------
+        expected_version :
+            The version of the state on which the new value is based.
+        val :
+            The new value.
+        source :
+            The source of the change.
+
+        Returns
+        -------
+        success : bool
+            ``False`` when the state version differs from the expected version or the value was filtered or deferred
+            by the config options, and the value was not set.
+        """
+        with self._state_manager.state_lock(self):
+            if self._version != expected_version:
+                return False
+            return self.set_value(val, source=source)
+
+    def _apply_value(self, val, source: Optional[str] = None) -> bool:
+        """
+        Sets the value without storing or notifying it, returns ``False`` when the value was filtered or deferred.
+        """
+        now = time.time()
+        delay = self._interval_delay(now)
+        if delay > 0:
+            self._defer_value(val, source, delay)
+            return False
+        if self._deferred_timer is not None:
+            # a value set after the interval replaces the deferred value
+            self._deferred_timer.cancel()
+            self._deferred_timer = None
+            self._deferred = None
+        if not self._accept_value(val, now):
+            return False
         self._value = val
-        self._state_manager.update(self)
-        self.notify_value_changed(old_val=old_val, source=source)
+        self._value_timestamp = now
+        self._version += 1
+        self._invalidate_serialized()
+        return True
+
+    def _interval_delay(self, now: float) -> float:
+        """
+        Returns the time in seconds until a value can be set according to the ``min_interval`` config option.
+        """
+        if self._value_timestamp is None:
+            return 0.
+        min_interval = self.config.get('min_interval')
+        if min_interval is None:
+            return 0.
+        return max(self._value_timestamp + min_interval - now, 0.)
+
+    def _defer_value(self, val, source: Optional[str], delay: float):
+        """
+        Keeps a value set within the min_interval to set it once the interval has passed, must be called with the
+        state lock held.
+        """
+        self._deferred = (val, source)
+        if self._deferred_timer is None:
+            self._deferred_timer = Timer(delay, self._set_deferred_value)
+            self._deferred_timer.daemon = True
+            self._deferred_timer.start()
+
+    def _set_deferred_value(self):
+        with self._state_manager.state_lock(self):
+            deferred = self._deferred
+            self._deferred = None
+            self._deferred_timer = None
+            if deferred is not None and self._state_manager.get(key=self.key) is self:
+                self.set_value(deferred[0], source=deferred[1])
+
+    def _accept_value(self, val, now: float) -> bool:
+        """
+        Checks a new value against the deadband and max interval config options.
+        """
+        if self._value_timestamp is None:
+            return True
+        config = self.config
+        deadband = config.get('deadband')
+        relative_deadband = config.get('relative_deadband')
+        max_interval = config.get('max_interval')
+        if deadband is None and relative_deadband is None:
+            return True
+
+        elapsed = now - self._value_timestamp
+        if max_interval is not None and elapsed >= max_interval:
+            return True
+        if _is_number(val) and _is_number(self._value):
+            difference = abs(val - self._value)
+            if deadband is not None and difference < deadband:
+                return False
+            if relative_deadband is not None and difference < relative_deadband * abs(self._value):
+                return False
+        return True
 
     def update(self, **kwargs) -> None:
-        old_value = None
-        notify_value_changed = False
-
-        if 'name' in kwargs:
-            self.name = kwargs['name']
-        if 'parent' in kwargs:
-            self.parent = kwargs['parent']
-        if 'type' in kwargs:
-            self.type = kwargs['type']
-        if 'quantity' in kwargs:
-            self.quantity = kwargs['quantity']
-        if 'unit' in kwargs:
-            self.unit = kwargs['unit']
-        if 'label' in kwargs:
-            self.label = kwargs['label']
-        if 'description' in kwargs:
-            self.description = kwargs['description']
-        if 'log_key' in kwargs:
-            self.log_key = kwargs['log_key']
-        if 'config' in kwargs:
-            self.config = kwargs['config']
-        if 'value' in kwargs:
-            old_value = self._value
-            self._value = kwargs['value']
-            notify_value_changed = True
-
-        self._state_manager.update(self)
-        self.notify_updated()
-        if notify_value_changed:
-            self.notify_value_changed(old_value)
+        with self._state_manager.state_lock(self):
+            old_value = None
+            notify_value_changed = False
+
+            if 'name' in kwargs:
+                self.name = kwargs['name']
+            if 'parent' in kwargs:
+                self.parent = kwargs['parent']
+            if 'type' in kwargs:
+                self.type = kwargs['type']
+            if 'quantity' in kwargs:
+                self.quantity = kwargs['quantity']
+            if 'unit' in kwargs:
+                self.unit = kwargs['unit']
+            if 'label' in kwargs:
+                self.label = kwargs['label']
+            if 'description' in kwargs:
+                self.description = kwargs['description']
+            if 'log_key' in kwargs:
+                self.log_key = kwargs['log_key']
+            if 'config' in kwargs:
+                self.config = kwargs['config']
+            if 'value' in kwargs:
+                old_value = self._value
+                self._value = kwargs['value']
+                self._value_timestamp = time.time()
+                notify_value_changed = True
+
+            self._version += 1
+            self._invalidate_serialized()
+            if 'name' in kwargs or 'parent' in kwargs:
+                # the paths of all descendants change
+                descendants = self._state_manager.children(self)
+                while len(descendants) > 0:
+                    for descendant in descendants:
+                        descendant._invalidate_serialized()
+                    descendants = [child for descendant in descendants
+                                   for child in self._state_manager.children(descendant)]
+            self._state_manager.update(self)
+            self.notify_updated()
+            if notify_value_changed:
+                self.notify_value_changed(old_value)
 
     @property
     def children(self) -> List['State']:
-        return [s for s in self._state_manager.all() if s.parent is not None and s.parent.key == self.key]
+        return self._state_manager.children(self)
 
     @property
     def path(self) -> str:
@@ -162,9 +409,23 @@ class State:
     def __repr__(self):
         return f'<State: {self.key}, name: {self.name}, value: {self.value}>'
 
-    def serialize(self):
+    def serialize(self) -> dict:
+        """
+        Returns the state as a dict which is cached and must not be modified.
+        """
+        serialized = self._serialized
+        if serialized is None:
+            with self._state_manager.state_lock(self):
+                serialized = self._serialized = self._serialize()
+        return serialized
+
+    def _invalidate_serialized(self):
+        self._serialized = None
+        self._state_manager.invalidate_state_list()
+
+    def _serialize(self) -> dict:
         return {
-            'key': self.key, 'name': self.name, 'path': self.path, 'value': self.value,
+            'key': self.key, 'name': self.name, 'path': self.path, 'value': self.value, 'version': self.version,
             'parent': None if self.parent is None else self.parent.key,
             'type': self.type, 'quantity': self.quantity, 'unit': self.unit, 'label': self.label,
             'description': self.description, 'log_key': self.log_key,
@@ -177,8 +438,57 @@ class CouldNotStoreStateException(Exception):
 
 
 class IStateManager:
-    def __init__(self, event_manager: IEventManager):
+    STATE_LOCK_STRIPES = 64
+
+    def __init__(self, event_manager: IEventManager, value_log: Optional['IValueLog'] = None):
         self.event_manager = event_manager
+        self._value_log = value_log
+        self._state_locks = [RLock() for _ in range(self.STATE_LOCK_STRIPES)]
+        self._state_list_versions = count(1)
+        self._state_list_version = 0
+        self._state_list: Tuple[int, List[dict]] = (-1, [])
+        self._state_list_lock = Lock()
+
+    def state_lock(self, state: State) -> RLock:
+        """
+        Returns the lock which serializes changes to a state.
+
+        States share a fixed number of locks based on the hash of their key.
+        """
+        return self._state_locks[hash(state.key) % self.STATE_LOCK_STRIPES]
+
+    @property
+    def state_list_version(self) -> int:
+        """
+        A number which changes every time a state is added, changed or deleted.
+        """
+        return self._state_list_version
+
+    def state_list(self) -> List[dict]:
+        """
+        Returns all serialized states.
+
+        The list is cached until a state is added, changed or deleted, after which it is rebuilt from the cached
+        serialized states so only the changed states are serialized again. The list must not be modified.
+        """
+        version, state_list = self._state_list
+        if version != self._state_list_version:
+            with self._state_list_lock:
+                version, state_list = self._state_list
+                if version != self._state_list_version:
+                    # a change during the rebuild increments the version, so the list is rebuilt again next time
+                    version = self._state_list_version
+                    state_list = [state.serialize() for state in self.all()]
+                    self._state_list = (version, state_list)
+        return state_list
+
+    def invalidate_state_list(self):
+        # a unique version is assigned as incrementing is not atomic
+        self._state_list_version = next(self._state_list_versions)
+
+    def stop(self):
+        if self._value_log is not None:
+            self._value_log.stop()
 
     def all(self) -> List[State]:
         raise NotImplementedError
@@ -189,6 +499,19 @@ class IStateManager:
     def find(self, expr: str) -> List[State]:
         raise NotImplementedError
 
+    def matches(self, expr: str, state: State) -> bool:
+        """
+        Returns ``True`` when the state is one of the states found with ``expr``.
+        """
+        return any(s.key == state.key for s in self.find(expr))
+
+    def children(self, state: Optional[State]) -> List[State]:
+        """
+        Returns the children of a state or the root states when state is ``None``.
+        """
+        parent_key = None if state is None else state.key
+        return [s for s in self.all() if (None if s.parent is None else s.parent.key) == parent_key]
+
     def exists(self, name: str, parent: Optional[State] = None):
         raise NotImplementedError
 
@@ -199,11 +522,58 @@ class IStateManager:
         raise NotImplementedError
 
     def delete(self, state: State):
+        self.invalidate_state_list()
         state.notify_deleted()
 
     def update(self, state: State):
         raise NotImplementedError
 
+    def set_values(self, values: Dict[State, Any], source: Optional[str] = None):
+        """
+        Sets the values of multiple states, stores them together and fires a single ``state_values_changed`` event.
+
+        Parameters
+        ----------
+        values :
+            A dict with states as keys and their new values as values.
+        source :
+            The source of the changes.
+        """
+        changes = []
+        for state, value in values.items():
+            with self.state_lock(state):
+                old_value = state.value
+                # noinspection PyProtectedMember
+                if state._apply_value(value, source=source):
+                    changes.append(StateValueChangedEvent(state, old_value, source=source))
+        if len(changes) == 0:
+            return
+
+        self._update_values([change.state for change in changes])
+        StateValuesChangedEvent(changes, source=source).fire(self.event_manager)
+
+    @contextmanager
+    def transaction(self, source: Optional[str] = None) -> Iterator[Dict[State, Any]]:
+        """
+        Context manager collecting state values which are set with ``set_values`` on exit.
+
+        Examples
+        --------
+        >>> with state_manager.transaction(source='myplugin') as values:
+        ...     values[state1] = 1
+        ...     values[state2] = 2
+        """
+        values = {}
+        yield values
+        self.set_values(values, source=source)
+
+    def _update_values(self, states: List[State]):
+        """
+        Stores the values of multiple states.
+        """
+        for state in states:
+            self.update(state)
+
     def add(self, name: str, parent: Optional[State] = None, parent_path: Optional[str] = None,
             type: Optional[str] = None, quantity: Optional[str] = None, unit: Optional[str] = None,
             label: Optional[str] = None, description: Optional[str] = None, log_key: Optional[str] = '',
@@ -225,6 +595,7 @@ class IStateManager:
         except CouldNotStoreStateException:
             pass
         else:
+            self.invalidate_state_list()
             state.notify_created()
             return state
 
@@ -232,48 +603,82 @@ class IStateManager:
         raise NotImplementedError
 
     def export_states(self) -> List[dict]:
-        states_list = []
-        for state in self.all():
-            dict_ = {
-                'key': state.key,
-                'name': state.name,
-                'parent': state.parent.key if state.parent is not None else None,
-                'type': state.type,
-                'quantity': state.quantity,
-                'unit': state.unit,
-                'label': state.label,
-                'description': state.description,
-                'config': state.config,
-                'value': state.value
-            }
-            if state.log_key != State.NO_LOGGING_KEY:
-                dict_['log_key'] = state.log_key
-            states_list.append(dict_)
-        return sorted(states_list, key=lambda x: len(x.get('parent_path') or ''))
+        # parents are exported before their children
+        ordered_states = []
+        level = self.children(None)
+        while len(level) > 0:
+            ordered_states.extend(level)
+            level = [child for state in level for child in self.children(state)]
+        exported_keys = {state.key for state in ordered_states}
+        ordered_states.extend(state for state in self.all() if state.key not in exported_keys)
+
+        return [self._state_to_dict(state) for state in ordered_states]
+
+    @staticmethod
+    def _state_to_dict(state: State) -> dict:
+        dict_ = {
+            'key': state.key,
+            'name': state.name,
+            'parent': state.parent.key if state.parent is not None else None,
+            'type': state.type,
+            'quantity': state.quantity,
+            'unit': state.unit,
+            'label': state.label,
+            'description': state.description,
+            'config': state.config,
+            'value': state.value
+        }
+        if state.log_key != State.NO_LOGGING_KEY:
+            dict_['log_key'] = state.log_key
+        return dict_
 
     def import_states(self, states_list: List[dict]):
-        old_states = list(self.all())
-        for state in old_states:
+        """
+        Replaces all states by the states in an exported states list.
+
+        A single ``states_reloaded`` event is fired instead of an event per deleted and added state.
+        """
+        ordered_states_list, orphans = sort_states_list(states_list)
+        if len(orphans) > 0:
+            logger.warning(f'{orphans} do not have valid parents and have not been added')
+
+        self._replace_states(ordered_states_list)
+        self.invalidate_state_list()
+        self.event_manager.fire(StateEventsTypes.STATES_RELOADED, data={})
+
+    def _replace_states(self, states_list: List[dict]):
+        """
+        Replaces all states by the states in a states list in which parents are listed before their children.
+        """
+        for state in list(self.all()):
             self.delete(state)
-
-        maximum_depth = 20
-        remaining_states = states_list
-        for i in range(maximum_depth):
-            if len(remaining_states) == 0:
-                break
-            new_remaining_states = []
-            for state_dict in remaining_states:
-                parent = None
-                parent_key = state_dict.get('parent')
-                if parent_key is not None:
-                    parent = self.get(key=parent_key)
-                    if parent is None:
-                        new_remaining_states.append(state_dict)
-                        continue
-
-                state_dict['parent'] = parent
-                self.add(**state_dict)
-            remaining_states = new_remaining_states
-
-        if len(remaining_states) > 0:
-            logger.warning(f'{remaining_states} do not have valid parents and have not been added')
+        for state_dict in states_list:
+            state_dict = dict(state_dict)
+            parent_key = state_dict.pop('parent', None)
+            self.add(**state_dict, parent=None if parent_key is None else self.get(key=parent_key))
+
+
+def sort_states_list(states_list: List[dict]) -> Tuple[List[dict], List[dict]]:
+    """
+    Sorts a list of state dicts so parents are listed before their children.
+
+    Returns
+    -------
+    ordered_states_list : list
+        The sorted states.
+    orphans : list
+        The states of which the parent is not in the list.
+    """
+    children = {}
+    for state_dict in states_list:
+        children.setdefault(state_dict.get('parent'), []).append(state_dict)
+
+    ordered_states_list = []
+    level = children.get(None, [])
+    while len(level) > 0:
+        ordered_states_list.extend(level)
+        level = [child for state_dict in level for child in children.get(state_dict['key'], [])]
+
+    ordered_keys = {state_dict['key'] for state_dict in ordered_states_list}
+    orphans = [state_dict for state_dict in states_list if state_dict['key'] not in ordered_keys]
+    return ordered_states_list, orphans
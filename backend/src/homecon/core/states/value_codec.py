@@ -0,0 +1,66 @@
+import json
+import math
+
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class ValueCodec:
+    """
+    Encodes state values for storage in a numeric and a text database column.
+
+    The default codec stores every value as json text. Values without a number are always decoded from the text
+    column, so values stored before a state type had a numeric codec remain readable.
+    """
+    def encode(self, value: Any) -> Tuple[Optional[float], Optional[str]]:
+        """
+        Returns
+        -------
+        number :
+            The value to store in the numeric column.
+        text :
+            The value to store in the text column.
+        """
+        return None, json.dumps(value)
+
+    def decode(self, number: Optional[float], text: Optional[str]) -> Any:
+        if number is not None:
+            return number
+        if text is None:
+            return None
+        return json.loads(text)
+
+
+class NumberValueCodec(ValueCodec):
+    """
+    Stores values of type ``type_`` in the numeric column and converts them to ``type_`` when decoding, other values
+    are stored as json text.
+
+    Values are not converted when they are set, so a value of another type, like ``21.5`` in an ``int`` state, is
+    stored as json text to be decoded unchanged. Integers which a float can not represent exactly and ``nan`` and
+    infinite floats, which the database can not store as a number, are stored as json text as well.
+    """
+    _MAX_EXACT_INT = 2 ** 53
+
+    def __init__(self, type_: Callable[[float], Any]):
+        self._type = type_
+
+    def encode(self, value: Any) -> Tuple[Optional[float], Optional[str]]:
+        if type(value) is not self._type:
+            return super().encode(value)
+        if self._type is int and abs(value) >= self._MAX_EXACT_INT:
+            return super().encode(value)
+        if self._type is float and not math.isfinite(value):
+            return super().encode(value)
+        return value, None
+
+    def decode(self, number: Optional[float], text: Optional[str]) -> Any:
+        if number is not None:
+            return self._type(number)
+        return super().decode(number, text)
+
+
+DEFAULT_VALUE_CODECS: Dict[str, ValueCodec] = {
+    'float': NumberValueCodec(float),
+    'int': NumberValueCodec(int),
+    'bool': NumberValueCodec(bool),
+}
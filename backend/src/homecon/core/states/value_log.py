@@ -0,0 +1,469 @@
+import bisect
+import hashlib
+import json
+import logging
+import os
+import re
+
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from homecon.core.states.state import TimestampedValue
+
+
+logger = logging.getLogger(__name__)
+
+
+class IValueLog:
+    """
+    Storage for the values log of states, identified by their log key.
+    """
+    def append(self, log_key: str, timestamp: float, value: Any) -> None:
+        raise NotImplementedError
+
+    def get(self, log_key: str, since: float, until: Optional[float] = None) -> List[TimestampedValue]:
+        """
+        Returns the logged values with ``since <= timestamp < until``, preceded by the last value before ``since``
+        when the first value in the range is logged after ``since``.
+        """
+        raise NotImplementedError
+
+    def stop(self) -> None:
+        pass
+
+
+class ValueKinds:
+    NONE = 0
+    FLOAT = 1
+    INT = 2
+    BOOL = 3
+    JSON = 4
+
+
+class ColumnarValueLog(IValueLog):
+    """
+    Values log which stores the values of every log key in append-only columnar segments on disk.
+
+    Every segment consists of a float64 timestamps column, a float64 values column and a uint8 column with the kind of
+    each value. Numeric and boolean values are stored in the values column directly, other values are appended as
+    json to a separate file of which the offset is stored in the values column. Segments are memory-mapped when read,
+    so range queries only touch the pages they need.
+
+    The number of complete rows of every segment is kept in memory and reads are limited to it, so a read during an
+    append never sees a partially appended row. When the process stops while appending a row, the columns which are
+    longer than the others are truncated when the segment is loaded.
+
+    The segments of a log key are stored in a folder named after the log key, or after its hash when the log key is not
+    a safe file name. The append files of the most recently appended log keys are kept open and the most recently read
+    columns are kept memory-mapped, both are bounded to limit the number of open file descriptors.
+
+    Parameters
+    ----------
+    folder :
+        The folder in which the segments are stored.
+    segment_size :
+        The number of values after which a new segment is started.
+    max_open_logs :
+        The maximum number of log keys of which the append files are kept open.
+    max_memmaps :
+        The maximum number of memory-mapped columns which are kept open.
+    """
+    TIMESTAMPS = 'timestamps'
+    VALUES = 'values'
+    KINDS = 'kinds'
+    JSON = 'json'
+
+    _DTYPES = {TIMESTAMPS: np.float64, VALUES: np.float64, KINDS: np.uint8}
+    _MAX_EXACT_INT = 2 ** 53
+    _SAFE_LOG_KEY = re.compile(r'[A-Za-z0-9-][A-Za-z0-9_.-]{0,127}')
+
+    def __init__(self, folder: str, segment_size: int = 2 ** 16, max_open_logs: int = 64, max_memmaps: int = 256):
+        self._folder = folder
+        self._segment_size = segment_size
+        self._max_open_logs = max_open_logs
+        self._max_memmaps = max_memmaps
+        self._lock = Lock()
+        self._segments: Dict[str, List[float]] = {}
+        # the number of complete rows of every segment
+        self._lengths: Dict[str, List[int]] = {}
+        self._last_timestamps: Dict[str, float] = {}
+        # the most recently read columns, ordered from least to most recently used
+        self._memmaps: 'OrderedDict[str, Tuple[int, np.memmap]]' = OrderedDict()
+        self._memmaps_lock = Lock()
+        # the files of the last segment of the most recently appended log keys, kept open for appending
+        self._files: 'OrderedDict[str, Dict[str, BinaryIO]]' = OrderedDict()
+        os.makedirs(folder, exist_ok=True)
+
+    def append(self, log_key: str, timestamp: float, value: Any) -> None:
+        with self._lock:
+            segment_starts = self._get_segment_starts(log_key)
+            # timestamps must be sorted for the range queries, so a clock going backwards is clamped
+            timestamp = max(timestamp, self._last_timestamps.get(log_key, timestamp))
+            lengths = self._lengths[log_key]
+            if len(segment_starts) == 0 or lengths[-1] >= self._segment_size:
+                segment_starts.append(timestamp)
+                lengths.append(0)
+                self._close_files(log_key)
+
+            segment = len(segment_starts) - 1
+            files = self._get_files(log_key, segment)
+            kind, number = self._encode(files[self.JSON], value)
+
+            files[self.TIMESTAMPS].write(np.array([timestamp], dtype=np.float64).tobytes())
+            files[self.VALUES].write(np.array([number], dtype=np.float64).tobytes())
+            files[self.KINDS].write(np.array([kind], dtype=np.uint8).tobytes())
+            lengths[-1] += 1
+            self._last_timestamps[log_key] = timestamp
+
+    def stop(self) -> None:
+        with self._lock:
+            for log_key in list(self._files):
+                self._close_files(log_key)
+
+    def get(self, log_key: str, since: float, until: Optional[float] = None) -> List[TimestampedValue]:
+        timestamps, values, kinds, segments = self._get_range(log_key, since, until)
+        timeseries = [
+            TimestampedValue(float(timestamp), self._decode(log_key, int(segment), int(kind), float(number)))
+            for timestamp, number, kind, segment in zip(timestamps, values, kinds, segments)
+        ]
+
+        if len(timeseries) > 0 and timeseries[0].timestamp > since:
+            # the last value before since is in the last segment starting before since
+            with self._lock:
+                segment = bisect.bisect_left(self._get_segment_starts(log_key), since) - 1
+                length = self._lengths[log_key][segment] if segment >= 0 else 0
+            if segment >= 0:
+                timestamps = self._read_column(log_key, segment, self.TIMESTAMPS)[:length]
+                index = int(np.searchsorted(timestamps, since, side='left'))
+                timestamp = timestamps[index - 1]
+                number = self._read_column(log_key, segment, self.VALUES)[index - 1]
+                kind = self._read_column(log_key, segment, self.KINDS)[index - 1]
+                timeseries.insert(0, TimestampedValue(
+                    float(timestamp), self._decode(log_key, segment, int(kind), float(number))))
+        return timeseries
+
+    def get_arrays(self, log_key: str, since: float, until: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns the timestamps, values and kinds columns with ``since <= timestamp < until``.
+
+        The arrays are views on the memory-mapped segments when the range lies within a single segment. Values of kind
+        ``ValueKinds.JSON`` contain the offset of the json encoded value instead of the value itself.
+        """
+        timestamps, values, kinds, _ = self._get_range(log_key, since, until)
+        return timestamps, values, kinds
+
+    def size(self, log_key: str) -> int:
+        """
+        Returns the number of bytes used on disk by the values log of a log key.
+        """
+        folder = self._log_folder(log_key)
+        if not os.path.isdir(folder):
+            return 0
+        return sum(os.path.getsize(os.path.join(folder, file_name)) for file_name in os.listdir(folder))
+
+    def _get_range(self, log_key: str, since: float, until: Optional[float]):
+        with self._lock:
+            segment_starts = list(self._get_segment_starts(log_key))
+            lengths = list(self._lengths[log_key])
+
+        # the last segment starting at or before since contains the first value in the range and the previous value
+        first_segment = max(bisect.bisect_right(segment_starts, since) - 1, 0)
+        last_segment = len(segment_starts) if until is None else bisect.bisect_left(segment_starts, until)
+
+        columns = {self.TIMESTAMPS: [], self.VALUES: [], self.KINDS: []}
+        segments = []
+        for segment in range(first_segment, last_segment):
+            # rows appended after the lengths were taken are ignored, as their columns may not all be written yet
+            timestamps = self._read_column(log_key, segment, self.TIMESTAMPS)[:lengths[segment]]
+            start = int(np.searchsorted(timestamps, since, side='left'))
+            end = len(timestamps) if until is None else int(np.searchsorted(timestamps, until, side='left'))
+            if end <= start:
+                continue
+            for column in columns:
+                columns[column].append(self._read_column(log_key, segment, column)[start:end])
+            segments.append(np.full(end - start, segment, dtype=np.int64))
+
+        if len(segments) == 0:
+            empty = np.empty(0, dtype=np.float64)
+            return empty, empty, np.empty(0, dtype=np.uint8), np.empty(0, dtype=np.int64)
+        if len(segments) == 1:
+            return columns[self.TIMESTAMPS][0], columns[self.VALUES][0], columns[self.KINDS][0], segments[0]
+        return (np.concatenate(columns[self.TIMESTAMPS]), np.concatenate(columns[self.VALUES]),
+                np.concatenate(columns[self.KINDS]), np.concatenate(segments))
+
+    def _get_segment_starts(self, log_key: str) -> List[float]:
+        """
+        Returns the start timestamps of the segments of a log key, loading them when needed, must be called with the
+        lock held.
+        """
+        segment_starts = self._segments.get(log_key)
+        if segment_starts is None:
+            segment_starts = []
+            lengths = []
+            folder = self._log_folder(log_key)
+            if os.path.isdir(folder):
+                segments = sorted(int(m.group(1)) for m in
+                                  (re.match(r'(\d+)\.{}$'.format(self.TIMESTAMPS), f) for f in os.listdir(folder))
+                                  if m is not None)
+                for segment in segments:
+                    length = self._repair_segment(log_key, segment)
+                    if length > 0:
+                        timestamps = self._read_column(log_key, segment, self.TIMESTAMPS)
+                        segment_starts.append(float(timestamps[0]))
+                        lengths.append(length)
+                        self._last_timestamps[log_key] = float(timestamps[length - 1])
+            self._segments[log_key] = segment_starts
+            self._lengths[log_key] = lengths
+        return segment_starts
+
+    def _repair_segment(self, log_key: str, segment: int) -> int:
+        """
+        Truncates the columns of a segment to the number of complete rows, which differ when the process stopped
+        while appending a row.
+
+        Returns
+        -------
+        length : int
+            The number of complete rows.
+        """
+        sizes = {}
+        for column in self._DTYPES:
+            path = self._path(log_key, segment, column)
+            sizes[column] = os.path.getsize(path) if os.path.exists(path) else 0
+        length = min(size // np.dtype(self._DTYPES[column]).itemsize for column, size in sizes.items())
+        for column, size in sizes.items():
+            complete_size = length * np.dtype(self._DTYPES[column]).itemsize
+            if size > complete_size:
+                logger.warning(f'truncated incomplete rows of the {column} column of segment {segment} of {log_key}')
+                os.truncate(self._path(log_key, segment, column), complete_size)
+        return length
+
+    def _get_files(self, log_key: str, segment: int) -> Dict[str, BinaryIO]:
+        """
+        Returns the open files of the last segment of a log key, must be called with the lock held.
+        """
+        files = self._files.get(log_key)
+        if files is None:
+            os.makedirs(self._log_folder(log_key), exist_ok=True)
+            # unbuffered, so the appended rows can be read through the memory maps right away
+            files = {column: open(self._path(log_key, segment, column), 'ab', buffering=0)
+                     for column in [self.TIMESTAMPS, self.VALUES, self.KINDS, self.JSON]}
+            self._files[log_key] = files
+            while len(self._files) > self._max_open_logs:
+                self._close_files(next(iter(self._files)))
+        else:
+            self._files.move_to_end(log_key)
+        return files
+
+    def _close_files(self, log_key: str):
+        for f in self._files.pop(log_key, {}).values():
+            f.close()
+
+    def _log_folder(self, log_key: str) -> str:
+        """
+        Returns the folder of a log key, log keys which are not a safe file name are hashed so they can not point
+        outside the folder of the values log.
+        """
+        if self._SAFE_LOG_KEY.fullmatch(log_key) is None:
+            # hashed folder names start with an underscore, which safe log keys can not
+            log_key = '_' + hashlib.sha256(log_key.encode('utf-8')).hexdigest()
+        return os.path.join(self._folder, log_key)
+
+    def _path(self, log_key: str, segment: int, column: str) -> str:
+        return os.path.join(self._log_folder(log_key), '{:08d}.{}'.format(segment, column))
+
+    def _read_column(self, log_key: str, segment: int, column: str) -> np.ndarray:
+        path = self._path(log_key, segment, column)
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            size = 0
+        if size == 0:
+            return np.empty(0, dtype=self._DTYPES[column])
+
+        with self._memmaps_lock:
+            cached = self._memmaps.get(path)
+            if cached is None or cached[0] != size:
+                cached = (size, np.memmap(path, dtype=self._DTYPES[column], mode='r'))
+                self._memmaps[path] = cached
+                # an evicted memory map is closed once the arrays returned from it are no longer used
+                while len(self._memmaps) > self._max_memmaps:
+                    self._memmaps.popitem(last=False)
+            else:
+                self._memmaps.move_to_end(path)
+            return cached[1]
+
+    def _encode(self, json_file: BinaryIO, value: Any) -> Tuple[int, float]:
+        if value is None:
+            return ValueKinds.NONE, 0.
+        if isinstance(value, bool):
+            return ValueKinds.BOOL, float(value)
+        if isinstance(value, int) and abs(value) < self._MAX_EXACT_INT:
+            return ValueKinds.INT, float(value)
+        if isinstance(value, float):
+            return ValueKinds.FLOAT, value
+
+        offset = json_file.tell()
+        json_file.write(json.dumps(value).encode('utf-8') + b'\n')
+        return ValueKinds.JSON, float(offset)
+
+    def _decode(self, log_key: str, segment: int, kind: int, number: float) -> Any:
+        if kind == ValueKinds.FLOAT:
+            return number
+        if kind == ValueKinds.INT:
+            return int(number)
+        if kind == ValueKinds.BOOL:
+            return bool(number)
+        if kind == ValueKinds.JSON:
+            with open(self._path(log_key, segment, self.JSON), 'rb') as f:
+                f.seek(int(number))
+                return json.loads(f.readline().decode('utf-8'))
+        return None
+
+
+class ValuesRingBuffer:
+    """
+    Array backed ring buffer of timestamped values, sorted by timestamp.
+
+    Timestamps are stored in a numpy array so range lookups are a binary search. The buffer grows by doubling its
+    capacity until ``max_count`` is reached, after which the oldest values are overwritten. Appends and reads are
+    serialized by a lock per buffer.
+
+    Parameters
+    ----------
+    max_count :
+        The maximum number of values to keep, unbounded if ``None``.
+    max_age :
+        The maximum age in seconds of the kept values relative to the last appended value, unbounded if ``None``.
+    """
+    INITIAL_CAPACITY = 16
+
+    def __init__(self, max_count: Optional[int] = None, max_age: Optional[float] = None):
+        self._max_count = max_count
+        self._max_age = max_age
+        capacity = self.INITIAL_CAPACITY if max_count is None else min(self.INITIAL_CAPACITY, max_count)
+        self._timestamps = np.empty(capacity, dtype=np.float64)
+        self._values: List[Any] = [None] * capacity
+        self._start = 0
+        self._count = 0
+        self._lock = Lock()
+
+    def __len__(self):
+        return self._count
+
+    def append(self, timestamp: float, value: Any) -> None:
+        with self._lock:
+            self._append(timestamp, value)
+
+    def _append(self, timestamp: float, value: Any) -> None:
+        if self._count > 0:
+            # timestamps must be sorted for the range queries, so a clock going backwards is clamped
+            timestamp = max(timestamp, self._timestamps[self._physical(self._count - 1)])
+
+        capacity = len(self._timestamps)
+        if self._count == capacity:
+            if self._max_count is None or capacity < self._max_count:
+                self._grow(capacity * 2 if self._max_count is None else min(capacity * 2, self._max_count))
+            else:
+                self._start = (self._start + 1) % capacity
+                self._count -= 1
+
+        index = self._physical(self._count)
+        self._timestamps[index] = timestamp
+        self._values[index] = value
+        self._count += 1
+
+        if self._max_age is not None:
+            while self._count > 1 and self._timestamps[self._start] < timestamp - self._max_age:
+                self._values[self._start] = None
+                self._start = (self._start + 1) % len(self._timestamps)
+                self._count -= 1
+
+    def last(self) -> Optional[TimestampedValue]:
+        with self._lock:
+            if self._count == 0:
+                return None
+            index = self._physical(self._count - 1)
+            return TimestampedValue(float(self._timestamps[index]), self._values[index])
+
+    def get(self, since: float, until: Optional[float] = None) -> List[TimestampedValue]:
+        with self._lock:
+            return self._get(since, until=until)
+
+    def _get(self, since: float, until: Optional[float] = None) -> List[TimestampedValue]:
+        start = self._search(since)
+        end = self._count if until is None else self._search(until)
+        if start > 0 and start < end and self._timestamps[self._physical(start)] > since:
+            # include the previous value
+            start -= 1
+        return [TimestampedValue(float(self._timestamps[i]), self._values[i])
+                for i in (self._physical(j) for j in range(start, end))]
+
+    def _physical(self, index: int) -> int:
+        return (self._start + index) % len(self._timestamps)
+
+    def _search(self, timestamp: float) -> int:
+        """
+        Returns the logical index of the first value with a timestamp larger than or equal to the given timestamp.
+        """
+        capacity = len(self._timestamps)
+        end = self._start + self._count
+        if end <= capacity:
+            return int(np.searchsorted(self._timestamps[self._start:end], timestamp, side='left'))
+        first = self._timestamps[self._start:]
+        index = int(np.searchsorted(first, timestamp, side='left'))
+        if index < len(first):
+            return index
+        return len(first) + int(np.searchsorted(self._timestamps[:end - capacity], timestamp, side='left'))
+
+    def _grow(self, capacity: int) -> None:
+        order = [self._physical(i) for i in range(self._count)]
+        timestamps = np.empty(capacity, dtype=np.float64)
+        timestamps[:self._count] = self._timestamps[order]
+        values = [self._values[i] for i in order] + [None] * (capacity - self._count)
+        self._timestamps = timestamps
+        self._values = values
+        self._start = 0
+
+
+class MemoryValueLog(IValueLog):
+    """
+    Values log which keeps the values of every log key in a bounded in-memory ring buffer.
+
+    Parameters
+    ----------
+    max_count :
+        The maximum number of values kept per log key, unbounded if ``None``.
+    max_age :
+        The maximum age in seconds of the values kept per log key, unbounded if ``None``.
+    """
+    def __init__(self, max_count: Optional[int] = None, max_age: Optional[float] = None):
+        self._max_count = max_count
+        self._max_age = max_age
+        self._buffers: Dict[str, ValuesRingBuffer] = {}
+        self._lock = Lock()
+
+    def append(self, log_key: str, timestamp: float, value: Any) -> None:
+        buffer = self._buffers.get(log_key)
+        if buffer is None:
+            with self._lock:
+                buffer = self._buffers.get(log_key)
+                if buffer is None:
+                    buffer = ValuesRingBuffer(max_count=self._max_count, max_age=self._max_age)
+                    self._buffers[log_key] = buffer
+        buffer.append(timestamp, value)
+
+    def get(self, log_key: str, since: float, until: Optional[float] = None) -> List[TimestampedValue]:
+        buffer = self._buffers.get(log_key)
+        if buffer is None:
+            return []
+        return buffer.get(since, until=until)
+
+    def last(self, log_key: str) -> Optional[TimestampedValue]:
+        buffer = self._buffers.get(log_key)
+        if buffer is None:
+            return None
+        return buffer.last()
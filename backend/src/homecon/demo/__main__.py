@@ -9,8 +9,7 @@ from homecon.core.event import EventManager
 from homecon.core.pages.pages import IPagesManager, MemoryPagesManager
 from homecon.core.plugins.plugin import MemoryPluginManager
 
-from homecon.homecon import HomeCon
-from concurrent.futures import ThreadPoolExecutor
+from homecon.homecon import HomeCon, KeyedExecutor
 
 from homecon.plugins.websocket.websocket import Websocket
 from homecon.plugins.states.states import States
@@ -121,7 +120,7 @@ def get_homecon():
         token = f.read().splitlines()[0]
 
     event_manager = EventManager()
-    state_manager = MemoryStateManager(event_manager=event_manager)
+    state_manager = MemoryStateManager(event_manager=event_manager, max_log_age=7 * 24 * 3600)
     pages_manager = MemoryPagesManager()
 
     create_states(state_manager)
@@ -138,7 +137,7 @@ def get_homecon():
         'openweathermap': OpenWeatherMap(state_manager),
         'timeseries': TimeSeries(event_manager, state_manager),
     })
-    executor = ThreadPoolExecutor(max_workers=10)
+    executor = KeyedExecutor(max_workers=10)
 
-    homecon = HomeCon(event_manager, plugin_manager, executor)
+    homecon = HomeCon(event_manager, plugin_manager, executor, state_manager=state_manager)
     return homecon
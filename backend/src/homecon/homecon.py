@@ -1,11 +1,17 @@
 #!/usr/bin/env python3
+import asyncio
 import time
 import logging
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Condition, Lock, Thread
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional, Tuple
 
 from homecon.__version__ import version as __version__
-from homecon.core.event import Event, IEventManager, NoEventError
-from homecon.core.plugins.plugin import IPluginManager
+from homecon.core.event import AsyncEventManager, Event, IEventManager, NoEventError
+from homecon.core.plugins.plugin import IPlugin, IPluginManager
+from homecon.core.states.state import IStateManager
 
 
 logger = logging.getLogger(__name__)
@@ -15,14 +21,141 @@ class IExecutor:
     def submit(self, fn, *args, **kwargs):
         raise NotImplementedError
 
+    def submit_keyed(self, key: Hashable, fn, *args, **kwargs):
+        """
+        Submits a function which must be run after all functions previously submitted with the same key.
+        """
+        self.submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait: bool = True):
+        pass
+
 
 class SyncExecutor(IExecutor):
     def submit(self, fn, *args, **kwargs):
         fn(*args, **kwargs)
 
 
+class KeyedExecutor(IExecutor):
+    """
+    Executor running functions in parallel in a pool of threads, while functions submitted with the same key are run
+    one after the other in the order they were submitted.
+
+    Every key has its own queue of functions. The queues with pending functions take turns, a worker runs a single
+    function of a queue after which the queue is put back at the end of the line.
+
+    Parameters
+    ----------
+    max_workers :
+        The number of threads running functions.
+    max_partition_size :
+        The maximum number of pending functions of a key, submitting blocks while the queue of the key is full.
+    """
+    def __init__(self, max_workers: int = 4, max_partition_size: int = 1000):
+        self._max_partition_size = max_partition_size
+        self._lock = Lock()
+        self._work_available = Condition(self._lock)
+        self._space_available = Condition(self._lock)
+        # the queues of the keys which have pending or running functions
+        self._partitions: Dict[Hashable, Deque[Tuple[Callable, tuple, dict]]] = {}
+        self._ready: Deque[Hashable] = deque()
+        self._running = True
+
+        self._submitted_count = 0
+        self._completed_count = 0
+        self._failed_count = 0
+        self._blocked_count = 0
+        self._max_partition_depth = 0
+
+        self._workers = [Thread(target=self._work, name=f'executor-{i}', daemon=True) for i in range(max_workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, fn, *args, **kwargs):
+        # functions without a key are not ordered
+        self.submit_keyed(object(), fn, *args, **kwargs)
+
+    def submit_keyed(self, key: Hashable, fn, *args, **kwargs):
+        with self._lock:
+            if not self._running:
+                raise RuntimeError('cannot submit to an executor which is shut down')
+            partition = self._partitions.get(key)
+            if partition is not None and len(partition) >= self._max_partition_size:
+                self._blocked_count += 1
+                while partition is not None and len(partition) >= self._max_partition_size:
+                    self._space_available.wait()
+                    partition = self._partitions.get(key)
+
+            self._submitted_count += 1
+            if partition is None:
+                partition = self._partitions[key] = deque()
+                self._ready.append(key)
+                self._work_available.notify()
+            partition.append((fn, args, kwargs))
+            self._max_partition_depth = max(self._max_partition_depth, len(partition))
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stops the workers after all pending functions have been run.
+        """
+        with self._lock:
+            self._running = False
+            self._work_available.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+    def statistics(self) -> Dict[str, Any]:
+        """
+        Returns the number of submitted, completed, failed and pending functions, the number of keys with pending
+        functions, the maximum number of pending functions of a key and the number of submits which blocked.
+        """
+        with self._lock:
+            return {
+                'submitted': self._submitted_count,
+                'completed': self._completed_count,
+                'failed': self._failed_count,
+                'pending': sum(len(partition) for partition in self._partitions.values()),
+                'partitions': len(self._partitions),
+                'max_partition_depth': self._max_partition_depth,
+                'blocked': self._blocked_count,
+            }
+
+    def _work(self):
+        while True:
+            with self._lock:
+                while len(self._ready) == 0 and self._running:
+                    self._work_available.wait()
+                if len(self._ready) == 0:
+                    return
+                key = self._ready.popleft()
+                # the function is not removed from the queue until it is done so no other worker takes the key
+                fn, args, kwargs = self._partitions[key][0]
+
+            # noinspection PyBroadException
+            try:
+                fn(*args, **kwargs)
+                failed = False
+            except Exception:
+                logger.exception(f'error in {fn}')
+                failed = True
+
+            with self._lock:
+                self._completed_count += 1
+                self._failed_count += failed
+                partition = self._partitions[key]
+                partition.popleft()
+                if len(partition) > 0:
+                    self._ready.append(key)
+                    self._work_available.notify()
+                else:
+                    del self._partitions[key]
+                self._space_available.notify_all()
+
+
 class HomeCon:
-    def __init__(self, event_manager: IEventManager, plugin_manager: IPluginManager, executor: IExecutor):
+    def __init__(self, event_manager: IEventManager, plugin_manager: IPluginManager, executor: IExecutor,
+                 state_manager: Optional[IStateManager] = None):
         """
         Create a new HomeCon object
         """
@@ -33,6 +166,8 @@ class HomeCon:
         self._event_manager = event_manager
         self._plugin_manager = plugin_manager
         self._executor = executor
+        self._state_manager = state_manager
+        self._subscribers: Dict[str, List[IPlugin]] = {}
 
         self.__version__ = __version__
         logger.info('HomeCon object Initialized')
@@ -42,10 +177,65 @@ class HomeCon:
         return self._running
 
     def handle_event(self, event: Event):
+        """
+        Passes an event to the plugins subscribed to its type.
+        """
         target_plugin = event.target.split('/')[0] if event.target is not None else None
-        for plugin in self._plugin_manager.values():
+        for plugin in self._get_subscribers(event.type):
             if target_plugin is None or target_plugin == plugin.name:
-                self._executor.submit(plugin.handle_event, event)
+                self._submit((plugin.name, self._partition_key(event)), plugin.handle_event, event)
+
+    def handle_events(self, events: List[Event]):
+        """
+        Passes a batch of events to the plugins subscribed to their types, every plugin gets its events of a state in
+        order as a single batch.
+        """
+        for key, (plugin, events) in self._partition_events(events).items():
+            self._submit(key, plugin.handle_events, events)
+
+    def _partition_events(self, events: List[Event]) -> Dict[Tuple[str, Optional[str]], Tuple[IPlugin, List[Event]]]:
+        """
+        Splits a batch of events in the events of a state per subscribed plugin.
+        """
+        partition_events: Dict[Tuple[str, Optional[str]], Tuple[IPlugin, List[Event]]] = {}
+        for event in events:
+            target_plugin = event.target.split('/')[0] if event.target is not None else None
+            partition_key = self._partition_key(event)
+            for plugin in self._get_subscribers(event.type):
+                if target_plugin is None or target_plugin == plugin.name:
+                    partition_events.setdefault((plugin.name, partition_key), (plugin, []))[1].append(event)
+        return partition_events
+
+    def _submit(self, key: Tuple[str, Optional[str]], fn, *args):
+        # executors which are not an IExecutor, like a concurrent.futures.ThreadPoolExecutor, are not ordered
+        if isinstance(self._executor, IExecutor):
+            self._executor.submit_keyed(key, fn, *args)
+        else:
+            self._executor.submit(fn, *args)
+
+    @staticmethod
+    def _partition_key(event: Event) -> Optional[str]:
+        """
+        Returns the key of the state of an event, events of a state are handled in order by every plugin.
+        """
+        state = event.data.get('state') if isinstance(event.data, dict) else None
+        return getattr(state, 'key', None)
+
+    def _get_subscribers(self, event_type: str) -> List[IPlugin]:
+        subscribers = self._subscribers.get(event_type)
+        if subscribers is None:
+            plugins = list(self._plugin_manager.values())
+            subscribers = [plugin for plugin in plugins
+                           if plugin.subscribed_event_types is None or event_type in plugin.subscribed_event_types]
+            if all(plugin.ready for plugin in plugins):
+                self._subscribers[event_type] = subscribers
+        return subscribers
+
+    def update_subscriptions(self):
+        """
+        Clears the subscriptions registry, must be called when the event types a plugin subscribes to change.
+        """
+        self._subscribers = {}
 
     def get_and_handle_event(self):
         try:
@@ -56,13 +246,21 @@ class HomeCon:
         else:
             self.handle_event(event)
 
+    def get_and_handle_events(self):
+        try:
+            events = self._event_manager.get_batch()
+        except NoEventError:
+            pass
+        else:
+            self.handle_events(events)
+
     def run(self):
         """
         Listen for events in all plugins
         """
         while self._running:
             try:
-                self.get_and_handle_event()
+                self.get_and_handle_events()
             except Exception:
                 logger.exception('exception while running')
 
@@ -79,6 +277,122 @@ class HomeCon:
     def stop(self):
         logger.info('Stopping HomeCon')
 
-        self._plugin_manager.stop()
         self._running = False
+        self._event_manager.interrupt()
+        self._plugin_manager.stop()
+        self._shutdown()
+        logger.info(f'event statistics: {self._event_manager.statistics()}')
         logger.info('HomeCon stopped')
+
+    def _shutdown(self):
+        """
+        Waits for the running handlers and stops the state manager, which must be last as handlers change states.
+        """
+        if isinstance(self._executor, IExecutor):
+            self._executor.shutdown()
+        if self._state_manager is not None:
+            self._state_manager.stop()
+
+
+class AsyncHomeCon(HomeCon):
+    """
+    HomeCon running its core loop in an asyncio loop, which can be shared with plugins like the websocket server.
+
+    Events of the ``AsyncEventManager`` are handled in tasks in the loop. Coroutine listeners and the listeners of
+    plugins of which the listeners do not block are run in the loop, other listeners are run in a pool of threads. As
+    in the ``HomeCon``, every plugin handles the events of a state in order, while other events are handled
+    concurrently.
+
+    Parameters
+    ----------
+    max_workers :
+        The number of threads running blocking listeners.
+    max_pending :
+        The maximum number of batches of events which are not handled yet, no events are taken from the event manager
+        while there are more.
+    """
+    def __init__(self, event_manager: AsyncEventManager, plugin_manager: IPluginManager,
+                 state_manager: Optional[IStateManager] = None, max_workers: int = 4, max_pending: int = 1000):
+        super().__init__(event_manager, plugin_manager, ThreadPoolExecutor(max_workers=max_workers),
+                         state_manager=state_manager)
+        self._max_pending = max_pending
+        self._pending: Optional[asyncio.Semaphore] = None
+        # the last task of every partition, which the next task of the partition waits for
+        self._tails: Dict[Tuple[str, Optional[str]], asyncio.Task] = {}
+        self._event_handling_started = False
+
+    def start(self):
+        self._running = True
+        logger.info('Starting HomeCon')
+        asyncio.run(self.run_async())
+
+    async def run_async(self):
+        """
+        Starts the plugins and handles events until HomeCon is stopped, must be run in the asyncio loop.
+        """
+        self._running = True
+        self._pending = asyncio.Semaphore(self._max_pending)
+        self._event_manager.start()
+        logger.debug('Starting plugins')
+        await self._plugin_manager.start_async()
+
+        logger.debug('Starting event handling')
+        self._event_handling_started = True
+        try:
+            while self._running:
+                try:
+                    events = await self._event_manager.get_batch_async()
+                except NoEventError:
+                    continue
+                try:
+                    await self.handle_events_async(events)
+                except Exception:
+                    logger.exception('exception while running')
+        finally:
+            if len(self._tails) > 0:
+                await asyncio.wait(list(self._tails.values()))
+            self._executor.shutdown(wait=True)
+            if self._state_manager is not None:
+                self._state_manager.stop()
+
+    def _shutdown(self):
+        # once started, run_async handles the pending tasks and stops the state manager when it returns
+        if not self._event_handling_started and self._state_manager is not None:
+            self._state_manager.stop()
+
+    async def handle_events_async(self, events: List[Event]):
+        """
+        Creates a task handling the events of a state for every subscribed plugin, waits while there are too many
+        pending tasks.
+        """
+        for key, (plugin, partition) in self._partition_events(events).items():
+            await self._pending.acquire()
+            task = asyncio.create_task(self._handle_partition(self._tails.get(key), plugin, partition))
+            self._tails[key] = task
+            task.add_done_callback(lambda done, key_=key: self._task_done(key_, done))
+
+    def _task_done(self, key: Tuple[str, Optional[str]], task: asyncio.Task):
+        self._pending.release()
+        if self._tails.get(key) is task:
+            del self._tails[key]
+
+    async def _handle_partition(self, previous: Optional[asyncio.Task], plugin: IPlugin, events: List[Event]):
+        if previous is not None:
+            await asyncio.wait([previous])
+
+        loop = asyncio.get_running_loop()
+        blocking_events = []
+        # noinspection PyBroadException
+        try:
+            for event in events:
+                if plugin.handles_async(event.type):
+                    if len(blocking_events) > 0:
+                        await loop.run_in_executor(self._executor, plugin.handle_events, blocking_events)
+                        blocking_events = []
+                    await plugin.handle_event_async(event)
+                else:
+                    blocking_events.append(event)
+            if len(blocking_events) > 0:
+                await loop.run_in_executor(self._executor, plugin.handle_events, blocking_events)
+        except Exception:
+            logger.exception(f'error while {plugin.name} handled events')
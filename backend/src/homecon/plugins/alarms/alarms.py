@@ -2,7 +2,7 @@
 
 import logging
 import time
-from typing import List, Any
+from typing import List, Any, Optional
 from uuid import uuid4
 from threading import Thread
 
@@ -19,15 +19,20 @@ logger = logging.getLogger(__name__)
 
 
 class StateAction:
-    def __init__(self, states: List[State], value: Any, delay: int = 0):
+    def __init__(self, states: List[State], value: Any, delay: int = 0, state_manager: Optional[IStateManager] = None):
         self.states = states
         self.value = value
         self.delay = delay
+        self._state_manager = state_manager
 
     def execute(self, source=''):
 
         def func(delay=0):
             time.sleep(delay)
+            if self._state_manager is not None:
+                logger.debug(f'setting {self.states} to {self.value} from {source}')
+                self._state_manager.set_values({s: self.value for s in self.states}, source=source)
+                return
             for s in self.states:
                 logger.debug(f'setting {s} to {self.value} from {source}')
                 s.set_value(self.value)
@@ -64,7 +69,7 @@ class Action:
 
             delay = v.get('delay', 0)
             value = v['value']
-            state_actions.append(StateAction(states, value, delay=delay))
+            state_actions.append(StateAction(states, value, delay=delay, state_manager=state_manager))
         return cls(state_actions)
 
 
@@ -96,11 +101,7 @@ class Alarms(BasePlugin):
         }
         self.scheduler = BackgroundScheduler(executors=executors, job_defaults=job_defaults)
 
-        # add existing jobs
-        for state in self._state_manager.all():
-            if state.type == self.ALARM_STATE_TYPE:
-                self.update_job(state)
-
+        self._add_jobs()
         self.scheduler.start()
         logger.debug('Scheduler plugin Initialized')
 
@@ -108,6 +109,11 @@ class Alarms(BasePlugin):
         super().stop()
         self.scheduler.shutdown(wait=False)
 
+    def _add_jobs(self):
+        for state in self._state_manager.all():
+            if state.type == self.ALARM_STATE_TYPE:
+                self.update_job(state)
+
     @property
     def timezone(self):
         if self._timezone is not None:
@@ -177,6 +183,10 @@ class Alarms(BasePlugin):
         if state.type == self.ALARM_STATE_TYPE:
             self.delete_job(state)
 
+    def listen_states_reloaded(self, _):
+        self.scheduler.remove_all_jobs()
+        self._add_jobs()
+
     def listen_add_schedule(self, event: Event):
         if 'key' in event.data:
             state = self._state_manager.get(key=event.data['key'])
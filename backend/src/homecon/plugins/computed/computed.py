@@ -4,7 +4,7 @@ from typing import Any, List
 from dataclasses import dataclass
 
 from homecon.core.event import Event
-from homecon.core.states.state import IStateManager
+from homecon.core.states.state import IStateManager, State
 from homecon.core.plugins.plugin import BasePlugin
 
 import numpy as np
@@ -76,7 +76,11 @@ class Computed(BasePlugin):
         self._computed_mapping = {}
 
     def start(self):
-        # build the _computed_mapping
+        self._build_computed_mapping()
+        logger.debug('Computed plugin initialized')
+
+    def _build_computed_mapping(self):
+        self._computed_mapping = {}
         for state in self._state_manager.all():
             computed_config = state.config.get(self.COMPUTED)
             if computed_config is not None:
@@ -85,11 +89,9 @@ class Computed(BasePlugin):
                 except TypeError:
                     logger.exception('could not add state to computed_mapping')
 
-        for state_key, computed_config in self._computed_mapping.items():
+        for state_key, computed_config in list(self._computed_mapping.items()):
             self._compute_and_set_value(state_key, computed_config)
 
-        logger.debug('Computed plugin initialized')
-
     def _try_to_add_state_to_mapping(self, state):
         computed_config_dict = state.config.get(self.COMPUTED)
         if computed_config_dict is not None:
@@ -132,8 +134,16 @@ class Computed(BasePlugin):
             del self._computed_mapping[state.key]
             logger.debug(f'removed state {state.key} from the computed mapping')
 
+    def listen_states_reloaded(self, _):
+        self._build_computed_mapping()
+
     def listen_state_value_changed(self, event: Event):
-        for state_key, computed_config in self._computed_mapping.items():
-            trigger_state_ids = [state.key for state in self._state_manager.find(computed_config.trigger)]
-            if event.data['state'].key in trigger_state_ids:
+        self._compute_triggered([event.data['state']])
+
+    def listen_state_values_changed(self, event: Event):
+        self._compute_triggered([change['state'] for change in event.data['changes']])
+
+    def _compute_triggered(self, states: List[State]):
+        for state_key, computed_config in list(self._computed_mapping.items()):
+            if any(self._state_manager.matches(computed_config.trigger, state) for state in states):
                 self._compute_and_set_value(state_key, computed_config)
@@ -100,15 +100,17 @@ class Knx(BasePlugin):
                                 label='', description='knxd port', value=6720)
 
     def start(self):
-        # build the ga_read_mapping
+        self._build_ga_read_mapping()
+        self.connect()
+        logger.debug('KNX plugin Initialized')
+
+    def _build_ga_read_mapping(self):
+        self.ga_read_mapping = ListMapping()
         for state in self._state_manager.all():
             knx_ga_read = state.config.get(self.KNX_GA_READ)
             if knx_ga_read is not None:
                 self.ga_read_mapping.add(knx_ga_read, state.key)
 
-        self.connect()
-        logger.debug('KNX plugin Initialized')
-
     def connect(self):
         try:
             address = self._state_manager.get('/settings/knxd/address').value
@@ -179,6 +181,9 @@ class Knx(BasePlugin):
         state = event.data['state']
         self.ga_read_mapping.remove(state.key)
 
+    def listen_states_reloaded(self, _):
+        self._build_ga_read_mapping()
+
     @property
     def settings_sections(self):
         sections = [{
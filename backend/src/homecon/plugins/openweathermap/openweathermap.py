@@ -3,7 +3,7 @@ import requests
 import json
 import time
 
-from typing import List, Optional
+from typing import List, Optional, Set
 from dataclasses import asdict
 
 from apscheduler.schedulers.background import BackgroundScheduler
@@ -156,11 +156,22 @@ class OpenWeatherMap(IPlugin):
     def stop(self):
         self._scheduler.shutdown(wait=False)
 
+    @property
+    def subscribed_event_types(self) -> Set[str]:
+        return {StateEventsTypes.STATE_VALUE_CHANGED, StateEventsTypes.STATE_UPDATED,
+                StateEventsTypes.STATE_VALUES_CHANGED}
+
     def handle_event(self, event: Event):
         if event.type == StateEventsTypes.STATE_VALUE_CHANGED or event.type == StateEventsTypes.STATE_UPDATED:
-            if event.data['state'].path == f'/{self.BASE_STATE}/{self.API_KEY_STATE}':
-                logger.info('api key updated, getting forecasts')
-                self._get_forecast()
+            states = [event.data['state']]
+        elif event.type == StateEventsTypes.STATE_VALUES_CHANGED:
+            states = [change['state'] for change in event.data['changes']]
+        else:
+            return
+
+        if any(state.path == f'/{self.BASE_STATE}/{self.API_KEY_STATE}' for state in states):
+            logger.info('api key updated, getting forecasts')
+            self._get_forecast()
 
     def _get_forecast_client(self) -> Optional[ForecastClient]:
         api_key = self._state_manager.get(path=f'/{self.BASE_STATE}/{self.API_KEY_STATE}').value
@@ -183,17 +194,18 @@ class OpenWeatherMap(IPlugin):
                 except NoForecastAvailableException:
                     logger.exception('no forecast available')
                 else:
-                    for i, forecast in enumerate(daily_forecasts):
-                        state = self._state_manager.get(path=f'/weather/forecast/daily/{i}')
-                        if state is not None:
-                            state.set_value(asdict(forecast), source=self.name)
-
-                    for i, forecast in enumerate(hourly_forecasts):
-                        state = self._state_manager.get(path=f'/weather/forecast/hourly/{i}')
-                        if state is not None:
-                            state.set_value(asdict(forecast), source=self.name)
-
-                    last_update.set_value(int(time.time()), source=self.name)
+                    with self._state_manager.transaction(source=self.name) as values:
+                        for i, forecast in enumerate(daily_forecasts):
+                            state = self._state_manager.get(path=f'/weather/forecast/daily/{i}')
+                            if state is not None:
+                                values[state] = asdict(forecast)
+
+                        for i, forecast in enumerate(hourly_forecasts):
+                            state = self._state_manager.get(path=f'/weather/forecast/hourly/{i}')
+                            if state is not None:
+                                values[state] = asdict(forecast)
+
+                        values[last_update] = int(time.time())
                     logger.info('updated weather forecasts')
             else:
                 logger.info('no weather forecast client available')
@@ -71,6 +71,14 @@ class States(BasePlugin):
             if state is not None:
                 event.reply({'path': event.data['path'], 'value': state.value})
 
+        elif 'key' in event.data and 'value' in event.data and 'version' in event.data:
+            # the value is only set when the state was not changed since the version the client is aware of,
+            # otherwise the current value is sent back
+            state = self._state_manager.get(key=event.data['key'])
+            if state is not None and not state.compare_and_set(event.data['version'], event.data['value'],
+                                                               event.source):
+                event.reply({'key': event.data['key'], 'value': state.value, 'version': state.version})
+
         elif 'key' in event.data and 'value' in event.data:
             state = self._state_manager.get(key=event.data['key'])
             if state is not None:
@@ -82,8 +90,7 @@ class States(BasePlugin):
                 state.set_value(event.data['value'], event.source)
 
     def listen_state_list(self, event: Event):
-        states = [s.serialize() for s in self._state_manager.all()]
-        event.reply({'key': '', 'value': states})
+        event.reply({'key': '', 'value': self._state_manager.state_list()})
 
     def listen_state_add(self, event):
         kwargs = dict(event.data)
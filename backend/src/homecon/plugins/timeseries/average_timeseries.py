@@ -7,7 +7,7 @@ import pytz
 from datetime import datetime, timedelta
 
 from dataclasses import dataclass
-from typing import List, Any
+from typing import List, Any, Set
 
 from pydal import DAL, Field
 
@@ -65,9 +65,17 @@ class AverageTimeseries(IPlugin):
             return self.DEFAULT_TIMEZONE
         return state.value or self.DEFAULT_TIMEZONE
 
+    @property
+    def subscribed_event_types(self) -> Set[str]:
+        return {StateEventsTypes.STATE_VALUE_CHANGED, StateEventsTypes.STATE_VALUES_CHANGED}
+
     def handle_event(self, event: Event):
         if event.type == StateEventsTypes.STATE_VALUE_CHANGED:
             self._handle_state_value_changed_event(event)
+        elif event.type == StateEventsTypes.STATE_VALUES_CHANGED:
+            for change in event.data['changes']:
+                if change['state'].log_key != State.NO_LOGGING_KEY:
+                    self.aggregate(change['state'])
 
     def _handle_state_value_changed_event(self, event: Event):
         state = event.data['state']
@@ -5,9 +5,10 @@ import logging
 import time
 
 from dataclasses import dataclass
+from typing import List, Set
 
 from homecon.core.plugins.plugin import IPlugin
-from homecon.core.states.state import IStateManager, StateEventsTypes
+from homecon.core.states.state import IStateManager, State, StateEventsTypes
 from homecon.core.event import IEventManager, Event
 
 
@@ -42,6 +43,11 @@ class TimeSeries(IPlugin):
     def name(self):
         return 'timeseries'
 
+    @property
+    def subscribed_event_types(self) -> Set[str]:
+        return {TimeseriesEventTypes.STATE_TIMESERIES, StateEventsTypes.STATE_UPDATED,
+                StateEventsTypes.STATE_VALUE_CHANGED, StateEventsTypes.STATE_VALUES_CHANGED}
+
     def handle_event(self, event: Event):
         if event.type == TimeseriesEventTypes.STATE_TIMESERIES:
             self._handle_timeseries_event(event)
@@ -52,6 +58,9 @@ class TimeSeries(IPlugin):
         elif event.type == StateEventsTypes.STATE_VALUE_CHANGED:
             self._handle_state_value_changed_event(event)
 
+        elif event.type == StateEventsTypes.STATE_VALUES_CHANGED:
+            self._handle_state_values_changed_event(event)
+
     def _add_subscription(self, subscription: Subscription):
         for old_subscription in self._subscriptions:
             if subscription.state_id == old_subscription.state_id and subscription.target == old_subscription.target:
@@ -83,11 +92,19 @@ class TimeSeries(IPlugin):
             event.reply(data={'id': state.key, 'timeseries': [(value.timestamp, value.value) for value in timeseries]})
 
     def _handle_state_value_changed_event(self, event: Event):
-        state = event.data['state']
+        self._push_updates([event.data['state']])
 
+    def _handle_state_values_changed_event(self, event: Event):
+        self._push_updates([change['state'] for change in event.data['changes']])
+
+    def _push_updates(self, states: List[State]):
         # remove outdated subscriptions
         self._subscriptions = [subscription for subscription in self._subscriptions if subscription.valid_until > time.time()]
 
+        for state in states:
+            self._push_update(state)
+
+    def _push_update(self, state: State):
         data = None
         for subscription in self._subscriptions:
             if state.key == subscription.state_id:
@@ -4,7 +4,7 @@
 import logging
 
 from dataclasses import dataclass
-from typing import List
+from typing import List, Set
 
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.executors.pool import ThreadPoolExecutor
@@ -129,6 +129,10 @@ class Weather(IPlugin):
         super().stop()
         self.scheduler.shutdown(wait=False)
 
+    @property
+    def subscribed_event_types(self) -> Set[str]:
+        return set(self._event_handlers.keys())
+
     def handle_event(self, event: Event):
         handler = self._event_handlers.get(event.type)
         if handler is not None:
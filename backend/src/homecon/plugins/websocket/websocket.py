@@ -34,6 +34,9 @@ class Websocket(BasePlugin):
     Class to control the HomeCon websocket
 
     """
+    # the listeners only encode and queue messages, so they are run in the asyncio loop of the AsyncHomeCon
+    BLOCKING_LISTENERS = False
+
     def __init__(self, *args, host: str = '0.0.0.0', port: int = 9099, token: str = '', **kwargs):
         super().__init__(*args, **kwargs)
         self._host = host
@@ -44,61 +47,18 @@ class Websocket(BasePlugin):
         self.server = None
         self._loop = asyncio.get_event_loop()
         self._server_thread = None
+        self._clients_lock = None
+        self._state_list_message = (-1, '')
 
     def start(self):
         # FIXME this is very ugly with an asyncio loop inside a thread
         logger.info(f'starting websocket at ws://{self._host}:{self._port}')
-        clients_lock = asyncio.Lock()
-
-        async def connect_client(websocket, path):
-            """
-            connect a client and listen for messages
-            """
-
-            client = Client(websocket)
-            with (await clients_lock):
-                self._clients[client.id] = client
-
-            address = client.address
-            logger.debug('incoming connection from {}'.format(address))
-
-            try:
-                while True:
-                    message = await websocket.recv()
-                    logger.debug(f'received message, {message}')
-                    if message is None:
-                        break
-                    # parse the message and fire an event if the data is in the correct format
-                    try:
-                        data = json.loads(message)
-                        self.log_data(address, data)
-                        if 'event' in data:
-                            if data['event'] == 'echo':
-                                await client.send(data)
-                            else:
-                                self.fire(data['event'], data['data'], reply_to=f'{self.name}/{client.id}')
-                        else:
-                            logger.debug(f'a message was received but contained no event, {data}')
-                    except Exception:
-                        logger.exception('a message was received but could not be handled')
-            except ConnectionClosedOK:
-                logger.debug('%s connection closed ', address)
-
-            finally:
-                with (await clients_lock):
-                    del self._clients[client.id]
-                logger.debug('disconnected {}'.format(address))
-
-        async def process_request(path, headers):
-            token = path[1:]
-            if token != self._token:
-                logger.warning(f'client tried to connect with an invalid token')
-                return HTTPStatus.UNAUTHORIZED, [], b'incorrect token'
 
         def run_server(loop):
             # create a server and run it in the event loop
             asyncio.set_event_loop(loop)
-            server_generator = websockets.serve(connect_client, process_request=process_request,
+            self._clients_lock = asyncio.Lock()
+            server_generator = websockets.serve(self._connect_client, process_request=self._process_request,
                                                 host=self._host, port=self._port, loop=loop)
             self.server = loop.run_until_complete(server_generator)
             loop.run_forever()
@@ -107,12 +67,68 @@ class Websocket(BasePlugin):
         self._server_thread.start()
         logger.debug('Websocket plugin initialized')
 
-    def stop(self):
-        self.server.close()
-        self._loop.call_soon_threadsafe(self._loop.stop)
+    async def start_async(self):
+        # the server shares the asyncio loop of the AsyncHomeCon instead of running a loop in a thread
+        logger.info(f'starting websocket at ws://{self._host}:{self._port}')
+        self._loop = asyncio.get_running_loop()
+        self._clients_lock = asyncio.Lock()
+        self.server = await websockets.serve(self._connect_client, process_request=self._process_request,
+                                             host=self._host, port=self._port)
+        logger.debug('Websocket plugin initialized')
 
+    def stop(self):
         if self._server_thread is not None:
+            self.server.close()
+            self._loop.call_soon_threadsafe(self._loop.stop)
             self._server_thread.join()
+        elif self.server is not None:
+            # the loop is shared and keeps running
+            self._loop.call_soon_threadsafe(self.server.close)
+
+    async def _connect_client(self, websocket, path):
+        """
+        connect a client and listen for messages
+        """
+
+        client = Client(websocket)
+        async with self._clients_lock:
+            self._clients[client.id] = client
+
+        address = client.address
+        logger.debug('incoming connection from {}'.format(address))
+
+        try:
+            while True:
+                message = await websocket.recv()
+                logger.debug(f'received message, {message}')
+                if message is None:
+                    break
+                # parse the message and fire an event if the data is in the correct format
+                try:
+                    data = json.loads(message)
+                    self.log_data(address, data)
+                    if 'event' in data:
+                        if data['event'] == 'echo':
+                            await client.send(data)
+                        else:
+                            self.fire(data['event'], data['data'], reply_to=f'{self.name}/{client.id}')
+                    else:
+                        logger.debug(f'a message was received but contained no event, {data}')
+                except Exception:
+                    logger.exception('a message was received but could not be handled')
+        except ConnectionClosedOK:
+            logger.debug('%s connection closed ', address)
+
+        finally:
+            async with self._clients_lock:
+                del self._clients[client.id]
+            logger.debug('disconnected {}'.format(address))
+
+    async def _process_request(self, path, headers):
+        token = path[1:]
+        if token != self._token:
+            logger.warning(f'client tried to connect with an invalid token')
+            return HTTPStatus.UNAUTHORIZED, [], b'incorrect token'
 
     def log_data(self, address, data):
         """
@@ -139,8 +155,8 @@ class Websocket(BasePlugin):
 
         Parameters
         ----------
-        data: dict
-            Data to send to the clients
+        data: dict or str
+            Data to send to the clients, or the json encoded data
 
         clients: list of Client or single Client, optional
             Clients to send the data to
@@ -151,9 +167,22 @@ class Websocket(BasePlugin):
 
         if not hasattr(clients, '__len__'):
             clients = {'temp': clients}
+        if not isinstance(data, str):
+            # encode once for all clients
+            data = json.dumps(data)
+        in_loop = self._in_loop()
         for client in clients.values():
             if self.check_readpermission(client):
-                asyncio.run_coroutine_threadsafe(client.send(data), loop=self._loop)
+                if in_loop:
+                    asyncio.ensure_future(client.send(data))
+                else:
+                    asyncio.run_coroutine_threadsafe(client.send(data), loop=self._loop)
+
+    def _in_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
 
     def check_readpermission(self, client):
         """
@@ -178,7 +207,21 @@ class Websocket(BasePlugin):
             'data': {
                 'path': event.data['state'].path,
                 'key': event.data['state'].key,
-                'value': event.data['state'].value
+                'value': event.data['state'].value,
+                'version': event.data['state'].version
+            }
+        })
+
+    def listen_state_values_changed(self, event: Event):
+        self.send({
+            'event': 'state_values',
+            'data': {
+                'value': [{
+                    'path': change['state'].path,
+                    'key': change['state'].key,
+                    'value': change['state'].value,
+                    'version': change['state'].version
+                } for change in event.data['changes']]
             }
         })
 
@@ -191,31 +234,31 @@ class Websocket(BasePlugin):
                 'value': event.data['state'].serialize()
             }
         })
-        self.send({
-            'event': 'state_list',
-            'data': {
-                'key': '',
-                'value': [s.serialize() for s in self._state_manager.all()]
-            }
-        })
+        self.send_state_list()
 
     def listen_state_added(self, _):
-        self.send({
-            'event': 'state_list',
-            'data': {
-                'key': '',
-                'value': [s.serialize() for s in self._state_manager.all()]
-            }
-        })
+        self.send_state_list()
 
     def listen_state_deleted(self, _):
-        self.send({
-            'event': 'state_list',
-            'data': {
-                'key': '',
-                'value': [s.serialize() for s in self._state_manager.all()]
-            }
-        })
+        self.send_state_list()
+
+    def listen_states_reloaded(self, _):
+        self.send_state_list()
+
+    def send_state_list(self):
+        # the encoded message is reused until the states change
+        version, message = self._state_list_message
+        if version != self._state_manager.state_list_version:
+            version = self._state_manager.state_list_version
+            message = json.dumps({
+                'event': 'state_list',
+                'data': {
+                    'key': '',
+                    'value': self._state_manager.state_list()
+                }
+            })
+            self._state_list_message = (version, message)
+        self.send(message)
 
 
 class Client(object):
@@ -232,13 +275,14 @@ class Client(object):
         else:
             return '/'
 
-    @asyncio.coroutine
-    def send(self, message):
-        printmessage = message.__repr__()
+    async def send(self, message):
+        if not isinstance(message, str):
+            message = json.dumps(message)
+        printmessage = message
         if len(printmessage) > 405:
             printmessage = printmessage[:200] + ' ... ' +printmessage[-200:]
 
-        yield from self.websocket.send(json.dumps(message))
+        await self.websocket.send(message)
         logger.debug(f'sent {printmessage} to {self}')
 
     def __repr__(self):
@@ -0,0 +1,67 @@
+import asyncio
+
+from unittest import TestCase
+
+from homecon.core.event import EventManager
+from homecon.core.plugins.plugin import BasePlugin
+from homecon.core.plugins.process import ProcessPlugin
+from homecon.core.states.memory_state_manager import MemoryStateManager
+
+
+class DoublingPlugin(BasePlugin):
+    def listen_state_value_changed(self, event):
+        if event.data['state'].name == 'input':
+            output = self._state_manager.get(path='/output')
+            output.set_value(2 * event.data['state'].value)
+
+
+class TestProcessPlugin(TestCase):
+    def test_process_plugin(self):
+        event_manager = EventManager(get_timeout=5)
+        state_manager = MemoryStateManager(event_manager)
+        input_state = state_manager.add('input', value=0)
+        state_manager.add('output', value=0)
+        event_manager.get_batch()
+
+        plugin = ProcessPlugin('doubling', DoublingPlugin, event_manager, state_manager)
+        plugin.start()
+        try:
+            assert 'state_value_changed' in plugin.subscribed_event_types
+            input_state.set_value(3)
+            plugin.handle_events(event_manager.get_batch())
+
+            # the value is set in the main process through a state_value event
+            event = event_manager.get()
+            assert event.type == 'state_value'
+            assert event.data == {'key': state_manager.get(path='/output').key, 'value': 6}
+        finally:
+            plugin.stop()
+            plugin.join()
+        assert not plugin._process.is_alive()
+
+    def test_start_async(self):
+        event_manager = EventManager(get_timeout=5)
+        state_manager = MemoryStateManager(event_manager)
+        plugin = ProcessPlugin('doubling', DoublingPlugin, event_manager, state_manager)
+
+        async def start():
+            ticks = 0
+
+            async def tick():
+                nonlocal ticks
+                while not plugin.ready:
+                    ticks += 1
+                    await asyncio.sleep(0.01)
+
+            await asyncio.gather(plugin.start_async(), tick())
+            return ticks
+
+        try:
+            assert not plugin.ready
+            # the loop keeps running while the worker process starts
+            assert asyncio.run(start()) > 0
+            assert plugin.ready
+            assert 'state_value_changed' in plugin.subscribed_event_types
+        finally:
+            plugin.stop()
+            plugin.join()
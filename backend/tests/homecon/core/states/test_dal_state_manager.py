@@ -16,12 +16,15 @@
 #    You should have received a copy of the GNU General Public License
 #    along with HomeCon.  If not, see <http://www.gnu.org/licenses/>.
 ################################################################################
+import math
 import os
 import shutil
 import numpy as np
 import time
 
 from unittest import TestCase
+from unittest.mock import patch
+from pydal import DAL, Field
 from homecon.core.states.state import State
 from homecon.core.states.dal_state_manager import DALStateManager
 from homecon.core.event import EventManager
@@ -71,6 +74,20 @@ class TestDALStateManager(TestCase):
         s0 = state_manager.get(key=s0.key)
         assert s0.children[0].name == 'child'
 
+    def test_children_after_reparent(self):
+        state_manager = DALStateManager(self.DB_DIR, self.DB_URI, EventManager())
+        s0 = state_manager.add('parent0')
+        s1 = state_manager.add('parent1')
+        s2 = state_manager.add('child', parent=s0)
+        s2.update(parent=s1)
+        assert s0.children == []
+        assert s1.children == [s2]
+
+        state_manager = DALStateManager(self.DB_DIR, self.DB_URI, EventManager())
+        assert state_manager.get(key=s0.key).children == []
+        assert state_manager.get(key=s1.key).children[0].key == s2.key
+        assert state_manager.get('/parent1/child').key == s2.key
+
     def test_update(self):
         state_manager = DALStateManager(self.DB_DIR, self.DB_URI, EventManager())
         s = state_manager.add('mystate')
@@ -127,3 +144,259 @@ class TestDALStateManager(TestCase):
 
         assert state_manager.find('/mystate') == [s0]
         assert state_manager.find('/parent/.*') == [s2, s3]
+
+    def test_write_behind_flush_size(self):
+        state_manager = DALStateManager(self.DB_DIR, self.DB_URI, EventManager(), write_behind=True, flush_size=3,
+                                        flush_interval=60)
+        s0 = state_manager.add('mystate', value=0, log_key=None)
+        s0.set_value(1)
+        assert state_manager.metrics.queue_depth == 2
+        assert state_manager.metrics.flushes == 0
+
+        s0.set_value(2)
+        assert state_manager.metrics.queue_depth == 0
+        assert state_manager.metrics.flushes == 1
+        assert state_manager.metrics.flushed_states == 1
+        assert state_manager.metrics.flushed_logs == 2
+
+        state_manager = DALStateManager(self.DB_DIR, self.DB_URI, EventManager())
+        s0 = state_manager.get(key=s0.key)
+        assert s0.value == 2
+        assert [v.value for v in state_manager.get_state_values_log(s0, since=0.)] == [0, 1, 2]
+
+    def test_write_behind_flush_interval(self):
+        state_manager = DALStateManager(self.DB_DIR, self.DB_URI, EventManager(), write_behind=True,
+                                        flush_interval=0.05)
+        s0 = state_manager.add('mystate', value=0)
+        s0.set_value(1)
+        assert state_manager.metrics.queue_depth == 1
+        time.sleep(0.2)
+        assert state_manager.metrics.queue_depth == 0
+        assert state_manager.metrics.flushes == 1
+
+    def test_write_behind_stop(self):
+        state_manager = DALStateManager(self.DB_DIR, self.DB_URI, EventManager(), write_behind=True,
+                                        flush_interval=60)
+        s0 = state_manager.add('mystate', value=0)
+        s0.set_value(1)
+        state_manager.stop()
+
+        state_manager = DALStateManager(self.DB_DIR, self.DB_URI, EventManager())
+        assert state_manager.get(key=s0.key).value == 1
+
+    def test_write_behind_failed_flush(self):
+        state_manager = DALStateManager(self.DB_DIR, self.DB_URI, EventManager(), write_behind=True,
+                                        flush_interval=60)
+        s0 = state_manager.add('mystate', value=0, log_key='mystate')
+        s0.set_value(1)
+        with patch.object(state_manager._table_values_log, 'bulk_insert', side_effect=RuntimeError):
+            state_manager.flush()
+        assert state_manager.metrics.failed_flushes == 1
+        assert state_manager.metrics.queue_depth == 2
+
+        s0.set_value(2)
+        state_manager.flush()
+        assert state_manager.metrics.queue_depth == 0
+        assert state_manager.metrics.flushed_logs == 2
+
+        state_manager = DALStateManager(self.DB_DIR, self.DB_URI, EventManager())
+        s0 = state_manager.get(key=s0.key)
+        assert s0.value == 2
+        assert [v.value for v in state_manager.get_state_values_log(s0, since=0.)] == [0, 1, 2]
+
+    def test_lazy_config(self):
+        state_manager = DALStateManager(self.DB_DIR, self.DB_URI, EventManager())
+        s = state_manager.add('mystate', type='float', config={'a': 1})
+
+        state_manager = DALStateManager(self.DB_DIR, self.DB_URI, EventManager())
+        s = state_manager.get(key=s.key)
+        assert s.config_json() == '{"a": 1}'
+        s.set_value(2.)
+        assert s.config == {'a': 1}
+        assert not hasattr(s, '__dict__')
+
+    def test_import(self):
+        state_manager = DALStateManager(self.DB_DIR, self.DB_URI, EventManager())
+        state_manager.add('mystate1')
+        s1 = state_manager.add('mystate2', value=1)
+        s2 = state_manager.add('mystate3', parent=s1, config={'a': 1})
+        exported = state_manager.export_states()
+
+        state_manager.add('mystate4')
+        state_manager.import_states(exported)
+        assert len(state_manager.all()) == 3
+
+        state_manager = DALStateManager(self.DB_DIR, self.DB_URI, EventManager())
+        assert len(state_manager.all()) == 3
+        assert state_manager.get('/mystate4') is None
+        assert state_manager.get('/mystate2').value == 1
+        assert state_manager.get('/mystate2/mystate3').key == s2.key
+        assert state_manager.get('/mystate2/mystate3').config == {'a': 1}
+
+    def test_load_parent_after_child(self):
+        state_manager = DALStateManager(self.DB_DIR, self.DB_URI, EventManager())
+        state_manager._db.states.insert(key='child', name='child', parent='parent', config='{}', value='1')
+        state_manager._db.states.insert(key='parent', name='parent', config='{}', value='null')
+        state_manager._db.states.insert(key='orphan', name='orphan', parent='missing', config='{}', value='null')
+        state_manager._db.commit()
+
+        state_manager = DALStateManager(self.DB_DIR, self.DB_URI, EventManager())
+        assert state_manager.get('/parent/child').parent.key == 'parent'
+        assert state_manager.get('/parent/child').value == 1
+        assert state_manager.get('/orphan').parent is None
+        assert state_manager.find('/parent.*') == [state_manager.get('/parent'), state_manager.get('/parent/child')]
+        assert state_manager.load_time > 0
+
+    def test_set_values(self):
+        state_manager = DALStateManager(self.DB_DIR, self.DB_URI, EventManager())
+        s0 = state_manager.add('mystate1', log_key='mystate1')
+        s1 = state_manager.add('mystate2')
+        state_manager.set_values({s0: 2, s1: 3})
+        assert len(state_manager.get_state_values_log(s0, 0.)) == 2
+
+        state_manager = DALStateManager(self.DB_DIR, self.DB_URI, EventManager())
+        assert state_manager.get(key=s0.key).value == 2
+        assert state_manager.get(key=s1.key).value == 3
+
+    def test_value_codec(self):
+        state_manager = DALStateManager(self.DB_DIR, self.DB_URI, EventManager())
+        s0 = state_manager.add('float', type='float', value=1.5, log_key='float')
+        s1 = state_manager.add('int', type='int', value=1)
+        s2 = state_manager.add('bool', type='bool', value=True)
+        s3 = state_manager.add('dict', type='dict', value={'a': 1})
+        s4 = state_manager.add('str', type='float', value='nan')
+        s0.set_value(2.5)
+
+        row = state_manager._db(state_manager._table.key == s0.key).select().first()
+        assert row['value_number'] == 2.5
+        assert row['value'] is None
+
+        state_manager = DALStateManager(self.DB_DIR, self.DB_URI, EventManager())
+        assert state_manager.get(key=s0.key).value == 2.5
+        assert state_manager.get(key=s1.key).value == 1
+        assert isinstance(state_manager.get(key=s1.key).value, int)
+        assert state_manager.get(key=s2.key).value is True
+        assert state_manager.get(key=s3.key).value == {'a': 1}
+        assert state_manager.get(key=s4.key).value == 'nan'
+        assert [v.value for v in state_manager.get_state_values_log(s0, 0.)] == [1.5, 2.5]
+
+    def test_import_empty(self):
+        state_manager = DALStateManager(self.DB_DIR, self.DB_URI, EventManager())
+        state_manager.add('mystate')
+        state_manager.all()
+        state_manager.import_states([])
+        assert state_manager.all() == []
+
+        state_manager = DALStateManager(self.DB_DIR, self.DB_URI, EventManager())
+        assert state_manager.all() == []
+
+    def test_value_codec_type_mismatch(self):
+        state_manager = DALStateManager(self.DB_DIR, self.DB_URI, EventManager())
+        s0 = state_manager.add('int', type='int', value=21.5)
+        s1 = state_manager.add('bool', type='bool', value=2)
+        s2 = state_manager.add('float', type='float', value=True)
+        s3 = state_manager.add('large', type='int', value=2 ** 60 + 1)
+
+        row = state_manager._db(state_manager._table.key == s0.key).select().first()
+        assert row['value_number'] is None
+
+        state_manager = DALStateManager(self.DB_DIR, self.DB_URI, EventManager())
+        assert state_manager.get(key=s0.key).value == 21.5
+        assert state_manager.get(key=s1.key).value == 2
+        assert type(state_manager.get(key=s1.key).value) == int
+        assert state_manager.get(key=s2.key).value is True
+        assert state_manager.get(key=s3.key).value == 2 ** 60 + 1
+
+    def test_value_codec_non_finite(self):
+        state_manager = DALStateManager(self.DB_DIR, self.DB_URI, EventManager())
+        s0 = state_manager.add('nan', type='float', value=float('nan'), log_key='nan')
+        s1 = state_manager.add('inf', type='float', value=1., log_key='inf')
+        s1.set_value(float('inf'))
+        s1.set_value(-float('inf'))
+
+        state_manager = DALStateManager(self.DB_DIR, self.DB_URI, EventManager())
+        assert math.isnan(state_manager.get(key=s0.key).value)
+        assert state_manager.get(key=s1.key).value == -float('inf')
+        assert math.isnan(state_manager.get_state_values_log(s0, 0.)[0].value)
+        assert [v.value for v in state_manager.get_state_values_log(s1, 0.)] == [1., float('inf'), -float('inf')]
+
+    def test_migrate_values(self):
+        db = DAL(self.DB_URI, folder=self.DB_DIR)
+        db.define_table('states', Field('key', type='string'), Field('name', type='string'),
+                        Field('parent', type='string'), Field('type', type='string'), Field('quantity', type='string'),
+                        Field('unit', type='string'), Field('label', type='string'),
+                        Field('description', type='string'), Field('log_key', type='string'),
+                        Field('config', type='string'), Field('value', type='string'))
+        db.define_table('state_values_log', Field('state_key', type='string'), Field('timestamp', type='float'),
+                        Field('value', type='string'))
+        db.states.insert(key='a', name='a', type='float', log_key='a', config='{}', value='2.5')
+        db.state_values_log.insert(state_key='a', timestamp=1., value='1.5')
+        db.state_values_log.insert(state_key='a', timestamp=2., value='2.5')
+        db.commit()
+        db.close()
+
+        state_manager = DALStateManager(self.DB_DIR, self.DB_URI, EventManager())
+        s = state_manager.get(key='a')
+        assert s.value == 2.5
+        assert [v.value for v in state_manager.get_state_values_log(s, 0.)] == [1.5, 2.5]
+
+        assert state_manager.migrate_values() == 3
+        assert state_manager.migrate_values() == 0
+        rows = state_manager._db(state_manager._table_values_log).select()
+        assert [row['value_number'] for row in rows] == [1.5, 2.5]
+        assert [v.value for v in state_manager.get_state_values_log(s, 0.)] == [1.5, 2.5]
+
+    def test_compact(self):
+        state_manager = DALStateManager(self.DB_DIR, self.DB_URI, EventManager())
+        s = state_manager.add('mystate', type='float', log_key='mystate', config={'retention': [
+            {'resolution': 0, 'duration': 3600}, {'resolution': 300, 'duration': 86400}, {'resolution': 3600}
+        ]})
+        now = (time.time() // 3600 - 1) * 3600
+        state_manager._table_values_log.truncate()
+        state_manager._table_values_log.bulk_insert([
+            {'state_key': 'mystate', 'timestamp': now - 2 * 86400 + i * 60., 'value_number': float(i % 10)}
+            for i in range(2 * 24 * 60)
+        ])
+        state_manager._db.commit()
+
+        assert state_manager.compact(now=now) == 2 * 24 * 12 + 2 * 24
+        assert state_manager.compact(now=now) == 0
+        assert state_manager._db(state_manager._table_values_log).count() == 60
+        assert state_manager._db(state_manager._table_values_aggregate.resolution == 300).count() == 24 * 12
+
+        with patch('homecon.core.states.dal_state_manager.time') as time_mock:
+            time_mock.time.return_value = now
+            values = state_manager.get_state_values_log(s, now - 1800)
+            assert len(values) == 30
+            values = state_manager.get_state_values_log(s, now - 7200)
+            assert len(values) == 24
+            assert values[0].timestamp == now - 7200
+            assert [v.value for v in values[:2]] == [2., 7.]
+            values = state_manager.get_state_values_log(s, now - 2 * 86400, until=now - 86400)
+            assert len(values) == 24
+            assert values[0].value == 4.5
+
+    def test_compact_non_numeric(self):
+        state_manager = DALStateManager(self.DB_DIR, self.DB_URI, EventManager())
+        retention = {'retention': [{'resolution': 0, 'duration': 3600}, {'resolution': 300}]}
+        state_manager.add('mystate', type='float', log_key='mystate', config=retention)
+        state_manager.add('mytext', type='str', log_key='mytext', config=retention)
+        now = (time.time() // 3600 - 1) * 3600
+        state_manager._table_values_log.truncate()
+        state_manager._table_values_log.bulk_insert(
+            [{'state_key': 'mystate', 'timestamp': now - 7200., 'value_number': 1.},
+             {'state_key': 'mystate', 'timestamp': now - 7100., 'value': '"off"'},
+             {'state_key': 'mytext', 'timestamp': now - 7200., 'value': '"on"'}]
+        )
+        state_manager._db.commit()
+
+        state_manager = DALStateManager(self.DB_DIR, self.DB_URI, EventManager())
+        assert state_manager.compact(now=now) == 1
+        rows = state_manager._db(state_manager._table_values_log).select(orderby=state_manager._table_values_log.id)
+        assert [row['value'] for row in rows] == ['"off"', '"on"']
+        assert state_manager._db(state_manager._table_values_aggregate.state_key == 'mytext').count() == 0
+        # the config of states without a retention policy is not decoded
+        key = state_manager.add('other', type='float', log_key='other').key
+        state_manager = DALStateManager(self.DB_DIR, self.DB_URI, EventManager())
+        state_manager.compact(now=now)
+        assert state_manager.get(key=key)._raw_config is not None
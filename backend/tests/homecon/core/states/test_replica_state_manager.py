@@ -0,0 +1,64 @@
+import json
+
+from unittest import TestCase
+
+from homecon.core.states.memory_state_manager import MemoryStateManager
+from homecon.core.states.replica_state_manager import ReplicaStateManager
+from homecon.core.event import EventManager
+
+from mocks import DummyEventManager
+
+
+class TestReplicaStateManager(TestCase):
+    def setUp(self):
+        self.state_manager = MemoryStateManager(EventManager())
+        self.parent = self.state_manager.add('parent')
+        self.state = self.state_manager.add('state', parent=self.parent, value=1)
+        self.event_manager = DummyEventManager()
+        self.replica = ReplicaStateManager(self.event_manager, self.state_manager.state_list())
+
+    def test_replicate(self):
+        state = self.replica.get(path='/parent/state')
+        assert state.key == self.state.key
+        assert state.value == 1
+
+    def test_set_value(self):
+        state = self.replica.get(key=self.state.key)
+        state.set_value(2, source='plugin')
+        # the value is set when the change comes back
+        assert state.value == 1
+        assert self.event_manager.events[0].type == 'state_value'
+        assert self.event_manager.events[0].data == {'key': self.state.key, 'value': 2}
+
+    def test_sync(self):
+        self.state.set_value(2)
+        self.parent.update(name='renamed')
+        self.replica.sync(self.state.serialize())
+        self.replica.sync(self.parent.serialize())
+        state = self.replica.get(key=self.state.key)
+        assert state.value == 2
+        assert state.version == self.state.version
+        assert self.replica.get(path='/renamed/state') is state
+
+        self.replica.sync(self.state.serialize(), deleted=True)
+        assert self.replica.get(key=self.state.key) is None
+        assert len(self.event_manager.events) == 0
+
+    def test_add(self):
+        state = self.replica.add('new', parent=self.replica.get(key=self.parent.key), value=1)
+        assert self.replica.get(path='/parent/new') is state
+        assert self.event_manager.events[0].type == 'state_add'
+
+        # the owner adds the state with the sent key and its own value
+        data = dict(self.event_manager.events[0].data)
+        assert data.pop('parent') == self.parent.key
+        data['value'] = 3
+        added = self.state_manager.add(data.pop('name'), parent=self.parent, **data)
+        self.replica.sync(added.serialize())
+        assert self.replica.get(key=state.key).value == 3
+
+    def test_import_states(self):
+        states_list = self.state_manager.export_states()
+        self.replica.import_states(states_list)
+        assert self.event_manager.events[0].type == 'states_import'
+        assert json.loads(self.event_manager.events[0].data['value']) == states_list
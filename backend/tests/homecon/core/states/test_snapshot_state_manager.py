@@ -0,0 +1,99 @@
+import os
+import shutil
+
+from unittest import TestCase
+from unittest.mock import patch
+from homecon.core.states.snapshot_state_manager import SnapshotStateManager
+from homecon.core.event import EventManager
+
+
+class TestSnapshotStateManager(TestCase):
+    DB_DIR = 'snapshot'
+
+    def setUp(self):
+        try:
+            shutil.rmtree(self.DB_DIR)
+        except FileNotFoundError:
+            pass
+
+    def tearDown(self):
+        try:
+            shutil.rmtree(self.DB_DIR)
+        except FileNotFoundError:
+            pass
+
+    def test_replay(self):
+        state_manager = SnapshotStateManager(self.DB_DIR, EventManager())
+        s0 = state_manager.add('mystate', value=1)
+        s1 = state_manager.add('child', parent=s0, config={'a': 1}, log_key='child')
+        s2 = state_manager.add('deleted')
+        s0.set_value(2)
+        s1.update(name='renamed')
+        state_manager.delete(s2)
+        state_manager.sync()
+
+        # simulate a crash without a snapshot
+        state_manager = SnapshotStateManager(self.DB_DIR, EventManager())
+        assert len(state_manager.all()) == 2
+        assert state_manager.get('/mystate').value == 2
+        assert state_manager.get('/mystate/renamed').key == s1.key
+        assert state_manager.get('/mystate/renamed').config == {'a': 1}
+        assert state_manager.get('/mystate/renamed').log_key == 'child'
+        assert state_manager.get('/deleted') is None
+
+    def test_snapshot(self):
+        state_manager = SnapshotStateManager(self.DB_DIR, EventManager(), snapshot_size=10)
+        s = state_manager.add('mystate')
+        for i in range(25):
+            s.set_value(i)
+        # the snapshot is written in a background thread
+        snapshot_thread = state_manager._snapshot_thread
+        if snapshot_thread is not None:
+            snapshot_thread.join()
+        state_manager.sync()
+        with open(os.path.join(self.DB_DIR, SnapshotStateManager.WAL_FILENAME)) as f:
+            assert len(f.readlines()) < 25
+        assert not os.path.exists(os.path.join(self.DB_DIR, SnapshotStateManager.PREVIOUS_WAL_FILENAME))
+
+        state_manager = SnapshotStateManager(self.DB_DIR, EventManager())
+        assert state_manager.get('/mystate').value == 24
+        with open(os.path.join(self.DB_DIR, SnapshotStateManager.WAL_FILENAME)) as f:
+            assert len(f.readlines()) == 0
+
+    def test_failed_snapshot(self):
+        state_manager = SnapshotStateManager(self.DB_DIR, EventManager())
+        s = state_manager.add('mystate', value=1)
+        with patch('homecon.core.states.snapshot_state_manager.json.dump', side_effect=OSError):
+            with self.assertRaises(OSError):
+                state_manager.snapshot()
+            s.set_value(2)
+            with self.assertRaises(OSError):
+                state_manager.snapshot()
+        s.set_value(3)
+        state_manager.sync()
+
+        # the records of the rotated logs are kept until a snapshot is written
+        state_manager = SnapshotStateManager(self.DB_DIR, EventManager())
+        assert state_manager.get('/mystate').value == 3
+        assert not os.path.exists(os.path.join(self.DB_DIR, SnapshotStateManager.PREVIOUS_WAL_FILENAME))
+
+    def test_partial_record(self):
+        state_manager = SnapshotStateManager(self.DB_DIR, EventManager())
+        state_manager.add('mystate', value=1).set_value(2)
+        state_manager.sync()
+        with open(os.path.join(self.DB_DIR, SnapshotStateManager.WAL_FILENAME), 'a') as f:
+            f.write('{"op": "upsert", "sta')
+
+        state_manager = SnapshotStateManager(self.DB_DIR, EventManager())
+        assert state_manager.get('/mystate').value == 2
+
+    def test_import(self):
+        state_manager = SnapshotStateManager(self.DB_DIR, EventManager())
+        state_manager.add('mystate1')
+        exported = state_manager.export_states()
+        state_manager.add('mystate2')
+        state_manager.import_states(exported)
+        state_manager.stop()
+
+        state_manager = SnapshotStateManager(self.DB_DIR, EventManager())
+        assert [s.name for s in state_manager.all()] == ['mystate1']
@@ -17,9 +17,14 @@
 #    along with HomeCon.  If not, see <http://www.gnu.org/licenses/>.
 ################################################################################
 
+import time
+
+from threading import Thread
 from unittest import TestCase
+from unittest.mock import patch
 from homecon.core.states.memory_state_manager import MemoryStateManager
 from homecon.core.event import EventManager
+from mocks import DummyEventManager
 
 
 class TestState(TestCase):
@@ -128,3 +133,299 @@ class TestState(TestCase):
         s2 = state_manager.get('/mystate2/mystate3')
 
         assert s2.parent == s1
+
+    def test_import_empty(self):
+        state_manager = MemoryStateManager(EventManager())
+        s0 = state_manager.add('mystate1')
+        state_manager.add('mystate2', parent=s0)
+        assert len(state_manager.all()) == 2
+        assert len(state_manager.children(None)) == 1
+
+        state_manager.import_states([])
+        assert state_manager.all() == []
+        assert state_manager.children(None) == []
+
+    def test_import_fires_single_event(self):
+        event_manager = DummyEventManager()
+        state_manager = MemoryStateManager(event_manager)
+        state_manager.add('mystate1')
+        s1 = state_manager.add('mystate2')
+        state_manager.add('mystate3', parent=s1)
+        exported = state_manager.export_states()
+
+        event_manager.events = []
+        state_manager.import_states(exported)
+        assert [e.type for e in event_manager.events] == ['states_reloaded']
+        assert len(state_manager.all()) == 3
+        assert state_manager.get('/mystate2/mystate3').parent == state_manager.get('/mystate2')
+
+    def test_get_path_after_rename(self):
+        state_manager = MemoryStateManager(EventManager())
+        s0 = state_manager.add('mystate1')
+        s1 = state_manager.add('substate', parent=s0)
+        s2 = state_manager.add('subsubstate', parent=s1)
+
+        s0.update(name='renamed')
+        assert state_manager.get('/mystate1') is None
+        assert state_manager.get('/renamed') == s0
+        assert state_manager.get('/renamed/substate/subsubstate') == s2
+
+    def test_get_path_after_reparent(self):
+        state_manager = MemoryStateManager(EventManager())
+        s0 = state_manager.add('mystate1')
+        s1 = state_manager.add('mystate2')
+        s2 = state_manager.add('substate', parent=s0)
+        s3 = state_manager.add('subsubstate', parent=s2)
+
+        s2.update(parent=s1)
+        assert state_manager.get('/mystate1/substate') is None
+        assert state_manager.get('/mystate2/substate') == s2
+        assert state_manager.get('/mystate2/substate/subsubstate') == s3
+        assert state_manager.exists('subsubstate', parent=s2) == s3
+
+    def test_get_path_after_delete(self):
+        state_manager = MemoryStateManager(EventManager())
+        s0 = state_manager.add('mystate1')
+        state_manager.delete(s0)
+        assert state_manager.get('/mystate1') is None
+        assert not state_manager.exists('mystate1')
+
+    def test_children_after_reparent_and_delete(self):
+        state_manager = MemoryStateManager(EventManager())
+        s0 = state_manager.add('mystate1')
+        s1 = state_manager.add('mystate2')
+        s2 = state_manager.add('substate_a', parent=s0)
+        s3 = state_manager.add('substate_b', parent=s0)
+
+        s2.update(parent=s1)
+        assert s0.children == [s3]
+        assert s1.children == [s2]
+
+        state_manager.delete(s3)
+        assert s0.children == []
+
+    def test_find_subtree(self):
+        state_manager = MemoryStateManager(EventManager())
+        s0 = state_manager.add('mystate1')
+        s1 = state_manager.add('mystate2')
+        s2 = state_manager.add('substate', parent=s0)
+        s3 = state_manager.add('substate', parent=s1)
+        s4 = state_manager.add('subsubstate', parent=s2)
+        s5 = state_manager.add('other', parent=s0)
+
+        assert state_manager.find('/mystate1/.*') == [s2, s4, s5]
+        assert state_manager.find('/mystate1/sub.*') == [s2, s4]
+        assert state_manager.find('/mystate./substate$') == [s2, s3]
+        assert state_manager.find('/mystate1/substates?') == [s2, s4]
+
+    def test_find_cache_add_delete(self):
+        state_manager = MemoryStateManager(EventManager())
+        s0 = state_manager.add('mystate1')
+        s1 = state_manager.add('substate', parent=s0)
+        assert state_manager.find('.*/substate') == [s1]
+
+        s2 = state_manager.add('mystate2')
+        s3 = state_manager.add('substate', parent=s2)
+        assert state_manager.find('.*/substate') == [s1, s3]
+        assert state_manager.matches('.*/substate', s3)
+
+        state_manager.delete(s1)
+        assert state_manager.find('.*/substate') == [s3]
+        assert not state_manager.matches('.*/substate', s1)
+
+    def test_find_cache_rename(self):
+        state_manager = MemoryStateManager(EventManager())
+        s0 = state_manager.add('mystate1')
+        s1 = state_manager.add('substate', parent=s0)
+        s2 = state_manager.add('mystate2')
+        s3 = state_manager.add('other', parent=s2)
+        assert state_manager.find('.*/substate') == [s1]
+        assert state_manager.find('/mystate1/.*') == [s1]
+
+        s0.update(name='renamed')
+        assert state_manager.find('/mystate1/.*') == []
+        s3.update(name='substate')
+        assert state_manager.find('.*/substate') == [s1, s3]
+        s1.update(name='other')
+        assert state_manager.find('.*/substate') == [s3]
+
+    def test_find_cache_lru(self):
+        state_manager = MemoryStateManager(EventManager())
+        state_manager.FIND_CACHE_SIZE = 2
+        state_manager.add('mystate')
+        state_manager.find('/mystate')
+        state_manager.find('/other')
+        state_manager.find('/mystate')
+        state_manager.find('.*')
+        assert list(state_manager._find_cache.keys()) == ['/mystate', '.*']
+
+    def test_deadband(self):
+        event_manager = DummyEventManager()
+        state_manager = MemoryStateManager(event_manager)
+        s0 = state_manager.add('absolute', config={'deadband': 0.5}, log_key='absolute')
+        s1 = state_manager.add('relative', config={'relative_deadband': 0.1})
+        s0.set_value(10.)
+        s1.set_value(10.)
+
+        event_manager.events = []
+        s0.set_value(10.2)
+        s1.set_value(10.9)
+        assert s0.value == 10.
+        assert s1.value == 10.
+        assert len(event_manager.events) == 0
+        assert len(s0.get_values_log(0.)) == 1
+
+        s0.set_value(10.6)
+        s1.set_value(11.1)
+        assert s0.value == 10.6
+        assert s1.value == 11.1
+        assert len(event_manager.events) == 2
+        assert len(s0.get_values_log(0.)) == 2
+
+    def test_min_max_interval(self):
+        state_manager = MemoryStateManager(DummyEventManager())
+        s0 = state_manager.add('mystate', config={'deadband': 1., 'min_interval': 10., 'max_interval': 60.})
+        with patch('homecon.core.states.state.time') as time:
+            time.time.return_value = 0.
+            s0.set_value(10.)
+            time.time.return_value = 5.
+            s0.set_value(20.)
+            assert s0.value == 10.
+            time.time.return_value = 15.
+            s0.set_value(20.)
+            assert s0.value == 20.
+            time.time.return_value = 30.
+            s0.set_value(20.1)
+            assert s0.value == 20.
+            time.time.return_value = 80.
+            s0.set_value(20.1)
+            assert s0.value == 20.1
+
+    def test_min_interval_trailing_value(self):
+        event_manager = DummyEventManager()
+        state_manager = MemoryStateManager(event_manager)
+        s0 = state_manager.add('mystate', type='bool', value=False, config={'min_interval': 0.05})
+        s0.set_value(True)
+        s0.set_value(False, source='a')
+        s0.set_value(True, source='b')
+        s0.set_value(False, source='c')
+        assert s0.value is True
+
+        # the last value is set once the interval has passed
+        time.sleep(0.2)
+        assert s0.value is False
+        assert event_manager.events[-1].data['new'] is False
+        assert event_manager.events[-1].source == 'c'
+        assert len([event for event in event_manager.events if event.type == 'state_value_changed']) == 2
+
+    def test_set_values(self):
+        event_manager = DummyEventManager()
+        state_manager = MemoryStateManager(event_manager)
+        s0 = state_manager.add('mystate1', log_key='mystate1')
+        s1 = state_manager.add('mystate2', value=1)
+
+        event_manager.events = []
+        state_manager.set_values({s0: 2, s1: 3}, source='test')
+        assert s0.value == 2
+        assert s1.value == 3
+        assert s0.get_values_log(0.)[-1].value == 2
+        assert len(event_manager.events) == 1
+        assert event_manager.events[0].type == 'state_values_changed'
+        assert event_manager.events[0].source == 'test'
+        assert event_manager.events[0].data['changes'] == [
+            {'state': s0, 'old': None, 'new': 2, 'version': 1},
+            {'state': s1, 'old': 1, 'new': 3, 'version': 1}
+        ]
+
+    def test_compare_and_set(self):
+        event_manager = DummyEventManager()
+        state_manager = MemoryStateManager(event_manager)
+        s0 = state_manager.add('mystate1', value=1)
+        assert s0.version == 0
+
+        s0.set_value(2)
+        assert s0.version == 1
+        s0.update(label='My state')
+        assert s0.version == 2
+        assert s0.serialize()['version'] == 2
+
+        assert not s0.compare_and_set(1, 3)
+        assert s0.value == 2
+        assert s0.compare_and_set(2, 3)
+        assert s0.value == 3
+        assert s0.version == 3
+        assert event_manager.events[-1].data['version'] == 3
+
+    def test_compare_and_set_filtered(self):
+        state_manager = MemoryStateManager(DummyEventManager())
+        s0 = state_manager.add('mystate1', value=1., config={'deadband': 1.})
+        assert s0.set_value(3.)
+        assert not s0.compare_and_set(1, 3.5)
+        assert s0.value == 3.
+        assert s0.version == 1
+
+    def test_serialize_cache(self):
+        state_manager = MemoryStateManager(DummyEventManager())
+        parent = state_manager.add('parent')
+        child = state_manager.add('child', parent=parent, value=1)
+
+        assert child.serialize() is child.serialize()
+        child.set_value(2)
+        assert child.serialize()['value'] == 2
+        parent.update(name='renamed')
+        assert child.serialize()['path'] == '/renamed/child'
+
+    def test_state_list(self):
+        state_manager = MemoryStateManager(DummyEventManager())
+        parent = state_manager.add('parent')
+        child = state_manager.add('child', parent=parent, value=1)
+
+        state_list = state_manager.state_list()
+        assert state_list == [parent.serialize(), child.serialize()]
+        assert state_manager.state_list() is state_list
+
+        child.set_value(2)
+        state_list = state_manager.state_list()
+        assert state_list[1]['value'] == 2
+        assert state_list[0] is parent.serialize()
+
+        state_manager.delete(child)
+        assert state_manager.state_list() == [parent.serialize()]
+
+    def test_transaction(self):
+        event_manager = DummyEventManager()
+        state_manager = MemoryStateManager(event_manager)
+        s0 = state_manager.add('mystate1')
+        s1 = state_manager.add('mystate2')
+
+        event_manager.events = []
+        with state_manager.transaction() as values:
+            values[s0] = 2
+            values[s1] = 3
+            assert len(event_manager.events) == 0
+        assert s0.value == 2
+        assert s1.value == 3
+        assert [e.type for e in event_manager.events] == ['state_values_changed']
+
+    def test_concurrent_add_and_find(self):
+        state_manager = MemoryStateManager(DummyEventManager())
+        parent = state_manager.add('parent')
+        state_manager.find('/parent/.*')
+
+        def add_states(thread):
+            for i in range(100):
+                state = state_manager.add(f'state{thread}_{i}', parent=parent)
+                state_manager.find('/parent/.*')
+                if i % 2 == 1:
+                    state_manager.delete(state)
+
+        threads = [Thread(target=add_states, args=(thread,)) for thread in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(state_manager.children(parent)) == 200
+        assert state_manager.find('/parent/.*') == state_manager.children(parent)
+        for state in state_manager.children(parent):
+            assert state_manager.get(state.path) is state
@@ -0,0 +1,150 @@
+import os
+import shutil
+import tempfile
+
+from unittest import TestCase
+
+import numpy as np
+
+from homecon.core.event import EventManager
+from homecon.core.states.memory_state_manager import MemoryStateManager
+from homecon.core.states.value_log import ColumnarValueLog, ValuesRingBuffer
+
+
+class TestColumnarValueLog(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_append_get(self):
+        value_log = ColumnarValueLog(self.folder)
+        for i in range(10):
+            value_log.append('a', float(i), float(i) * 2)
+
+        timeseries = value_log.get('a', 2., until=5.)
+        assert [v.timestamp for v in timeseries] == [2., 3., 4.]
+        assert [v.value for v in timeseries] == [4., 6., 8.]
+
+    def test_get_previous_value(self):
+        value_log = ColumnarValueLog(self.folder, segment_size=3)
+        for i in range(10):
+            value_log.append('a', float(i), i)
+
+        timeseries = value_log.get('a', 5.5)
+        assert [v.timestamp for v in timeseries] == [5., 6., 7., 8., 9.]
+
+        timeseries = value_log.get('a', 5.5, until=6.5)
+        assert [v.timestamp for v in timeseries] == [5., 6.]
+
+        timeseries = value_log.get('a', 20.)
+        assert timeseries == []
+
+    def test_value_types(self):
+        value_log = ColumnarValueLog(self.folder)
+        values = [1.5, 2, True, None, 'on', {'temperature': 20.}]
+        for i, value in enumerate(values):
+            value_log.append('a', float(i), value)
+
+        timeseries = value_log.get('a', 0.)
+        assert [v.value for v in timeseries] == values
+        assert type(timeseries[1].value) == int
+        assert type(timeseries[2].value) == bool
+
+    def test_persistence(self):
+        value_log = ColumnarValueLog(self.folder, segment_size=4)
+        for i in range(10):
+            value_log.append('a', float(i), i)
+
+        value_log = ColumnarValueLog(self.folder, segment_size=4)
+        value_log.append('a', 10., 10)
+        assert [v.value for v in value_log.get('a', 0.)] == list(range(11))
+
+    def test_repair_incomplete_row(self):
+        value_log = ColumnarValueLog(self.folder)
+        for i in range(3):
+            value_log.append('a', float(i), i)
+        value_log.stop()
+        # a crash after the timestamp of a row was written
+        with open(os.path.join(self.folder, 'a', '00000000.timestamps'), 'ab') as f:
+            f.write(np.array([3.], dtype=np.float64).tobytes())
+
+        value_log = ColumnarValueLog(self.folder)
+        value_log.append('a', 4., 4)
+        timeseries = value_log.get('a', 0.)
+        assert [v.timestamp for v in timeseries] == [0., 1., 2., 4.]
+        assert [v.value for v in timeseries] == [0, 1, 2, 4]
+
+    def test_bounded_open_files(self):
+        value_log = ColumnarValueLog(self.folder, max_open_logs=2, max_memmaps=3)
+        for i in range(3):
+            for log_key in ['a', 'b', 'c', 'd']:
+                value_log.append(log_key, float(i), i)
+        assert len(value_log._files) == 2
+
+        for log_key in ['a', 'b', 'c', 'd']:
+            assert [v.value for v in value_log.get(log_key, 0.)] == [0, 1, 2]
+        assert len(value_log._memmaps) == 3
+
+    def test_unsafe_log_key(self):
+        folder = os.path.join(self.folder, 'log')
+        value_log = ColumnarValueLog(folder)
+        value_log.append('../outside', 0., 1)
+        value_log.append('..', 0., 2)
+        assert os.listdir(self.folder) == ['log']
+        assert [v.value for v in value_log.get('../outside', 0.)] == [1]
+        assert [v.value for v in value_log.get('..', 0.)] == [2]
+
+    def test_get_arrays_is_view(self):
+        value_log = ColumnarValueLog(self.folder)
+        for i in range(10):
+            value_log.append('a', float(i), float(i))
+
+        timestamps, values, kinds = value_log.get_arrays('a', 2., until=5.)
+        np.testing.assert_array_equal(values, [2., 3., 4.])
+        assert isinstance(timestamps.base, np.memmap) or isinstance(timestamps, np.memmap)
+
+    def test_state_manager_delegates(self):
+        state_manager = MemoryStateManager(EventManager(), value_log=ColumnarValueLog(self.folder))
+        s = state_manager.add('mystate', value=0, log_key=None)
+        s.set_value(1)
+        s.set_value(2)
+        assert [v.value for v in state_manager.get_state_values_log(s, since=0.)] == [1, 2]
+
+
+class TestValuesRingBuffer(TestCase):
+
+    def test_get(self):
+        buffer = ValuesRingBuffer()
+        for i in range(100):
+            buffer.append(float(i), i)
+
+        assert [v.value for v in buffer.get(10., until=13.)] == [10, 11, 12]
+        assert [v.value for v in buffer.get(10.5, until=13.)] == [10, 11, 12]
+        assert [v.value for v in buffer.get(200.)] == []
+        assert buffer.last().value == 99
+
+    def test_max_count(self):
+        buffer = ValuesRingBuffer(max_count=10)
+        for i in range(25):
+            buffer.append(float(i), i)
+
+        assert len(buffer) == 10
+        assert [v.value for v in buffer.get(0.)] == list(range(15, 25))
+        assert [v.value for v in buffer.get(17.5, until=20.)] == [17, 18, 19]
+
+    def test_max_age(self):
+        buffer = ValuesRingBuffer(max_age=5.)
+        for i in range(25):
+            buffer.append(float(i), i)
+
+        assert [v.value for v in buffer.get(0.)] == list(range(19, 25))
+
+    def test_memory_state_manager_retention(self):
+        state_manager = MemoryStateManager(EventManager(), max_log_count=3)
+        s = state_manager.add('mystate', value=0, log_key=None)
+        for i in range(10):
+            s.set_value(i)
+        assert [v.value for v in state_manager.get_state_values_log(s, since=0.)] == [7, 8, 9]
@@ -0,0 +1,129 @@
+import asyncio
+import time
+
+from threading import Thread
+from unittest import TestCase
+from unittest.mock import Mock
+
+from homecon.core.event import AsyncEventManager, EventManager, EventPriority, NoEventError
+
+
+class TestEventManager(TestCase):
+
+    def test_get_batch(self):
+        event_manager = EventManager()
+        events = [event_manager.fire('test', {'i': i}) for i in range(5)]
+        assert event_manager.get_batch(max_size=3) == events[:3]
+        assert event_manager.get_batch() == events[3:]
+
+    def test_get_batch_timeout(self):
+        event_manager = EventManager(get_timeout=0.01)
+        with self.assertRaises(NoEventError):
+            event_manager.get_batch()
+
+    def test_get_batch_wake_up(self):
+        event_manager = EventManager()
+        batches = []
+        thread = Thread(target=lambda: batches.append(event_manager.get_batch()))
+        thread.start()
+        time.sleep(0.05)
+        event = event_manager.fire('test', {})
+        thread.join(1)
+        assert batches == [[event]]
+
+    def test_interrupt(self):
+        event_manager = EventManager()
+        errors = []
+
+        def get():
+            try:
+                event_manager.get()
+            except NoEventError as e:
+                errors.append(e)
+
+        thread = Thread(target=get)
+        thread.start()
+        event_manager.interrupt()
+        thread.join(1)
+        assert len(errors) == 1
+
+    def test_coalesce(self):
+        event_manager = EventManager(coalesce=True)
+        state1 = Mock(key='1')
+        state2 = Mock(key='2')
+        event1 = event_manager.fire('state_value_changed', {'state': state1, 'old': 0, 'new': 1}, source='a')
+        event2 = event_manager.fire('state_updated', {'state': state1})
+        event_manager.fire('state_value_changed', {'state': state1, 'old': 1, 'new': 2}, source='b')
+        event3 = event_manager.fire('state_value_changed', {'state': state2, 'old': 0, 'new': 1})
+        event_manager.fire('state_value_changed', {'state': state1, 'old': 2, 'new': 3}, source='c')
+
+        assert event_manager.get_batch() == [event1, event2, event3]
+        assert event1.data == {'state': state1, 'old': 0, 'new': 3}
+        assert event1.source == 'c'
+        assert event_manager.fired_count == 5
+        assert event_manager.coalesced_count == 2
+
+        event4 = event_manager.fire('state_value_changed', {'state': state1, 'old': 3, 'new': 4})
+        assert event_manager.get_batch() == [event4]
+
+    def test_priority(self):
+        event_manager = EventManager()
+        event1 = event_manager.fire('pages_pages', {}, reply_to='websocket/client')
+        event2 = event_manager.fire('state_added', {})
+        event3 = event_manager.fire('state_value_changed', {})
+        event4 = event_manager.fire('test', {}, priority=EventPriority.ADMIN)
+        event5 = event_manager.fire('state_updated', {})
+        assert event_manager.get_batch() == [event2, event3, event5, event1, event4]
+
+    def test_starvation(self):
+        event_manager = EventManager(starvation_time=0.01)
+        event1 = event_manager.fire('reply', {})
+        time.sleep(0.02)
+        event2 = event_manager.fire('state_value_changed', {})
+        assert event_manager.get_batch() == [event1, event2]
+
+    def test_statistics(self):
+        event_manager = EventManager()
+        event_manager.fire('state_value_changed', {})
+        event_manager.fire('reply', {})
+        event_manager.get()
+
+        statistics = event_manager.statistics()
+        assert statistics['control']['depth'] == 0
+        assert statistics['control']['taken'] == 1
+        assert statistics['ui']['depth'] == 1
+        assert statistics['ui']['taken'] == 0
+
+
+class TestAsyncEventManager(TestCase):
+
+    def test_get_batch_async(self):
+        event_manager = AsyncEventManager()
+        event1 = event_manager.fire('test', {})
+
+        async def run():
+            event_manager.start()
+            thread = Thread(target=event_manager.fire, args=('test', {}))
+            thread.start()
+            thread.join()
+            await asyncio.sleep(0.01)
+            return await event_manager.get_batch_async()
+
+        events = asyncio.run(run())
+        assert events[0] == event1
+        assert len(events) == 2
+
+    def test_interrupt(self):
+        event_manager = AsyncEventManager()
+
+        async def run():
+            event_manager.start()
+            event_manager.fire('test', {})
+            event_manager.interrupt()
+            await asyncio.sleep(0.01)
+            events = await event_manager.get_batch_async()
+            with self.assertRaises(NoEventError):
+                await event_manager.get_batch_async()
+            return events
+
+        assert len(asyncio.run(run())) == 1
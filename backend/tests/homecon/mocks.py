@@ -5,8 +5,9 @@ class DummyEventManager(IEventManager):
     def __init__(self):
         self.events = []
 
-    def fire(self, type_: str, data: dict, source: str = None, target: str = None, reply_to: str = None):
-        event = Event(self, type_, data, source=source, target=target, reply_to=reply_to)
+    def fire(self, type_: str, data: dict, source: str = None, target: str = None, reply_to: str = None,
+             priority: int = None):
+        event = Event(self, type_, data, source=source, target=target, reply_to=reply_to, priority=priority)
         self.events.append(event)
 
     def get(self):
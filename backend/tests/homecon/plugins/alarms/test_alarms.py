@@ -4,7 +4,8 @@ from homecon.plugins.alarms.alarms import Alarms
 
 
 class DummyEventManager(IEventManager):
-    def fire(self, type_: str, data: dict, source: str = None, target: str = None, reply_to: str = None):
+    def fire(self, type_: str, data: dict, source: str = None, target: str = None, reply_to: str = None,
+             priority: int = None):
         pass
 
     def get(self):
@@ -1,9 +1,10 @@
 import pytest
 
-from unittest.mock import MagicMock
+from unittest.mock import patch
 from dataclasses import asdict
 
 from homecon.core.event import Event
+from homecon.core.states.state import State
 from homecon.core.states.memory_state_manager import MemoryStateManager
 from homecon.core.pages.pages import IPagesManager
 from homecon.plugins.computed.computed import ValueComputer, EvaluationError, Computed, ComputedConfig, StateNotFoundError
@@ -157,26 +158,39 @@ class TestComputed:
     def test_listen_state_value_changed_equal(self):
         event_manager = DummyEventManager()
         state_manager = MemoryStateManager(event_manager)
-        a = state_manager.add('a', config={'computed': asdict(self.test_config)}, value=50)
-        a.set_value = MagicMock()
+        state_manager.add('a', config={'computed': asdict(self.test_config)}, value=50)
         b = state_manager.add('b', value=5)
 
         computed = Computed('computed', event_manager, state_manager, IPagesManager)
-        computed.start()
-        computed.listen_state_value_changed(Event(event_manager, 'state_changed', {'state': b}))
+        with patch.object(State, 'set_value') as set_value:
+            computed.start()
+            computed.listen_state_value_changed(Event(event_manager, 'state_changed', {'state': b}))
 
-        assert not a.set_value.called
+        assert not set_value.called
 
     def test_listen_state_value_changed_not_triggered(self):
         event_manager = DummyEventManager()
         state_manager = MemoryStateManager(event_manager)
-        a = state_manager.add('a', config={'computed': asdict(self.test_config)}, value=1)
-        b = state_manager.add('b', value=5)
+        state_manager.add('a', config={'computed': asdict(self.test_config)}, value=1)
+        state_manager.add('b', value=5)
         c = state_manager.add('c', value=1)
 
         computed = Computed('computed', event_manager, state_manager, IPagesManager)
         computed.start()
 
-        a.set_value = MagicMock()
-        computed.listen_state_value_changed(Event(event_manager, 'state_changed', {'state': c}))
-        assert not a.set_value.called
+        with patch.object(State, 'set_value') as set_value:
+            computed.listen_state_value_changed(Event(event_manager, 'state_changed', {'state': c}))
+        assert not set_value.called
+
+    def test_listen_state_values_changed(self):
+        event_manager = DummyEventManager()
+        state_manager = MemoryStateManager(event_manager)
+        a = state_manager.add('a', config={'computed': asdict(self.test_config)})
+        b = state_manager.add('b', value=1)
+        c = state_manager.add('c', value=1)
+
+        computed = Computed('computed', event_manager, state_manager, IPagesManager)
+        computed.start()
+        state_manager.set_values({b: 5, c: 2})
+        computed.listen_state_values_changed(event_manager.events[-1])
+        assert a.value == 50
@@ -61,3 +61,19 @@ class TestKnx:
         event = Event(event_manager, 'state_changed', data={'state': state})
         knx_plugin.listen_state_value_changed(event)
         assert knx_plugin.connection.writes[0] == {'ga': '1/1/1', 'value': 255, 'dpt': '1'}
+
+    def test_handle_state_values_changed_eval_write(self):
+        event_manager = DummyEventManager()
+        state_manager = MemoryStateManager(event_manager)
+        pages_manager = MemoryPagesManager()
+
+        state_manager._create_state('0', 'test', parent=None, type='float',
+                                    config={Knx.KNX_GA_WRITE: '1/1/1', Knx.KNX_DPT: '1', Knx.KNX_EVAL_WRITE: 'value * 255'})
+
+        knx_plugin = Knx('knx', event_manager, state_manager, pages_manager)
+        knx_plugin.connection = MockKNXDConnection()
+        knx_plugin.start()
+
+        state_manager.set_values({state_manager.get('/test'): 1})
+        knx_plugin.handle_event(event_manager.events[-1])
+        assert knx_plugin.connection.writes[0] == {'ga': '1/1/1', 'value': 255, 'dpt': '1'}
@@ -15,6 +15,24 @@ class TestStates:
         states.listen_state_value(Event(event_manager, 'state_value', {'path': '/a', 'value': 2}, source='test'))
 
         assert event_manager.events[-1].type == 'state_value_changed'
-        assert event_manager.events[-1].data == {'state': a, 'old': 1, 'new': 2}
+        assert event_manager.events[-1].data == {'state': a, 'old': 1, 'new': 2, 'version': 1}
         assert event_manager.events[-1].source == 'test'
         assert a.value == 2
+
+    def test_listen_state_value_version(self):
+        event_manager = DummyEventManager()
+        state_manager = MemoryStateManager(event_manager)
+        states = States('states', event_manager, state_manager, IPagesManager)
+        a = state_manager.add('a', value=1)
+        a.set_value(2)
+
+        states.listen_state_value(Event(event_manager, 'state_value', {'key': a.key, 'value': 3, 'version': 0},
+                                        source='test', reply_to='client'))
+        assert a.value == 2
+        assert event_manager.events[-1].type == 'reply'
+        assert event_manager.events[-1].data == {'event': 'state_value', 'data': {'key': a.key, 'value': 2, 'version': 1}}
+
+        states.listen_state_value(Event(event_manager, 'state_value', {'key': a.key, 'value': 3, 'version': 1},
+                                        source='test'))
+        assert a.value == 3
+        assert a.version == 2
@@ -1,11 +1,18 @@
+import asyncio
+import time
+
+import threading
+
+from threading import Event
 from unittest import TestCase
 
-from homecon.homecon import HomeCon, IExecutor, SyncExecutor
-from homecon.core.event import EventManager
+from homecon.homecon import AsyncHomeCon, HomeCon, IExecutor, KeyedExecutor, SyncExecutor
+from homecon.core.event import AsyncEventManager, EventManager
 from homecon.core.plugins.plugin import BasePlugin, IPluginManager
 from homecon.core.states.state import State
 from homecon.core.states.memory_state_manager import MemoryStateManager
 from homecon.core.pages.pages import MemoryPagesManager
+from homecon.plugins.states.states import States
 
 
 class PluginManager(IPluginManager):
@@ -52,6 +59,68 @@ class MockPlugin(BasePlugin):
             state.value = 1
 
 
+class OtherMockPlugin(BasePlugin):
+    def listen_other(self, event):
+        pass
+
+
+class StartingMockPlugin(OtherMockPlugin):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.started = False
+
+    @property
+    def ready(self) -> bool:
+        return self.started
+
+    @property
+    def subscribed_event_types(self):
+        return super().subscribed_event_types if self.started else set()
+
+
+class AsyncMockPlugin(BasePlugin):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.handled_values = []
+        self.threads = []
+
+    async def listen_state_value_changed(self, event):
+        await asyncio.sleep(0.01 if event.data['new'] == 0 else 0)
+        self.handled_values.append((event.data['state'].key, event.data['new']))
+
+    def listen_other(self, event):
+        self.threads.append(threading.current_thread())
+
+
+class SlowMockPlugin(OtherMockPlugin):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.log = []
+
+    def listen_other(self, event):
+        time.sleep(0.1)
+        self.log.append('handled')
+
+
+class StoppingStateManager(MemoryStateManager):
+    def __init__(self, *args, log=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.log = log
+
+    def stop(self):
+        self.log.append('stopped')
+        super().stop()
+
+
+class RecordingExecutor(IExecutor):
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, *args, **kwargs):
+        self.submitted.append(fn.__self__)
+        fn(*args, **kwargs)
+
+
 class TestHomecon(TestCase):
     def test_homecon(self):
         event_manager = EventManager()
@@ -73,3 +142,157 @@ class TestHomecon(TestCase):
         assert mock_plugin.handled_events[0] == event
         assert mock_plugin.handled_events[1].data['state'] == state2
         assert state2.value == 1
+
+    def test_dispatch_to_subscribed_plugins(self):
+        event_manager = EventManager()
+        state_manager = MemoryStateManager(event_manager)
+        pages_manager = MemoryPagesManager()
+        mock_plugin = MockPlugin('MockPlugin', event_manager, state_manager, pages_manager)
+        other_plugin = OtherMockPlugin('OtherMockPlugin', event_manager, state_manager, pages_manager)
+        plugin_manager = PluginManager({'MockPlugin': mock_plugin, 'OtherMockPlugin': other_plugin})
+        executor = RecordingExecutor()
+
+        hc = HomeCon(event_manager, plugin_manager, executor)
+        state = state_manager.add('test')
+        event_manager.fire('state_value_changed', {'state': state})
+        event_manager.fire('other', {})
+        event_manager.fire('state_values_changed', {'changes': []})
+        for _ in range(4):
+            hc.get_and_handle_event()
+        # state value changes are handled first
+        assert executor.submitted == [mock_plugin, mock_plugin, other_plugin]
+
+    def test_subscriptions_of_starting_plugin(self):
+        event_manager = EventManager()
+        state_manager = MemoryStateManager(event_manager)
+        plugin = StartingMockPlugin('StartingMockPlugin', event_manager, state_manager, MemoryPagesManager())
+        executor = RecordingExecutor()
+
+        hc = HomeCon(event_manager, PluginManager({'StartingMockPlugin': plugin}), executor)
+        event_manager.fire('other', {})
+        hc.get_and_handle_event()
+        plugin.started = True
+        event_manager.fire('other', {})
+        hc.get_and_handle_event()
+        assert executor.submitted == [plugin]
+
+    def test_add_then_set_value(self):
+        event_manager = EventManager()
+        state_manager = MemoryStateManager(event_manager)
+        states = States('states', event_manager, state_manager, MemoryPagesManager())
+        hc = HomeCon(event_manager, PluginManager({'states': states}), SyncExecutor())
+        event_manager.get_batch()
+
+        event_manager.fire('state_add', {'key': 'a', 'name': 'a', 'value': 1}, source='plugin')
+        event_manager.fire('state_value', {'key': 'a', 'value': 2}, source='plugin')
+        hc.handle_events(event_manager.get_batch())
+        assert state_manager.get(key='a').value == 2
+
+    def test_handle_events(self):
+        event_manager = EventManager()
+        state_manager = MemoryStateManager(event_manager)
+        pages_manager = MemoryPagesManager()
+        mock_plugin = MockPlugin('MockPlugin', event_manager, state_manager, pages_manager)
+        other_plugin = OtherMockPlugin('OtherMockPlugin', event_manager, state_manager, pages_manager)
+        plugin_manager = PluginManager({'MockPlugin': mock_plugin, 'OtherMockPlugin': other_plugin})
+        executor = RecordingExecutor()
+
+        hc = HomeCon(event_manager, plugin_manager, executor)
+        state1 = State(state_manager, event_manager, '2', 'test1')
+        state2 = State(state_manager, event_manager, '3', 'test2')
+        event1 = event_manager.fire('state_value_changed', {'state': state1})
+        event_manager.fire('other', {})
+        event2 = event_manager.fire('state_value_changed', {'state': state2})
+        hc.get_and_handle_events()
+        # the events of every state are submitted separately
+        assert executor.submitted == [mock_plugin, mock_plugin, other_plugin]
+        assert mock_plugin.handled_events == [event1, event2]
+
+
+    def test_stop_state_manager_last(self):
+        event_manager = EventManager()
+        plugin = SlowMockPlugin('SlowMockPlugin', event_manager, MemoryStateManager(event_manager),
+                                MemoryPagesManager())
+        state_manager = StoppingStateManager(event_manager, log=plugin.log)
+        hc = HomeCon(event_manager, PluginManager({'SlowMockPlugin': plugin}), KeyedExecutor(max_workers=2),
+                     state_manager=state_manager)
+        event_manager.fire('other', {})
+        hc.get_and_handle_event()
+        hc.stop()
+        assert plugin.log == ['handled', 'stopped']
+
+
+class TestAsyncHomecon(TestCase):
+    def test_handle_events(self):
+        event_manager = AsyncEventManager()
+        state_manager = MemoryStateManager(event_manager)
+        plugin = AsyncMockPlugin('AsyncMockPlugin', event_manager, state_manager, MemoryPagesManager())
+        hc = AsyncHomeCon(event_manager, PluginManager({'AsyncMockPlugin': plugin}))
+        state1 = State(state_manager, event_manager, '1', 'test1')
+        state2 = State(state_manager, event_manager, '2', 'test2')
+
+        event_manager.fire('state_value_changed', {'state': state1, 'new': 0})
+        event_manager.fire('state_value_changed', {'state': state2, 'new': 0})
+        event_manager.fire('state_value_changed', {'state': state1, 'new': 1})
+        event_manager.fire('other', {})
+
+        async def run():
+            run_task = asyncio.create_task(hc.run_async())
+            await asyncio.sleep(0.1)
+            hc.stop()
+            await run_task
+
+        asyncio.run(run())
+        # the events of a state are handled in order
+        assert plugin.handled_values.index(('1', 0)) < plugin.handled_values.index(('1', 1))
+        assert len(plugin.handled_values) == 3
+        # blocking listeners are not run in the asyncio loop
+        assert len(plugin.threads) == 1
+        assert plugin.threads[0] is not threading.main_thread()
+
+
+class TestKeyedExecutor(TestCase):
+    def test_order_per_key(self):
+        executor = KeyedExecutor(max_workers=4)
+        results = {'a': [], 'b': []}
+
+        def append(key, i):
+            time.sleep(0.001 * (i % 3))
+            results[key].append(i)
+
+        for i in range(20):
+            executor.submit_keyed('a', append, 'a', i)
+            executor.submit_keyed('b', append, 'b', i)
+        executor.shutdown()
+        assert results == {'a': list(range(20)), 'b': list(range(20))}
+
+        statistics = executor.statistics()
+        assert statistics['submitted'] == 40
+        assert statistics['completed'] == 40
+        assert statistics['pending'] == 0
+
+    def test_parallel_keys(self):
+        executor = KeyedExecutor(max_workers=2)
+        started = Event()
+        release = Event()
+
+        def block():
+            started.set()
+            release.wait(1)
+
+        executor.submit_keyed('a', block)
+        started.wait(1)
+        done = Event()
+        executor.submit_keyed('b', done.set)
+        assert done.wait(1)
+        release.set()
+        executor.shutdown()
+
+    def test_bounded_partition(self):
+        executor = KeyedExecutor(max_workers=1, max_partition_size=2)
+        executor.submit_keyed('a', time.sleep, 0.05)
+        executor.submit_keyed('a', lambda: None)
+        # blocks until the first function is done
+        executor.submit_keyed('a', lambda: None)
+        executor.shutdown()
+        assert executor.statistics()['blocked'] == 1
@@ -173,8 +173,10 @@ class HomeconWebsocket {
           if(states === undefined || states[message.data.key] === undefined){
             console.info(`no state with id ${message.data.key}`)
           }
-          else{
+          else if(message.data.version === undefined || states[message.data.key].version === undefined ||
+                  states[message.data.key].version < message.data.version){
             states[message.data.key].value = message.data.value;
+            states[message.data.key].version = message.data.version;
           }
 
           this.app.setState({
@@ -182,6 +184,25 @@ class HomeconWebsocket {
           });
         }
 
+        else if(message.event === 'state_values'){
+
+          var states = {...this.app.state.states}
+          message.data.value.forEach((item, index) => {
+            if(states === undefined || states[item.key] === undefined){
+              console.info(`no state with id ${item.key}`)
+            }
+            else if(item.version === undefined || states[item.key].version === undefined ||
+                    states[item.key].version < item.version){
+              states[item.key].value = item.value;
+              states[item.key].version = item.version;
+            }
+          });
+
+          this.app.setState({
+            states: states
+          });
+        }
+
         else if(message.event === 'state_timeseries'){
           var states = {...this.app.state.states}
           if(states === undefined || states[message.data.key] === undefined){
@@ -51,7 +51,8 @@ function HomeconSwitch(props){
   const classes = useStyles();
 
   const handleClick = (event) => {
-    ws.send({event: 'state_value', data: {key: state.key, value: state.value > valueThreshold ? valueOff : valueOn}})
+    // the version makes sure the state is only toggled when it was not changed in the meantime
+    ws.send({event: 'state_value', data: {key: state.key, value: state.value > valueThreshold ? valueOff : valueOn, version: state.version}})
   }
 
   return (